@@ -1,5 +1,8 @@
 """
 ASGI config for MediCart project.
+
+Serve this application (e.g. `uvicorn medicart.asgi:application`) to hold
+long-poll and event-stream connections to /api/changes/ without a thread each.
 """
 
 import os
@@ -32,6 +32,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pharmacy.middleware.MetricsMiddleware',
+    'pharmacy.middleware.CompressionMiddleware',
+    'pharmacy.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,11 +46,15 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'medicart.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -55,6 +62,10 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Production compiles each template once per process
+            'loaders': TEMPLATE_LOADERS if DEBUG else [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+            ],
         },
     },
 ]
@@ -70,6 +81,51 @@ DATABASES = {
     }
 }
 
+# Archived orders (see pharmacy/management/commands/archive_orders.py).
+# Set ORDER_ARCHIVE_DB_PATH to keep them in a separate SQLite file; create
+# its table with: python manage.py migrate --database archive
+if os.environ.get('ORDER_ARCHIVE_DB_PATH'):
+    DATABASES['archive'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['ORDER_ARCHIVE_DB_PATH'],
+    }
+
+ORDER_ARCHIVE = {
+    'DATABASE': 'archive' if 'archive' in DATABASES else 'default',
+    # Closed orders older than this are moved to the archive
+    'AFTER_DAYS': int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', '180')),
+    'STATUSES': ['Delivered', 'Cancelled'],
+}
+
+DATABASE_ROUTERS = ['pharmacy.routers.ArchiveRouter']
+
+
+# Cache
+# Versions used for cross-process invalidation live in the default cache, so
+# multi-worker deployments should point this at a shared backend
+# (e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache). With
+# DEBUG off, the pharmacy.W001 system check warns about a process-local one.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Per-process cache of hot Medicine rows used by order validation
+STOCK_CACHE = {
+    'MAX_SIZE': int(os.environ.get('STOCK_CACHE_MAX_SIZE', '256')),
+    'TTL': float(os.environ.get('STOCK_CACHE_TTL', '5')),
+}
+
+# Sharded stock for medicines too hot for a single row (see pharmacy.models.StockShard)
+STOCK_SHARDS = {
+    # Shards created by shard_stock unless --shards is given
+    'COUNT': int(os.environ.get('STOCK_SHARDS_COUNT', '8')),
+    # Seconds between folds when compact_stock runs with --loop
+    'COMPACT_INTERVAL': float(os.environ.get('STOCK_SHARDS_COMPACT_INTERVAL', '5')),
+}
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -101,6 +157,21 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Production serves content-hashed file names (style.<hash>.css) written by
+# collectstatic, so the web server can cache /static/ with far-future expiry.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
+        ),
+    },
+}
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -108,7 +179,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'pharmacy.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
@@ -119,6 +190,111 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'pharmacy.utils.custom_exception_handler',
 }
 
+# Seconds a COUNT(*) behind "Page X of Y" is reused (see pharmacy/pagination.py)
+PAGINATION_COUNT_CACHE_TIMEOUT = int(os.environ.get('PAGINATION_COUNT_CACHE_TIMEOUT', '60'))
+
+# Order list filters (see pharmacy/filters.py)
+ORDER_FILTERS = {
+    # A customer_name prefix matching up to this many customers is searched
+    # through order_customer_date_idx, one customer at a time
+    'MAX_PREFIX_CUSTOMERS': int(os.environ.get('ORDER_FILTERS_MAX_PREFIX_CUSTOMERS', '100')),
+    # From this many orders on, a broader prefix also needs a status, medicine
+    # or date filter; on its own it would be checked against every order
+    'GUARD_MIN_ROWS': int(os.environ.get('ORDER_FILTERS_GUARD_MIN_ROWS', '10000')),
+}
+
+# Inventory valuation at /api/reports/inventory/ and from the inventory_report
+# command (see pharmacy/reports.py)
+REPORTS = {
+    # Stock expiring within this many days counts as value at risk
+    'NEAR_EXPIRY_DAYS': int(os.environ.get('REPORTS_NEAR_EXPIRY_DAYS', '30')),
+    # Seconds a valuation is kept; any catalog change replaces it sooner
+    'CACHE_TIMEOUT': int(os.environ.get('REPORTS_CACHE_TIMEOUT', '3600')),
+    # Medicines read per database round trip while streaming a breakdown
+    'BREAKDOWN_CHUNK_SIZE': int(os.environ.get('REPORTS_BREAKDOWN_CHUNK_SIZE', '2000')),
+    # Bytes of a breakdown kept in memory before it is spooled to disk
+    'BREAKDOWN_SPOOL_SIZE': int(os.environ.get('REPORTS_BREAKDOWN_SPOOL_SIZE', str(1024 * 1024))),
+}
+
+# Change feed at /api/changes/ (see pharmacy/feeds.py). Long-poll and
+# Server-Sent Events only hold a connection cheaply under ASGI (medicart.asgi).
+CHANGES_FEED = {
+    # Entries returned per response or streamed per database read
+    'PAGE_SIZE': int(os.environ.get('CHANGES_FEED_PAGE_SIZE', '500')),
+    # Longest ?wait= a long-poll request may ask for, in seconds
+    'MAX_WAIT': 30,
+    # Seconds between checks for new entries while waiting
+    'POLL_INTERVAL': float(os.environ.get('CHANGES_FEED_POLL_INTERVAL', '1.0')),
+    # An event stream ends after this long; EventSource reconnects with Last-Event-ID
+    'STREAM_SECONDS': 300,
+    # Seconds between keep-alive comments on an idle event stream
+    'HEARTBEAT': 15,
+    # Entries older than this are removed by prune_changes
+    'RETENTION_DAYS': int(os.environ.get('CHANGES_FEED_RETENTION_DAYS', '7')),
+}
+
+# Response compression (see pharmacy/middleware.py). Brotli is used when
+# the optional `brotli` package is installed and the client accepts it.
+COMPRESSION = {
+    'MIN_SIZE': int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    'BROTLI_QUALITY': int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4')),
+    'CONTENT_TYPES': [
+        'application/json',
+        'text/html',
+        'text/css',
+        'text/javascript',
+        'application/javascript',
+    ],
+}
+
+# Admission control for write endpoints (see pharmacy/throttling.py)
+# RATES are per client and endpoint scope: '<burst>/<second|minute|hour|day>'.
+WRITE_ADMISSION = {
+    'RATES': {
+        'orders': os.environ.get('ORDER_WRITE_RATE', '50/second'),
+        'medicines': os.environ.get('MEDICINE_WRITE_RATE', '20/second'),
+    },
+    'MAX_CONCURRENT_WRITES': int(os.environ.get('MAX_CONCURRENT_WRITES', '16')),
+    'RETRY_AFTER': 1,
+}
+
+# Metrics exposed at /metrics (see pharmacy/metrics.py)
+# Set PROMETHEUS_MULTIPROC_DIR to a shared directory when running several
+# worker processes so /metrics reports the sum across all of them.
+METRICS = {
+    'MULTIPROCESS_DIR': os.environ.get('PROMETHEUS_MULTIPROC_DIR', ''),
+    'FLUSH_INTERVAL': float(os.environ.get('METRICS_FLUSH_INTERVAL', '1')),
+    # Gauges from snapshots not rewritten for this long are left out
+    'STALE_AFTER': float(os.environ.get('METRICS_STALE_AFTER', '60')),
+}
+
+# Request profiling (see pharmacy/profiling.py). Off unless a sample rate or
+# a token for the X-Profile request header is set; staff read the results
+# at /api/profiles/.
+PROFILING = {
+    # Share of requests profiled, e.g. 0.01
+    'SAMPLE_RATE': float(os.environ.get('PROFILING_SAMPLE_RATE', '0')),
+    # Requests sending "X-Profile: <token>" are always profiled
+    'TOKEN': os.environ.get('PROFILING_TOKEN', ''),
+    # Seconds between stack samples
+    'INTERVAL': float(os.environ.get('PROFILING_INTERVAL', '0.001')),
+    # Directory for collapsed-stack (.folded) files; empty keeps samples in memory only
+    'OUTPUT_DIR': os.environ.get('PROFILING_OUTPUT_DIR', ''),
+    # Distinct stacks kept per route name
+    'MAX_STACKS': 10000,
+}
+
+# API error logging (see pharmacy/utils.py)
+# Client errors (4xx) are logged as sampled one-line events without
+# tracebacks; unexpected errors keep tracebacks, deduplicated per signature.
+ERROR_LOGGING = {
+    'CLIENT_ERROR_SAMPLE_RATE': float(
+        os.environ.get('CLIENT_ERROR_SAMPLE_RATE', '1.0' if DEBUG else '0.1')
+    ),
+    'DEDUP_WINDOW': int(os.environ.get('ERROR_DEDUP_WINDOW', '60')),
+    'MAX_TRACEBACKS_PER_MINUTE': int(os.environ.get('MAX_TRACEBACKS_PER_MINUTE', '10')),
+}
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -138,6 +314,8 @@ LOGGING = {
             'level': 'INFO',
             'class': 'logging.FileHandler',
             'filename': BASE_DIR / 'medicart.log',
+            # Open the file on the first record, not while configuring logging
+            'delay': True,
             'formatter': 'verbose',
         },
         'console': {
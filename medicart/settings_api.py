@@ -0,0 +1,50 @@
+"""
+Lean settings for processes that only serve the JSON API.
+
+    DJANGO_SETTINGS_MODULE=medicart.settings_api gunicorn medicart.wsgi
+
+Serves /api/, /api/changes/, /api/profiles/ and /metrics. The admin, HTML pages, sessions,
+flash messages and the browsable API are left out, so a worker imports
+and sets up less before its first request and recycled workers come back
+sooner. API clients authenticate with HTTP Basic auth. Compare with the
+full profile using `python manage.py benchmark startup`.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK, TEMPLATES
+
+ROOT_URLCONF = 'medicart.urls_api'
+
+UNUSED_APPS = {
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+}
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in UNUSED_APPS]
+
+UNUSED_MIDDLEWARE = {
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+}
+MIDDLEWARE = [name for name in MIDDLEWARE if name not in UNUSED_MIDDLEWARE]
+
+TEMPLATES = [{
+    **TEMPLATES[0],
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'context_processors': [
+            'django.template.context_processors.request',
+        ],
+    },
+}]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    # The browsable API needs templates, sessions and CSRF
+    'DEFAULT_RENDERER_CLASSES': ['pharmacy.renderers.FastJSONRenderer'],
+    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework.authentication.BasicAuthentication'],
+}
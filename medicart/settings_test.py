@@ -0,0 +1,58 @@
+"""
+Django settings for running the MediCart test suite.
+
+Used by pytest (see pytest.ini) and by:
+    python manage.py test --settings=medicart.settings_test --parallel auto
+"""
+
+from .settings import *  # noqa: F401,F403
+
+# In-memory database; each parallel test worker gets its own copy
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+# Password hashing dominates user fixtures with the production hashers
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# Each test process keeps its own versions
+SILENCED_SYSTEM_CHECKS = ['pharmacy.W001']
+
+METRICS = {
+    'MULTIPROCESS_DIR': '',
+    'FLUSH_INTERVAL': 1,
+    'STALE_AFTER': 60,
+}
+
+# Tests assert on log records with assertLogs; nothing needs to reach a file
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'null': {
+            'class': 'logging.NullHandler',
+        },
+    },
+    'loggers': {
+        'pharmacy': {
+            'handlers': ['null'],
+            'level': 'DEBUG',
+            'propagate': False,
+        },
+        'django': {
+            'handlers': ['null'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,8 @@
+"""
+URL configuration for API-only processes (see medicart.settings_api).
+"""
+from django.urls import path, include
+
+urlpatterns = [
+    path('', include('pharmacy.api_urls')),
+]
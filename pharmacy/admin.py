@@ -1,26 +1,206 @@
 """
 Admin configuration for pharmacy app.
+
+Changelists are tuned for large tables: totals are estimated instead of
+counted on every page load, search is by indexed name prefix, and related
+medicines are joined or picked through autocomplete rather than loaded
+per row or as a full <select>.
 """
-from django.contrib import admin
-from .models import Medicine, Order
+from django.contrib import admin, messages
+from django.db.models import Q
+from .cache import bump_version_on_commit, PRICES_VERSION
+from .models import (
+    ChangeLogEntry, Customer, Medicine, Order, OrderArchive, ExpirySweepLog, PriceList, PriceListItem
+)
+from .pagination import EstimatedCountPaginator
+
+# Medicines matched by name before filtering orders by medicine id
+MAX_SEARCH_MEDICINES = 100
+
+
+class PrefixSearchMixin:
+    """
+    Match the whole search term as a case-insensitive prefix of the
+    '^'-marked search_fields, instead of splitting it into words that each
+    must match. "Vitamin C" finds "Vitamin C 500mg" and can use an index
+    (see PrefixSearchIndex).
+    """
+
+    def get_search_condition(self, request, term):
+        condition = Q()
+        for field in self.get_search_fields(request):
+            if field.startswith('^'):
+                condition |= Q(**{f'{field[1:]}__istartswith': term})
+        return condition
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(self.get_search_condition(request, term)), False
 
 
 @admin.register(Medicine)
-class MedicineAdmin(admin.ModelAdmin):
+class MedicineAdmin(PrefixSearchMixin, admin.ModelAdmin):
     """Admin interface for Medicine model."""
-    list_display = ['name', 'price', 'stock', 'expiry_date', 'is_in_stock']
-    list_filter = ['expiry_date', 'created_at']
-    search_fields = ['name', 'description']
+    list_display = ['name', 'price', 'stock', 'expiry_date', 'is_expired', 'in_stock']
+    list_filter = ['is_expired', 'expiry_date', 'created_at']
+    # Prefix search uses the case-insensitive name index
+    search_fields = ['^name']
     ordering = ['name']
-    readonly_fields = ['created_at', 'updated_at']
+    # Sharding is changed with the shard_stock command, which moves the stock
+    readonly_fields = ['stock_shards', 'created_at', 'updated_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @admin.display(boolean=True, description='In stock', ordering='stock')
+    def in_stock(self, obj):
+        return obj.stock > 0
+
+
+@admin.register(Customer)
+class CustomerAdmin(PrefixSearchMixin, admin.ModelAdmin):
+    """Admin interface for Customer model."""
+    list_display = ['name', 'created_at']
+    search_fields = ['^name']
+    ordering = ['name']
+    readonly_fields = ['name_key', 'created_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_condition(self, request, term):
+        # A range on the normalized key is a prefix seek on its unique index
+        key = Customer.normalize_name(term)
+        return Q(name_key__gte=key, name_key__lt=key + '\U0010ffff')
+
+
+class PriceListItemInline(admin.TabularInline):
+    """Tiers of a price list, one row per medicine and minimum quantity."""
+    model = PriceListItem
+    autocomplete_fields = ['medicine']
+    extra = 1
+
+
+@admin.register(PriceList)
+class PriceListAdmin(admin.ModelAdmin):
+    """Admin interface for effective-dated price lists."""
+    list_display = ['name', 'effective_from', 'effective_until', 'created_at']
+    list_filter = ['effective_from']
+    search_fields = ['name']
+    inlines = [PriceListItemInline]
+
+    def delete_queryset(self, request, queryset):
+        # Bulk deletes skip PriceList.delete()
+        super().delete_queryset(request, queryset)
+        bump_version_on_commit(PRICES_VERSION)
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(PrefixSearchMixin, admin.ModelAdmin):
     """Admin interface for Order model."""
     list_display = ['id', 'customer_name', 'medicine', 'quantity', 'status', 'order_date', 'total_price']
+    list_select_related = ['medicine']
     list_filter = ['status', 'order_date']
-    search_fields = ['customer_name', 'medicine__name']
-    ordering = ['-order_date']
-    readonly_fields = ['order_date', 'total_price']
+    search_fields = ['^customer_name']
+    search_help_text = 'Search by the start of the customer or medicine name.'
+    autocomplete_fields = ['medicine']
+    # Matches the (order_date, id) index used for keyset pagination
+    ordering = ['-order_date', '-id']
+    readonly_fields = ['customer', 'order_date', 'unit_price', 'total_price']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['mark_processing', 'mark_shipped', 'mark_delivered', 'mark_cancelled']
+
+    def get_readonly_fields(self, request, obj=None):
+        # Status changes go through the transition actions, which restock cancellations
+        if obj is not None:
+            return [*self.readonly_fields, 'status']
+        return self.readonly_fields
+
+    def _transition(self, request, queryset, new_status):
+        ids = list(queryset.values_list('id', flat=True))
+        results = Order.bulk_transition(ids, new_status)
+        updated = sum(1 for result, _ in results.values() if result == 'updated')
+        invalid = sum(1 for result, _ in results.values() if result == 'invalid')
+        self.message_user(request, f'{updated} orders marked {new_status}.', messages.SUCCESS)
+        if invalid:
+            self.message_user(
+                request, f'{invalid} orders cannot move to {new_status} and were skipped.', messages.WARNING
+            )
+
+    @admin.action(description='Mark selected orders as Processing')
+    def mark_processing(self, request, queryset):
+        self._transition(request, queryset, 'Processing')
+
+    @admin.action(description='Mark selected orders as Shipped')
+    def mark_shipped(self, request, queryset):
+        self._transition(request, queryset, 'Shipped')
+
+    @admin.action(description='Mark selected orders as Delivered')
+    def mark_delivered(self, request, queryset):
+        self._transition(request, queryset, 'Delivered')
+
+    @admin.action(description='Cancel selected orders and restock')
+    def mark_cancelled(self, request, queryset):
+        self._transition(request, queryset, 'Cancelled')
+
+    def get_search_condition(self, request, term):
+        """
+        Also match orders by medicine name prefix. Matching medicines are
+        looked up first, so the order query filters on the indexed
+        medicine_id column instead of joining every order to its medicine.
+        """
+        condition = super().get_search_condition(request, term)
+        medicine_ids = list(
+            Medicine.objects.filter(name__istartswith=term)
+            .values_list('id', flat=True)[:MAX_SEARCH_MEDICINES]
+        )
+        if medicine_ids:
+            condition |= Q(medicine_id__in=medicine_ids)
+        return condition
+
+
+@admin.register(OrderArchive)
+class OrderArchiveAdmin(PrefixSearchMixin, admin.ModelAdmin):
+    """Read-only admin interface for archived orders."""
+    list_display = ['id', 'customer_name', 'medicine', 'quantity', 'status', 'order_date', 'archived_at']
+    list_filter = ['status']
+    search_fields = ['^customer_name']
+    ordering = ['-order_date', '-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # The archive may be in another database, so medicines cannot be joined
+        return super().get_queryset(request).prefetch_related('medicine')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ExpirySweepLog)
+class ExpirySweepLogAdmin(admin.ModelAdmin):
+    """Read-only admin interface for expiry sweep audit records."""
+    list_display = ['run_id', 'first_medicine_id', 'last_medicine_id', 'scanned', 'flagged', 'swept_at']
+    list_filter = ['swept_at']
+    search_fields = ['run_id']
+    readonly_fields = ['run_id', 'first_medicine_id', 'last_medicine_id', 'scanned', 'flagged', 'swept_at']
+
+
+@admin.register(ChangeLogEntry)
+class ChangeLogEntryAdmin(admin.ModelAdmin):
+    """Read-only admin interface for the change feed."""
+    list_display = ['seq', 'entity', 'entity_id', 'action', 'created_at']
+    list_filter = ['entity', 'action']
+    ordering = ['-seq']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
 
+    def has_change_permission(self, request, obj=None):
+        return False
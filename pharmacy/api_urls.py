@@ -0,0 +1,24 @@
+"""
+API URL configuration for pharmacy app: the REST API, the change feed,
+reports and metrics. Included by pharmacy.urls, and on its own by the lean
+API settings profile (medicart.settings_api), which serves no HTML pages.
+"""
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from . import feeds, views
+
+# API Router
+router = DefaultRouter()
+router.register(r'medicines', views.MedicineViewSet, basename='medicine')
+router.register(r'orders', views.OrderViewSet, basename='order')
+router.register(r'customers', views.CustomerViewSet, basename='customer')
+
+urlpatterns = [
+    path('api/changes/', feeds.changes_feed, name='changes'),
+    path('api/', include(router.urls)),
+    path('api/reports/inventory/', views.inventory_report_view, name='inventory-report'),
+
+    # Monitoring
+    path('metrics', views.metrics_view, name='metrics'),
+    path('api/profiles/', views.profiles_view, name='profiles'),
+]
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class PharmacyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pharmacy'
+    
+    def ready(self):
+        from . import checks  # noqa: F401 (registers the system checks)
 
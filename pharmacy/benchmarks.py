@@ -0,0 +1,412 @@
+"""
+Benchmarks for the MediCart pharmacy application.
+Run with: python manage.py benchmark <name>
+
+Each benchmark is registered with @benchmark and receives the management
+command (for output) and its parsed options. Benchmarks that write data do
+so inside a transaction that is rolled back.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import quote_plus
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, transaction
+from django.template.loader import render_to_string
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from .models import Customer, Medicine, Order, StockShard
+from .pagination import KeysetPaginator
+from .serializers import OrderSerializer
+from .startup import measure
+from .streaming import Subscription
+from . import middleware, renderers
+import asyncio
+import statistics
+import threading
+import time
+import tracemalloc
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark function under `name`."""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def timed(func, iterations):
+    """Run `func` repeatedly and return the mean duration in milliseconds."""
+    func()  # Warm up loaders and caches
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def cpu_timed(func, iterations):
+    """Like timed(), but measures process CPU time."""
+    func()
+    start = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - start) * 1000 / iterations
+
+
+def report(command, title, rows, headers):
+    """Write rows as an aligned table."""
+    widths = [
+        max(len(str(header)), *(len(str(row[i])) for row in rows)) if rows else len(str(header))
+        for i, header in enumerate(headers)
+    ]
+    command.stdout.write(command.style.SUCCESS(title))
+    command.stdout.write('  '.join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        command.stdout.write('  '.join(str(c).ljust(w) for c, w in zip(row, widths)))
+
+
+def _request(path):
+    request = RequestFactory().get(path)
+    request.user = AnonymousUser()
+    request._messages = CookieStorage(request)
+    return request
+
+
+@benchmark('templates')
+def template_render(command, options):
+    """Mean render time per template, excluding database access."""
+    iterations = options['iterations']
+    medicines = KeysetPaginator(Medicine.objects.all(), 10, ['name']).get_page({})
+    orders = KeysetPaginator(
+        Order.objects.select_related('medicine'), 10, ['-order_date', '-id']
+    ).get_page({})
+    medicine = medicines[0] if medicines else None
+    order = orders[0] if orders else None
+
+    cases = [
+        ('pharmacy/home.html', '/', {
+            'medicine_count': 0, 'order_count': 0,
+            'low_stock_count': 0, 'pending_orders': 0,
+        }),
+        ('pharmacy/medicine_list.html', '/medicines/', {'medicines': medicines}),
+        ('pharmacy/order_list.html', '/orders/', {
+            'orders': orders,
+            'status_choices': Order.STATUS_CHOICES,
+            'filters': {},
+        }),
+        ('pharmacy/order_place.html', '/orders/place/', {'medicines': list(medicines)}),
+        ('pharmacy/medicine_add.html', '/medicines/add/', {}),
+    ]
+    if order is not None:
+        cases.append(('pharmacy/order_detail.html', f'/orders/{order.pk}/', {'order': order}))
+    if medicine is not None:
+        cases.append(('pharmacy/medicine_edit.html', f'/medicines/{medicine.pk}/edit/', {
+            'medicine': medicine,
+            'expiry_date': medicine.expiry_date.strftime('%Y-%m-%d'),
+        }))
+
+    rows = []
+    for template_name, path, context in cases:
+        request = _request(path)
+        mean_ms = timed(lambda: render_to_string(template_name, context, request=request), iterations)
+        size = len(render_to_string(template_name, context, request=request).encode())
+        rows.append((template_name, f'{mean_ms:.3f}', size))
+
+    report(
+        command,
+        f'Template render time ({iterations} iterations)',
+        rows,
+        ['template', 'ms/render', 'bytes'],
+    )
+
+
+@benchmark('admin')
+def admin_changelists(command, options):
+    """Admin changelist, search and autocomplete load time and query count."""
+    iterations = options['iterations']
+    medicine = Medicine.objects.order_by('id').first()
+    order = Order.objects.order_by('id').first()
+    prefix = quote_plus(medicine.name[:6] if medicine else 'a')
+    customer = quote_plus(order.customer_name if order else 'a')
+    order_list = reverse('admin:pharmacy_order_changelist')
+    cases = [
+        ('orders', order_list),
+        ('orders, page 50', f'{order_list}?p=50'),
+        ('orders, status filter', f'{order_list}?status__exact=Pending'),
+        ('orders, customer search', f'{order_list}?q={customer}'),
+        ('orders, medicine search', f'{order_list}?q={prefix}'),
+        ('medicines', reverse('admin:pharmacy_medicine_changelist')),
+        ('medicines, search', f'{reverse("admin:pharmacy_medicine_changelist")}?q={prefix}'),
+        ('medicine autocomplete', (
+            f'{reverse("admin:autocomplete")}?term={prefix}'
+            '&app_label=pharmacy&model_name=order&field_name=medicine'
+        )),
+    ]
+
+    rows = []
+    # The admin user and its session are rolled back afterwards
+    with transaction.atomic():
+        user = get_user_model().objects.create_superuser('benchmark-admin', password=None)
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        client.force_login(user)
+        for name, url in cases:
+            mean_ms = timed(lambda: client.get(url), iterations)
+            with CaptureQueriesContext(connection) as queries:
+                status = client.get(url).status_code
+            rows.append((name, f'{mean_ms:.2f}', len(queries), status))
+        transaction.set_rollback(True)
+
+    report(
+        command,
+        f'Admin changelists, {Order.objects.count()} orders ({iterations} iterations)',
+        rows,
+        ['view', 'ms/request', 'queries', 'status'],
+    )
+
+
+def _order_payload(count):
+    """Serialized data for `count` in-memory orders, as /api/orders/ returns it."""
+    medicines = [
+        Medicine(
+            id=i, name=f'Medicine {i} 500mg', price=Decimal('12.50') + i,
+            stock=100, expiry_date=timezone.now().date()
+        )
+        for i in range(1, 51)
+    ]
+    now = timezone.now()
+    orders = []
+    for i in range(1, count + 1):
+        medicine = medicines[i % len(medicines)]
+        quantity = i % 7 + 1
+        orders.append(Order(
+            id=i, customer_name=f'Customer {i % 997}', medicine=medicine,
+            quantity=quantity, order_date=now - timedelta(minutes=i),
+            status=Order.STATUS_CHOICES[i % len(Order.STATUS_CHOICES)][0],
+            total_price=medicine.price * quantity,
+        ))
+    return OrderSerializer(orders, many=True).data
+
+
+@benchmark('renderers')
+def renderer_encode(command, options):
+    """JSON encode and compression cost per 10k orders (bytes, CPU ms)."""
+    iterations = options['iterations']
+    data = _order_payload(10_000)
+
+    encoders = [('JSONRenderer', JSONRenderer().render)]
+    fast = renderers.FastJSONRenderer()
+    if renderers.orjson is not None:
+        encoders.append(('FastJSONRenderer (orjson)', fast.render))
+    fast_stdlib = renderers.FastJSONRenderer()
+    fast_stdlib.ensure_ascii = True  # Forces the stdlib path
+    encoders.append(('FastJSONRenderer (stdlib)', fast_stdlib.render))
+
+    rows = []
+    for name, render in encoders:
+        cpu_ms = cpu_timed(lambda: render(data), iterations)
+        rows.append((name, f'{cpu_ms:.2f}', len(render(data))))
+    report(command, f'JSON encoding, 10k orders ({iterations} iterations)', rows,
+           ['renderer', 'cpu ms', 'bytes'])
+
+    body = fast.render(data)
+    codecs = [
+        ('identity', lambda: body),
+        ('gzip', lambda: compress_string(body, max_random_bytes=100)),
+    ]
+    if middleware.brotli is not None:
+        codecs.append(('br', lambda: middleware.brotli.compress(body, quality=4)))
+
+    rows = []
+    for name, compress in codecs:
+        cpu_ms = cpu_timed(compress, iterations)
+        size = len(compress())
+        rows.append((name, f'{cpu_ms:.2f}', size, f'{size / len(body):.1%}'))
+    command.stdout.write('')
+    report(command, f'Compression, 10k orders ({iterations} iterations)', rows,
+           ['encoding', 'cpu ms', 'bytes', 'ratio'])
+
+
+@benchmark('streams')
+def stream_fanout(command, options):
+    """Memory per idle stock subscriber and time to fan one change out to all."""
+    async def measure(count):
+        tracemalloc.start()
+        subscriptions = [Subscription([1]) for _ in range(count)]
+        waiters = [asyncio.ensure_future(s.wait(60)) for s in subscriptions]
+        await asyncio.sleep(0)  # Let every waiter block on its event
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        row = {'id': 1, 'stock': 41, 'price': Decimal('9.99'), 'is_expired': False, 'version': 7}
+        start = time.perf_counter()
+        for subscription in subscriptions:
+            subscription.push(row)
+        await asyncio.gather(*waiters)
+        return memory / count, (time.perf_counter() - start) * 1000
+
+    rows = []
+    for count in (1_000, 10_000, 50_000):
+        per_subscriber, fanout_ms = asyncio.run(measure(count))
+        rows.append((count, f'{per_subscriber / 1024:.1f}', f'{fanout_ms:.1f}'))
+    report(command, 'Stock stream subscribers (excluding the HTTP connection)', rows,
+           ['subscribers', 'KiB each', 'fan-out ms'])
+
+
+def _place_orders(medicine_id, customer, count, failures):
+    """Place `count` single-unit orders from this thread on its own connection."""
+    try:
+        medicine = Medicine.objects.get(pk=medicine_id)
+        for _ in range(count):
+            try:
+                Order(customer_name=customer.name, customer=customer, medicine=medicine, quantity=1).save()
+            except (ValidationError, DatabaseError):
+                failures.append(1)
+    finally:
+        connection.close()
+
+
+@benchmark('contention')
+def stock_contention(command, options):
+    """Orders/sec for one hot medicine, single stock row versus sharded."""
+    per_thread = options['iterations']
+    shard_count = settings.STOCK_SHARDS['COUNT']
+    # Threads need committed rows, so this benchmark cleans up after itself
+    # instead of rolling back
+    customer = Customer.for_name('Contention benchmark')
+    expiry_date = timezone.now().date() + timedelta(days=365)
+
+    rows = []
+    for shards in (0, shard_count):
+        for threads in (1, 4, 16):
+            medicine = Medicine.objects.create(
+                name=f'Contention benchmark {shards}x{threads}', description='',
+                price=Decimal('1.00'), stock=threads * per_thread, expiry_date=expiry_date
+            )
+            try:
+                if shards:
+                    medicine.set_stock_shards(shards)
+                failures = []
+                workers = [
+                    threading.Thread(target=_place_orders, args=(medicine.pk, customer, per_thread, failures))
+                    for _ in range(threads)
+                ]
+                start = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+
+                placed = Order.objects.filter(medicine=medicine).count()
+                exact = StockShard.exact_stock(medicine.pk) if shards else (
+                    Medicine.objects.values_list('stock', flat=True).get(pk=medicine.pk)
+                )
+                rows.append((
+                    f'{shards} shards' if shards else 'single row', threads,
+                    f'{placed / elapsed:.0f}', len(failures),
+                    'yes' if exact == threads * per_thread - placed else 'NO',
+                ))
+            finally:
+                Order.objects.filter(medicine=medicine).delete()
+                Medicine.objects.filter(pk=medicine.pk).delete()
+    Customer.objects.filter(pk=customer.pk, orders__isnull=True).delete()
+
+    report(
+        command,
+        f'Concurrent orders for one medicine on {connection.vendor} ({per_thread} orders per thread)',
+        rows,
+        ['stock', 'threads', 'orders/sec', 'failed', 'stock exact'],
+    )
+
+
+@benchmark('startup')
+def startup_time(command, options):
+    """Time from a fresh interpreter to the first API response, per settings profile."""
+    runs = max(1, min(options['iterations'], 10))
+    rows = []
+    for settings_module in ('medicart.settings', 'medicart.settings_api'):
+        results = [measure(settings_module)[0] for _ in range(runs)]
+        rows.append((
+            settings_module,
+            *(f'{statistics.median(r[key] for r in results):.0f}'
+              for key in ('setup_ms', 'urls_ms', 'request_ms', 'total_ms')),
+            results[0]['modules'],
+            results[0]['status'],
+        ))
+    report(
+        command,
+        f'Time to first request, median of {runs} fresh processes (ms)',
+        rows,
+        ['settings', 'setup', 'urls', 'request', 'total', 'modules', 'status'],
+    )
+
+
+@benchmark('catalog')
+def catalog_queries(command, options):
+    """Storefront medicine queries on a large catalog, filtered by the API versus in Python."""
+    iterations = max(1, options['iterations'] // 10)
+    size = 20000
+    today = timezone.now().date()
+    after = today + timedelta(days=180)
+    cases = [
+        ('in stock, under $20, expiring after +180d',
+         {'is_in_stock': 'true', 'price_max': '20', 'expires_after': after.isoformat()},
+         lambda m: m['stock'] > 0 and Decimal(m['price']) <= 20 and m['expiry_date'] > after.isoformat()),
+        ('$10-$15 by price descending',
+         {'price_min': '10', 'price_max': '15', 'ordering': '-price'},
+         lambda m: 10 <= Decimal(m['price']) <= 15),
+        ('sold out', {'is_in_stock': 'false'}, lambda m: m['stock'] == 0),
+        ('expiring within 30 days',
+         {'expires_before': (today + timedelta(days=30)).isoformat()},
+         lambda m: m['expiry_date'] < (today + timedelta(days=30)).isoformat()),
+    ]
+
+    rows = []
+    # The catalog is rolled back afterwards
+    with transaction.atomic():
+        Medicine.objects.bulk_create([
+            Medicine(
+                name=f'Catalog benchmark {i:05d}', description='', price=Decimal(i % 5000) / 100 + 1,
+                stock=0 if i % 25 == 0 else i % 300, expiry_date=today + timedelta(days=i % 730)
+            )
+            for i in range(size)
+        ], batch_size=1000)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE pharmacy_medicine')
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0], HTTP_ACCEPT='application/json')
+        url = reverse('medicine-list')
+        everything_ms = timed(lambda: client.get(url).json(), max(1, iterations // 5))
+        everything = client.get(url).json()
+
+        for name, params, keep in cases:
+            filtered_ms = timed(lambda: client.get(url, params), iterations)
+            with CaptureQueriesContext(connection) as queries:
+                matched = len(client.get(url, params).json())
+            plan = ''
+            if connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {queries[0]["sql"]}')
+                    plan = cursor.fetchall()[0][-1]
+            python_ms = timed(lambda: [m for m in everything if keep(m)], iterations)
+            rows.append((
+                name, matched, f'{filtered_ms:.2f}', f'{everything_ms + python_ms:.2f}', plan,
+            ))
+        transaction.set_rollback(True)
+
+    report(
+        command,
+        f'Medicine API queries on a {size}-medicine catalog ({iterations} iterations, ms)',
+        rows,
+        ['query', 'rows', 'API filter', 'list all + Python', 'plan'],
+    )
@@ -0,0 +1,164 @@
+"""
+Caching helpers for the pharmacy application.
+"""
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from . import metrics
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY_PREFIX = 'pharmacy:version:'
+
+# Table versions, bumped on every committed write to the table
+MEDICINES_VERSION = 'medicines'
+ORDERS_VERSION = 'orders'
+# Bumped when price lists change; see pharmacy.pricing
+PRICES_VERSION = 'prices'
+
+
+def get_version(name):
+    """Return the current version number for a named resource."""
+    key = VERSION_KEY_PREFIX + name
+    version = cache.get(key)
+    if version is None:
+        # Start from a random value so a cache restart never reuses old versions
+        cache.add(key, random.getrandbits(48), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_version(name):
+    """
+    Increment the version number for a named resource.
+    Every process comparing against this version sees the change, provided
+    the default cache backend is shared between them.
+    """
+    key = VERSION_KEY_PREFIX + name
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Key missing or evicted; restart from a value no process has seen
+        version = random.getrandbits(48)
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def bump_version_on_commit(*names):
+    """Bump table versions once the current transaction commits."""
+    def bump():
+        for name in names:
+            bump_version(name)
+    transaction.on_commit(bump)
+
+
+CachedStock = namedtuple('CachedStock', ['price', 'stock', 'version', 'shards'])
+
+
+class StockCache:
+    """
+    Per-process LRU cache of hot Medicine rows (price, stock, version, shard count).
+
+    Entries expire after a TTL and the whole cache is dropped whenever the
+    shared 'stock_cache' version changes. Stock deductions are written
+    through, so a cached stock value is never lower than the database
+    value unless stock was added since it was read; every path that adds
+    stock bumps the version.
+    """
+
+    VERSION_NAME = 'stock_cache'
+
+    def __init__(self, max_size=None, ttl=None):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self):
+        if self._max_size is not None:
+            return self._max_size
+        return settings.STOCK_CACHE['MAX_SIZE']
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return settings.STOCK_CACHE['TTL']
+
+    def _check_version(self):
+        """Drop every entry if another process invalidated the cache."""
+        version = get_version(self.VERSION_NAME)
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, medicine_id):
+        """Return the cached row for a medicine, or None on a miss."""
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(medicine_id)
+            if entry is None or entry[1] < time.monotonic():
+                self._entries.pop(medicine_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(medicine_id)
+            self.hits += 1
+            return entry[0]
+
+    def store(self, medicine):
+        """Cache a freshly read Medicine instance."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._check_version()
+            self._entries[medicine.pk] = (
+                CachedStock(medicine.price, medicine.stock, medicine.version, medicine.stock_shards),
+                time.monotonic() + self.ttl,
+            )
+            self._entries.move_to_end(medicine.pk)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def deduct(self, medicine_id, quantity):
+        """Write a successful stock deduction through to the cached row."""
+        with self._lock:
+            entry = self._entries.get(medicine_id)
+            if entry is None:
+                return
+            cached, expires_at = entry
+            self._entries[medicine_id] = (
+                cached._replace(
+                    stock=max(cached.stock - quantity, 0),
+                    version=cached.version + 1
+                ),
+                expires_at,
+            )
+
+    def invalidate(self):
+        """Invalidate the cache in every process."""
+        bump_version(self.VERSION_NAME)
+
+    def clear(self):
+        """Drop all entries held by this process."""
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+
+stock_cache = StockCache()
+
+metrics.register_collector(
+    'pharmacy_stock_cache_requests_total',
+    'counter',
+    'Hot-SKU stock cache lookups by result.',
+    lambda: [({'result': 'hit'}, stock_cache.hits), ({'result': 'miss'}, stock_cache.misses)],
+)
@@ -0,0 +1,32 @@
+"""
+System checks for the pharmacy application.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose entries are not seen by other worker processes
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Warn when a deployment keeps table versions in a process-local cache.
+
+    Cross-process invalidation (pharmacy.cache versions) and the ETags
+    derived from them only work when every worker reads the same cache;
+    otherwise one worker can answer 304 from a version another has moved on.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.DEBUG or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'The default cache ({backend}) is local to each process.',
+        hint='Table versions, ETags and cached reports go stale across workers. Set CACHE_BACKEND '
+             'to a shared backend, e.g. django.core.cache.backends.redis.RedisCache, '
+             'or silence pharmacy.W001 for a single-process deployment.',
+        id='pharmacy.W001',
+    )]
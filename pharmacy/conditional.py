@@ -0,0 +1,124 @@
+"""
+Conditional GET support for template pages and the API.
+
+Validators are derived before any rendering: from table version counters
+(see cache.get_version) for lists, and from a single-row read of
+updated_at/version columns for detail views. Unchanged resources are
+answered with 304 Not Modified.
+"""
+from functools import wraps
+from django.contrib.messages import get_messages
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+from .cache import get_version
+import logging
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def version_etag(*names):
+    """Build an ETag value from the current versions of the named tables."""
+    return '-'.join(f'{name}.{get_version(name)}' for name in names)
+
+
+def _has_pending_messages(request):
+    """Pages carrying flash messages must be rendered so the messages are shown."""
+    return len(get_messages(request)) > 0
+
+
+def _finalize(response, etag, last_modified, private):
+    if response.status_code in (200, 304):
+        if etag and not response.has_header('ETag'):
+            response['ETag'] = etag
+        if last_modified and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        if private:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+
+def conditional_page(validators):
+    """
+    Decorator for template views. `validators(request, *args, **kwargs)`
+    returns (etag, last_modified); an etag of None skips conditional handling.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in SAFE_METHODS or _has_pending_messages(request):
+                return view_func(request, *args, **kwargs)
+
+            etag, last_modified = validators(request, *args, **kwargs)
+            if etag is None:
+                return view_func(request, *args, **kwargs)
+            etag = quote_etag(etag)
+
+            response = get_conditional_response(
+                request, etag=etag,
+                last_modified=last_modified and int(last_modified.timestamp())
+            )
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+            # Pages include per-session content such as messages
+            patch_vary_headers(response, ['Cookie'])
+            return _finalize(response, etag, last_modified, private=True)
+        return wrapper
+    return decorator
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin answering list and retrieve requests with 304 when the
+    client already holds the current representation.
+
+    Subclasses set `list_versions` (table versions the list depends on) and
+    implement `get_object_validators(pk)` returning (etag, last_modified).
+    The negotiated media type is part of the ETag and responses vary on
+    Accept, so JSON and browsable API representations are cached apart.
+    """
+    list_versions = ()
+
+    def get_object_validators(self, pk):
+        return None, None
+
+    def _conditional(self, request, etag, last_modified, render):
+        if etag is None or request.method not in SAFE_METHODS:
+            return render()
+
+        media_type = getattr(request, 'accepted_media_type', '') or ''
+        browsable = media_type.startswith('text/html')
+        if browsable:
+            # The browsable API shows the current user
+            etag = f'{etag}-user.{request.user.pk or 0}'
+        etag = quote_etag(f'{etag}-{media_type.split(";")[0]}')
+
+        response = get_conditional_response(
+            request, etag=etag,
+            last_modified=last_modified and int(last_modified.timestamp())
+        )
+        if response is None:
+            response = render()
+        patch_vary_headers(response, ['Accept', 'Cookie'] if browsable else ['Accept'])
+        return _finalize(response, etag, last_modified, private=browsable)
+
+    def list(self, request, *args, **kwargs):
+        etag = version_etag(*self.list_versions) if self.list_versions else None
+        return self._conditional(
+            request, etag, None,
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, last_modified = self.get_object_validators(kwargs.get('pk'))
+        return self._conditional(
+            request, etag, last_modified,
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
@@ -0,0 +1,187 @@
+"""
+Streaming endpoints: the change feed for downstream consumers
+(GET /api/changes/?since=<seq>) and live stock for the order form
+(GET /medicines/stock-stream/?ids=1,2).
+
+Returns ChangeLogEntry rows after `since` as JSON. With ?wait=<seconds> the
+request is held open until an entry arrives (long-poll). Clients sending
+Accept: text/event-stream receive Server-Sent Events instead, resuming from
+the Last-Event-ID header when they reconnect.
+
+The views are async so that, served by the ASGI application in
+medicart/asgi.py, waiting clients cost a coroutine rather than a thread.
+Under WSGI long-poll still works but holds a worker, and event streams
+fall back to a single response that the client polls again.
+"""
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from .models import ChangeLogEntry
+from .streaming import broadcaster, current_rows
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Medicines one stock stream may watch
+MAX_STREAM_MEDICINES = 100
+# Reconnect delay for the one-shot stock response served under WSGI
+WSGI_RETRY_MS = 30000
+
+
+def _config():
+    return settings.CHANGES_FEED
+
+
+async def fetch_changes(since, limit):
+    """Return up to `limit` entries with seq greater than `since`."""
+    entries = ChangeLogEntry.objects.filter(seq__gt=since).order_by('seq')[:limit]
+    return [entry.as_dict() async for entry in entries]
+
+
+async def _is_pruned(since):
+    """Whether entries following `since` have already been pruned."""
+    if since <= 0:
+        return False
+    oldest = await ChangeLogEntry.objects.order_by('seq').values_list('seq', flat=True).afirst()
+    return oldest is not None and oldest > since + 1
+
+
+def _parse_since(request):
+    value = request.GET.get('since') or request.headers.get('Last-Event-ID') or '0'
+    since = int(value)
+    if since < 0:
+        raise ValueError(value)
+    return since
+
+
+def _error(message, status):
+    return JsonResponse({'detail': message}, status=status)
+
+
+async def changes_feed(request):
+    """
+    GET /api/changes/?since=<seq>[&limit=N][&wait=seconds]
+
+    Responds with {"changes": [...], "last_seq": N, "has_more": bool}.
+    Pass the returned last_seq as the next `since`.
+    """
+    # require_GET does not wrap async views before Django 5.0
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    config = _config()
+    try:
+        since = _parse_since(request)
+        limit = min(int(request.GET.get('limit', config['PAGE_SIZE'])), config['PAGE_SIZE'])
+        wait = min(float(request.GET.get('wait', 0)), config['MAX_WAIT'])
+    except ValueError:
+        return _error('since, limit and wait must be non-negative numbers.', 400)
+    if limit < 1:
+        return _error('limit must be at least 1.', 400)
+
+    if await _is_pruned(since):
+        # The consumer missed entries for good and must resynchronize
+        return _error(f'Changes after {since} are no longer retained.', 410)
+
+    if 'text/event-stream' in request.headers.get('Accept', '') and isinstance(request, ASGIRequest):
+        logger.info(f"Streaming changes after {since}")
+        return _event_stream_response(_event_stream(since))
+
+    changes = await fetch_changes(since, limit)
+    deadline = time.monotonic() + wait
+    while not changes and time.monotonic() < deadline:
+        await asyncio.sleep(min(config['POLL_INTERVAL'], max(deadline - time.monotonic(), 0)))
+        changes = await fetch_changes(since, limit)
+
+    return JsonResponse({
+        'changes': changes,
+        'last_seq': changes[-1]['seq'] if changes else since,
+        'has_more': len(changes) == limit,
+    })
+
+
+async def stock_stream(request):
+    """
+    GET /medicines/stock-stream/?ids=1,2,3
+
+    Server-Sent Events with the current stock of each medicine, then an
+    event whenever it changes. Changes come from the process-wide
+    broadcaster, so an open stream costs no database queries of its own.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    try:
+        medicine_ids = {int(value) for value in request.GET.get('ids', '').split(',') if value}
+    except ValueError:
+        return _error('ids must be a comma-separated list of medicine ids.', 400)
+    if not medicine_ids or len(medicine_ids) > MAX_STREAM_MEDICINES:
+        return _error(f'Watch between 1 and {MAX_STREAM_MEDICINES} medicines.', 400)
+
+    if not isinstance(request, ASGIRequest):
+        # No cheap way to hold the connection, send a snapshot and let the
+        # client reconnect later
+        events = [f'retry: {WSGI_RETRY_MS}\n\n']
+        events += [format_event('stock', row) for row in await current_rows(medicine_ids)]
+        response = HttpResponse(''.join(events), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+    return _event_stream_response(_stock_events(medicine_ids))
+
+
+def _event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def format_event(event, data, event_id=None):
+    """Encode one Server-Sent Event."""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, cls=DjangoJSONEncoder)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def _event_stream(since):
+    """Yield change events after `since` until STREAM_SECONDS have passed."""
+    config = _config()
+    started = last_sent = time.monotonic()
+    yield f'retry: {int(config["POLL_INTERVAL"] * 1000)}\n\n'
+    while time.monotonic() - started < config['STREAM_SECONDS']:
+        changes = await fetch_changes(since, config['PAGE_SIZE'])
+        for change in changes:
+            yield format_event('change', change, change['seq'])
+        if changes:
+            since = changes[-1]['seq']
+            last_sent = time.monotonic()
+            if len(changes) == config['PAGE_SIZE']:
+                continue
+        elif time.monotonic() - last_sent >= config['HEARTBEAT']:
+            yield ': keep-alive\n\n'
+            last_sent = time.monotonic()
+        await asyncio.sleep(config['POLL_INTERVAL'])
+
+
+async def _stock_events(medicine_ids):
+    """Yield the current stock, then changes, until STREAM_SECONDS have passed."""
+    config = _config()
+    # Subscribe before reading the snapshot so no change falls in between
+    subscription = await broadcaster.subscribe(medicine_ids)
+    try:
+        yield f'retry: {int(config["POLL_INTERVAL"] * 1000)}\n\n'
+        for row in await current_rows(medicine_ids):
+            yield format_event('stock', row)
+        deadline = time.monotonic() + config['STREAM_SECONDS']
+        while (remaining := deadline - time.monotonic()) > 0:
+            rows = await subscription.wait(min(config['HEARTBEAT'], remaining))
+            for row in rows:
+                yield format_event('stock', row)
+            if not rows:
+                yield ': keep-alive\n\n'
+    finally:
+        broadcaster.unsubscribe(subscription)
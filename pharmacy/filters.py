@@ -0,0 +1,272 @@
+"""
+Filtering and ordering for the API list endpoints and the order list page.
+
+Query parameters are validated by a ListFilter and compiled into range
+conditions on indexed columns, so a filtered list is an index seek rather
+than a pass over the whole table. Anything a ListFilter does not know how
+to serve is rejected with a 400: an unknown parameter would otherwise be
+ignored and quietly return, and scan, every row.
+"""
+from django.conf import settings
+from django.db.models import Q
+from rest_framework import serializers
+from .models import Customer, Order
+from .pagination import estimate_count
+
+
+class ListFilter(serializers.Serializer):
+    """
+    Validated filter and ordering parameters for one list endpoint.
+
+    Subclasses declare a serializer field per parameter and
+    - LOOKUPS: parameter -> ORM lookup it filters with
+    - RANGES: column -> (lower, upper) parameters, which must not be inverted
+    - ORDERINGS: `ordering` value -> order_by() fields; '-<value>' reverses.
+      Without ORDERINGS there is no `ordering` parameter and the caller
+      orders the list.
+    A `filter_<parameter>(value)` method returning a Q object takes the
+    place of a LOOKUPS entry.
+
+    A range can only be served by an index that also gives the order, so
+    when columns are range-filtered the list is ordered by one of them,
+    the first in RANGES unless `ordering` names another. Ordering by any
+    other column is rejected: the database would walk that column's index
+    and test every row against the range.
+    """
+
+    LOOKUPS = {}
+    RANGES = {}
+    ORDERINGS = {}
+    # Parameters handled elsewhere, such as DRF's format override
+    PASSTHROUGH = {'format'}
+
+    def __init__(self, params):
+        unknown = sorted(set(params) - set(self.get_fields()) - self.PASSTHROUGH)
+        repeated = sorted(name for name in params if len(params.getlist(name)) > 1)
+        self._param_errors = {
+            **{name: ['Unknown filter.'] for name in unknown},
+            **{name: ['Give this filter once.'] for name in repeated},
+        }
+        # Blank fields of a submitted filter form are not filters
+        super().__init__(data={
+            name: params.get(name) for name in params
+            if name not in self.PASSTHROUGH and params.get(name) != ''
+        })
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.ORDERINGS:
+            fields['ordering'] = serializers.ChoiceField(
+                choices=[f'{prefix}{name}' for name in self.ORDERINGS for prefix in ('', '-')],
+                required=False
+            )
+        return fields
+
+    def is_valid(self, raise_exception=False):
+        if self._param_errors:
+            self._validated_data = {}
+            self._errors = self._param_errors
+            if raise_exception:
+                raise serializers.ValidationError(self.errors)
+            return False
+        return super().is_valid(raise_exception=raise_exception)
+
+    def range_columns(self, data):
+        """The columns `data` filters by range, in RANGES order."""
+        return [
+            column for column, bounds in self.RANGES.items()
+            if any(data.get(bound) is not None for bound in bounds)
+        ]
+
+    def validate(self, data):
+        for lower, upper in self.RANGES.values():
+            if data.get(lower) is not None and data.get(upper) is not None and data[lower] > data[upper]:
+                raise serializers.ValidationError({upper: [f'Must not be below {lower}.']})
+
+        columns = self.range_columns(data)
+        if columns and self.ORDERINGS:
+            ordering = data.get('ordering')
+            if ordering is None:
+                data['ordering'] = columns[0]
+            elif ordering.lstrip('-') not in columns:
+                raise serializers.ValidationError({'ordering': [
+                    f"Cannot be combined with a range on {', '.join(columns)}; order by "
+                    f"{' or '.join(columns)}."
+                ]})
+        return data
+
+    def apply(self, queryset):
+        """Filter and order `queryset` by the validated parameters."""
+        conditions = Q()
+        for name, value in self.validated_data.items():
+            if name == 'ordering':
+                continue
+            method = getattr(self, f'filter_{name}', None)
+            conditions &= method(value) if method else Q(**{self.LOOKUPS[name]: value})
+        queryset = queryset.filter(conditions)
+
+        ordering = self.validated_data.get('ordering')
+        if ordering:
+            descending = ordering.startswith('-')
+            fields = self.ORDERINGS[ordering.lstrip('-')]
+            queryset = queryset.order_by(*(f'-{field}' if descending else field for field in fields))
+        return queryset
+
+
+class MedicineFilter(ListFilter):
+    """
+    /api/medicines/ filters. Price, stock and expiry date each have an
+    index (medicine_price_idx, medicine_stock_idx, medicine_expiry_idx)
+    ending in id, which serves both the range and the ordering with its
+    tie-breaker.
+
+    is_in_stock=true is not treated as a range: most of the catalog is in
+    stock, so walking any ordering's index and skipping sold-out rows reads
+    little more than the result. is_in_stock=false is a range on stock.
+    """
+
+    price_min = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    price_max = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    stock_min = serializers.IntegerField(min_value=0, required=False)
+    stock_max = serializers.IntegerField(min_value=0, required=False)
+    expires_after = serializers.DateField(required=False)
+    expires_before = serializers.DateField(required=False)
+    is_in_stock = serializers.BooleanField(required=False)
+
+    LOOKUPS = {
+        'price_min': 'price__gte',
+        'price_max': 'price__lte',
+        'stock_min': 'stock__gte',
+        'stock_max': 'stock__lte',
+        'expires_after': 'expiry_date__gt',
+        'expires_before': 'expiry_date__lt',
+    }
+    RANGES = {
+        'price': ('price_min', 'price_max'),
+        'expiry_date': ('expires_after', 'expires_before'),
+        'stock': ('stock_min', 'stock_max'),
+    }
+    ORDERINGS = {
+        'name': ('name',),
+        'price': ('price', 'id'),
+        'stock': ('stock', 'id'),
+        'expiry_date': ('expiry_date', 'id'),
+    }
+
+    def range_columns(self, data):
+        columns = super().range_columns(data)
+        if data.get('is_in_stock') is False and 'stock' not in columns:
+            columns.append('stock')
+        return columns
+
+    def validate(self, data):
+        # Combinations that can only match nothing are most likely mistakes
+        if data.get('is_in_stock') is True and data.get('stock_max') == 0:
+            raise serializers.ValidationError({'stock_max': ['Must be above 0 with is_in_stock=true.']})
+        if data.get('is_in_stock') is False and data.get('stock_min'):
+            raise serializers.ValidationError({'stock_min': ['Must be 0 with is_in_stock=false.']})
+        return super().validate(data)
+
+    def filter_is_in_stock(self, value):
+        # Both directions are ranges on the stock index; NOT (stock > 0) is not
+        return Q(stock__gt=0) if value else Q(stock__lte=0)
+
+
+def prefix_end(prefix):
+    """The smallest string above every string starting with `prefix`."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class OrderFilter(ListFilter):
+    """
+    /api/orders/ and /orders/ filters. Lists stay in keyset pagination
+    order (newest first): status, medicine and customer each lead an index
+    ending in (order_date, id), and order_date_id_idx serves a date range,
+    so any one of them finds the matching orders already in that order.
+
+    A customer_name prefix is first looked up in the Customer.name_key
+    index. Up to ORDER_FILTERS['MAX_PREFIX_CUSTOMERS'] matches are searched
+    one customer at a time; a broader prefix can only be tested order by
+    order, which is refused on a table of ORDER_FILTERS['GUARD_MIN_ROWS']
+    orders or more unless a status, medicine or date filter narrows it.
+    """
+
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+    medicine = serializers.IntegerField(min_value=1, required=False)
+    customer_name = serializers.CharField(max_length=200, required=False)
+    placed_from = serializers.DateTimeField(required=False)
+    placed_before = serializers.DateTimeField(required=False)
+    # API only; the archive is indexed by date alone, so only ARCHIVE_FILTERS apply
+    include_archived = serializers.BooleanField(required=False)
+
+    LOOKUPS = {
+        'status': 'status',
+        'medicine': 'medicine_id',
+        'placed_from': 'order_date__gte',
+        'placed_before': 'order_date__lt',
+    }
+    RANGES = {
+        'order_date': ('placed_from', 'placed_before'),
+    }
+    # Filters other than customer_name that seek an index on their own
+    NARROWING = {'status', 'medicine', 'placed_from', 'placed_before'}
+    # Filters served on archived orders by walking archive_date_id_idx
+    ARCHIVE_FILTERS = {'status', 'placed_from', 'placed_before'}
+    # Keyset pagination parameters
+    PASSTHROUGH = ListFilter.PASSTHROUGH | {'page', 'after', 'before', 'last'}
+
+    customer_ids = None
+
+    def validate_customer_name(self, value):
+        key = Customer.normalize_name(value)
+        if not key:
+            raise serializers.ValidationError('Enter the start of a customer name.')
+        return key
+
+    def validate(self, data):
+        data = super().validate(data)
+        if data.get('include_archived') and data.keys() - {'include_archived'} - self.ARCHIVE_FILTERS:
+            raise serializers.ValidationError({'include_archived': [
+                'Archived orders can only be filtered by status and date.'
+            ]})
+        key = data.get('customer_name')
+        if key is None:
+            return data
+
+        limit = settings.ORDER_FILTERS['MAX_PREFIX_CUSTOMERS']
+        ids = list(
+            Customer.objects.filter(name_key__gte=key, name_key__lt=prefix_end(key))
+            .values_list('id', flat=True)[:limit + 1]
+        )
+        if len(ids) <= limit:
+            self.customer_ids = ids
+        elif (
+            not self.NARROWING & data.keys()
+            and estimate_count(Order.objects.all()) >= settings.ORDER_FILTERS['GUARD_MIN_ROWS']
+        ):
+            raise serializers.ValidationError({'customer_name': [
+                f'Matches more than {limit} customers. Enter more of the name, '
+                'or also filter by status, medicine or date.'
+            ]})
+        return data
+
+    def filter_include_archived(self, value):
+        return Q()
+
+    def filter_customer_name(self, key):
+        if self.customer_ids is not None:
+            return Q(customer_id__in=self.customer_ids)
+        return Q(customer__name_key__gte=key, customer__name_key__lt=prefix_end(key))
+
+    def apply(self, queryset):
+        return super().apply(queryset).order_by('-order_date', '-id')
+
+    def apply_archive(self, queryset):
+        """Filter an OrderArchive queryset by the validated status and dates."""
+        data = self.validated_data
+        if data.get('status') and data['status'] not in settings.ORDER_ARCHIVE['STATUSES']:
+            # Only closed orders are archived; don't walk the archive to find none
+            return queryset.none()
+        return queryset.filter(**{
+            self.LOOKUPS[name]: value for name, value in data.items() if name in self.ARCHIVE_FILTERS
+        })
@@ -0,0 +1,118 @@
+"""
+Management command to move closed orders into the archive table.
+Usage: python manage.py archive_orders [--days 180] [--chunk-size 1000] [--sleep 0.1]
+
+Delivered and cancelled orders (ORDER_ARCHIVE['STATUSES']) older than
+--days are copied to OrderArchive and deleted from Order, one chunk at a
+time in primary-key order. The change feed records each move as a deletion
+with {"archived": true}. The archive insert commits before the delete, and
+re-inserting an already archived id is ignored, so a run interrupted between
+the two steps is completed by simply running the command again.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from pharmacy.cache import bump_version_on_commit, ORDERS_VERSION
+from pharmacy.models import ChangeLogEntry, Order, OrderArchive
+from pharmacy.routers import archive_database
+
+
+class Command(BaseCommand):
+    help = 'Move closed orders older than a cutoff into the order archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Archive closed orders older than this many days '
+                 '(default: ORDER_ARCHIVE["AFTER_DAYS"])'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of orders moved per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between chunks to throttle write load'
+        )
+        parser.add_argument(
+            '--max-chunks',
+            type=int,
+            default=None,
+            help='Stop after this many chunks (run again to continue)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many orders would be archived'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        days = options['days'] if options['days'] is not None else settings.ORDER_ARCHIVE['AFTER_DAYS']
+        if days < 0:
+            raise CommandError('--days must not be negative')
+
+        cutoff = timezone.now() - timedelta(days=days)
+        candidates = Order.objects.filter(
+            status__in=settings.ORDER_ARCHIVE['STATUSES'],
+            order_date__lt=cutoff,
+        )
+        if options['dry_run']:
+            self.stdout.write(f'{candidates.count()} orders older than {cutoff:%Y-%m-%d} would be archived')
+            return
+
+        archive_db = archive_database()
+        self.stdout.write(f'Archiving closed orders older than {cutoff:%Y-%m-%d} to database "{archive_db}"')
+
+        chunks = 0
+        total = 0
+        last_id = 0
+        while options['max_chunks'] is None or chunks < options['max_chunks']:
+            rows = list(
+                candidates.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values(*OrderArchive.ORDER_FIELDS)[:chunk_size]
+            )
+            if not rows:
+                break
+            ids = [row['id'] for row in rows]
+
+            # Commit the copy first: a failure before the delete leaves
+            # duplicates that the next run ignores, never lost orders
+            with transaction.atomic(using=archive_db):
+                OrderArchive.objects.using(archive_db).bulk_create(
+                    [OrderArchive(**row) for row in rows], ignore_conflicts=True
+                )
+            with transaction.atomic():
+                # Only orders still in the hot table leave it
+                moved = list(
+                    Order.objects.filter(pk__in=ids).select_for_update().values_list('pk', flat=True)
+                )
+                Order.objects.filter(pk__in=moved).delete()
+                # Change feed consumers see the order leave the hot table
+                ChangeLogEntry.record(*(('order', pk, 'deleted', {'archived': True}) for pk in moved))
+                bump_version_on_commit(ORDERS_VERSION)
+
+            chunks += 1
+            total += len(ids)
+            last_id = ids[-1]
+            self.stdout.write(f'Chunk {chunks}: orders #{ids[0]}-#{ids[-1]}, {len(ids)} archived')
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Archived {total} orders in {chunks} chunks')
+        )
@@ -0,0 +1,39 @@
+"""
+Management command to run performance benchmarks.
+Usage: python manage.py benchmark <name> [--iterations 200]
+       python manage.py benchmark --list
+"""
+from django.core.management.base import BaseCommand, CommandError
+from pharmacy.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Run a named performance benchmark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help='Benchmark to run')
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Number of timed iterations (default: 200)'
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='List available benchmarks'
+        )
+
+    def handle(self, *args, **options):
+        if options['list'] or not options['name']:
+            for name, func in sorted(BENCHMARKS.items()):
+                self.stdout.write(f'{name:<20} {(func.__doc__ or "").strip()}')
+            return
+
+        func = BENCHMARKS.get(options['name'])
+        if func is None:
+            raise CommandError(
+                f'Unknown benchmark "{options["name"]}". '
+                f'Choose from: {", ".join(sorted(BENCHMARKS))}'
+            )
+        func(self, options)
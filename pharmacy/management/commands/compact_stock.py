@@ -0,0 +1,56 @@
+"""
+Management command to fold sharded stock back into Medicine.stock.
+Usage: python manage.py compact_stock [--loop [SECONDS]]
+
+For every medicine with stock shards, the units the shards sold since the
+last fold are subtracted from Medicine.stock and the remainder is split
+evenly across the shards again. Medicine.stock is exact right after a
+fold, so the interval bounds how far it can overstate the stock. With
+--loop the command keeps folding every STOCK_SHARDS['COMPACT_INTERVAL']
+seconds until interrupted.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pharmacy.models import Medicine, StockShard
+
+
+class Command(BaseCommand):
+    help = 'Fold the stock sold by shard rows back into Medicine.stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            type=float,
+            nargs='?',
+            const=0,
+            default=None,
+            metavar='SECONDS',
+            help='Keep folding at this interval (default: STOCK_SHARDS["COMPACT_INTERVAL"])'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['loop']
+        if interval is None:
+            self.stdout.write(self.style.SUCCESS(f'Folded {self.compact()} medicines'))
+            return
+        interval = interval or settings.STOCK_SHARDS['COMPACT_INTERVAL']
+        if interval < 0:
+            raise CommandError('--loop must not be negative')
+
+        self.stdout.write(f'Folding sharded stock every {interval}s, press Ctrl+C to stop')
+        try:
+            while True:
+                started = time.monotonic()
+                self.compact()
+                time.sleep(max(interval - (time.monotonic() - started), 0))
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Stopped'))
+
+    def compact(self):
+        """Fold every sharded medicine, each in its own transaction."""
+        medicine_ids = list(Medicine.objects.filter(stock_shards__gt=0).values_list('id', flat=True))
+        for medicine_id in medicine_ids:
+            StockShard.fold(medicine_id)
+        return len(medicine_ids)
@@ -0,0 +1,290 @@
+"""
+Management command to generate a large synthetic dataset for load testing.
+Usage: python manage.py generate_dataset [--medicines 1000] [--orders 100000]
+                                         [--seed 42] [--workers 4] [--clear]
+
+Medicine popularity follows a Zipf distribution, so a few SKUs receive most
+orders. Order statuses depend on order age (recent orders are still pending,
+old ones delivered or cancelled). Orders are generated in fixed-size batches,
+each seeded from (--seed, batch number), so the same options always produce
+the same rows regardless of --workers. Dates count back from --until, which
+defaults to the start of the current hour. Each batch is written with bulk_create
+in its own transaction.
+
+Rows are written directly, bypassing Order.save(), so stock is not deducted.
+A pool of customers (one per five orders) is created up front and orders
+link to it by id.
+"""
+import itertools
+import multiprocessing
+import random
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from pharmacy.cache import bump_version, stock_cache, MEDICINES_VERSION, ORDERS_VERSION
+from pharmacy.models import Customer, Medicine, Order
+
+STEMS = [
+    'Amoxi', 'Cetiri', 'Ibupro', 'Parace', 'Omepra', 'Losar', 'Metfor',
+    'Atorva', 'Simva', 'Lisino', 'Levo', 'Azithro', 'Predni', 'Sertra',
+]
+SUFFIXES = ['cillin', 'zine', 'fen', 'tamol', 'zole', 'tan', 'min', 'statin', 'pril', 'mycin']
+FORMS = ['Tablet', 'Capsule', 'Syrup', 'Cream', 'Drops', 'Injection']
+STRENGTHS = [5, 10, 20, 25, 50, 100, 250, 500, 1000]
+
+# Quantity weights for 1..5 units
+QUANTITY_WEIGHTS = [60, 20, 10, 6, 4]
+
+# (max age in days, [(status, weight)]) checked in order
+STATUS_BY_AGE = [
+    (1, [('Pending', 70), ('Processing', 25), ('Cancelled', 5)]),
+    (3, [('Pending', 10), ('Processing', 35), ('Shipped', 45), ('Cancelled', 10)]),
+    (10, [('Processing', 5), ('Shipped', 30), ('Delivered', 55), ('Cancelled', 10)]),
+    (None, [('Delivered', 90), ('Cancelled', 10)]),
+]
+
+# Set in each worker before generating orders
+_context = {}
+
+
+def customer_name(number):
+    return f'Customer {number:07d}'
+
+
+def zipf_cum_weights(n, s):
+    """Cumulative Zipf weights for ranks 1..n with exponent s."""
+    return list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+
+def _status_table():
+    return [
+        (
+            max_age and timedelta(days=max_age),
+            [status for status, _ in choices],
+            list(itertools.accumulate(weight for _, weight in choices)),
+        )
+        for max_age, choices in STATUS_BY_AGE
+    ]
+
+
+def build_medicines(count, seed, today):
+    """Unsaved Medicine objects, deterministic for a seed."""
+    rng = random.Random(f'{seed}:medicines')
+    medicines = []
+    for i in range(1, count + 1):
+        form = rng.choice(FORMS)
+        strength = rng.choice(STRENGTHS)
+        # A small share of the catalog has already expired
+        days_left = rng.randint(-60, 900) if rng.random() < 0.03 else rng.randint(30, 900)
+        medicines.append(Medicine(
+            name=f'{rng.choice(STEMS)}{rng.choice(SUFFIXES)} {strength}mg {form} #{i:06d}',
+            description=f'{form} containing {strength}mg of active ingredient.',
+            price=Decimal(rng.randint(199, 19999)) / 100,
+            stock=rng.randint(0, 5000),
+            expiry_date=today + timedelta(days=days_left),
+            is_expired=days_left < 0,
+            version=1,
+        ))
+    return medicines
+
+
+def build_orders(batch, batch_size, total):
+    """Unsaved Order objects for one batch, deterministic for (seed, batch)."""
+    ctx = _context
+    rng = random.Random(f'{ctx["seed"]}:orders:{batch}')
+    start = batch * batch_size
+    count = min(batch_size, total - start)
+
+    medicines = rng.choices(ctx['medicines'], cum_weights=ctx['popularity'], k=count)
+    quantities = rng.choices(range(1, 6), weights=QUANTITY_WEIGHTS, k=count)
+    span = ctx['span_seconds']
+    until = ctx['until']
+
+    orders = []
+    for (medicine_id, price), quantity in zip(medicines, quantities):
+        # Skew dates towards the present, the way order volume grows
+        age = timedelta(seconds=span * rng.random() ** 2)
+        for max_age, statuses, cum_weights in ctx['statuses']:
+            if max_age is None or age <= max_age:
+                status = rng.choices(statuses, cum_weights=cum_weights)[0]
+                break
+        customer = rng.randint(1, len(ctx['customers']))
+        orders.append(Order(
+            customer_name=customer_name(customer),
+            customer_id=ctx['customers'][customer - 1],
+            medicine_id=medicine_id,
+            quantity=quantity,
+            order_date=until - age,
+            status=status,
+            unit_price=price,
+            total_price=price * quantity,
+        ))
+    return orders
+
+
+def write_batches(batches, batch_size, total):
+    """Generate and insert the given order batches, returning rows written."""
+    written = 0
+    write_lock = _context.get('write_lock') or nullcontext()
+    for batch in batches:
+        orders = build_orders(batch, batch_size, total)
+        with write_lock, transaction.atomic():
+            Order.objects.bulk_create(orders, batch_size=batch_size)
+        written += len(orders)
+    return written
+
+
+def _init_worker(context):
+    _context.update(context)
+    # Forked workers must not share the parent's database connection
+    for conn in connections.all(initialized_only=True):
+        conn.close()
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, seeded synthetic dataset of medicines and orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--medicines', type=int, default=1000,
+            help='Number of medicines to create (default: 1000)'
+        )
+        parser.add_argument(
+            '--orders', type=int, default=100000,
+            help='Number of orders to create (default: 100000)'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=42,
+            help='Random seed, the same seed produces the same rows (default: 42)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Orders generated and inserted per transaction (default: 5000)'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Worker processes generating orders in parallel (default: 1)'
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Zipf exponent for medicine popularity (default: 1.1)'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Spread order dates over this many past days (default: 365)'
+        )
+        parser.add_argument(
+            '--until', type=datetime.fromisoformat, default=None,
+            help='Latest order date, ISO format (default: start of the current hour)'
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Delete existing medicines and orders first'
+        )
+
+    def handle(self, *args, **options):
+        medicine_count = options['medicines']
+        order_count = options['orders']
+        batch_size = options['batch_size']
+        workers = options['workers']
+        if medicine_count < 1 or order_count < 0:
+            raise CommandError('--medicines must be at least 1 and --orders not negative')
+        if batch_size < 1 or workers < 1:
+            raise CommandError('--batch-size and --workers must be at least 1')
+
+        if options['clear']:
+            Order.objects.all().delete()
+            Medicine.objects.all().delete()
+            Customer.objects.all().delete()
+            self.stdout.write('Cleared existing data')
+        elif Medicine.objects.exists() or Customer.objects.exists():
+            raise CommandError('The database already contains data, use --clear to replace it')
+
+        until = options['until'] or timezone.now().replace(minute=0, second=0, microsecond=0)
+        if timezone.is_naive(until):
+            until = timezone.make_aware(until)
+
+        started = time.perf_counter()
+        medicines = build_medicines(medicine_count, options['seed'], until.date())
+        with transaction.atomic():
+            Medicine.objects.bulk_create(medicines, batch_size=batch_size)
+        # bulk_create only returns primary keys on some backends
+        rows = list(Medicine.objects.order_by('name').values_list('id', 'price'))
+        self._report('medicines', len(rows), started)
+
+        started = time.perf_counter()
+        customer_ids = self._create_customers(max(1, order_count // 5), batch_size)
+        self._report('customers', len(customer_ids), started)
+
+        # Popularity ranks are shuffled so the best sellers are spread across the catalog
+        random.Random(f'{options["seed"]}:popularity').shuffle(rows)
+        context = {
+            'seed': options['seed'],
+            'medicines': rows,
+            'popularity': zipf_cum_weights(len(rows), options['zipf']),
+            'statuses': _status_table(),
+            'customers': customer_ids,
+            'until': until,
+            'span_seconds': options['days'] * 86400,
+        }
+
+        started = time.perf_counter()
+        batches = list(range((order_count + batch_size - 1) // batch_size))
+        if workers == 1 or len(batches) < 2:
+            _context.update(context)
+            written = write_batches(batches, batch_size, order_count)
+        else:
+            written = self._write_parallel(batches, batch_size, order_count, workers, context)
+        self._report('orders', written, started)
+
+        if connection.vendor == 'sqlite':
+            # Refresh the statistics used for cheap row count estimates
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        stock_cache.clear()
+        bump_version(MEDICINES_VERSION)
+        bump_version(ORDERS_VERSION)
+
+    def _create_customers(self, count, batch_size):
+        """Create the customer pool, returning ids in customer number order."""
+        with transaction.atomic():
+            Customer.objects.bulk_create(
+                [
+                    Customer(name=customer_name(i), name_key=customer_name(i).lower())
+                    for i in range(1, count + 1)
+                ],
+                batch_size=batch_size
+            )
+        # Numbers are zero-padded, so name order is number order
+        return list(Customer.objects.order_by('name_key').values_list('id', flat=True))
+
+    def _write_parallel(self, batches, batch_size, total, workers, context):
+        # Workers inherit the configured Django process, which requires fork
+        pool_context = multiprocessing.get_context('fork')
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite allows a single writer, extra workers only parallelize generation'
+            ))
+            # Take turns instead of failing with "database is locked"
+            context = {**context, 'write_lock': pool_context.Lock()}
+        connections.close_all()
+        # Interleave batches so workers finish at about the same time
+        chunks = [batches[i::workers] for i in range(workers)]
+        with pool_context.Pool(workers, initializer=_init_worker, initargs=(context,)) as pool:
+            results = pool.starmap(
+                write_batches, [(chunk, batch_size, total) for chunk in chunks]
+            )
+        return sum(results)
+
+    def _report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {count} {label} in {elapsed:.1f}s ({rate:,.0f} rows/sec)'
+        ))
@@ -0,0 +1,63 @@
+"""
+Management command to value the inventory.
+Usage: python manage.py inventory_report [--near-expiry-days 30] [--breakdown inventory.csv]
+
+Prints the total value, the value per expiry bucket and the value at risk
+(see pharmacy/reports.py). With --breakdown the per-medicine rows are also
+written to a CSV file, read in the same transaction as the summary so the
+two agree exactly; the summary is then computed afresh rather than cached.
+"""
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pharmacy import reports
+from pharmacy.benchmarks import report
+
+
+class Command(BaseCommand):
+    help = 'Value the inventory by expiry bucket in one pass over the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--near-expiry-days',
+            type=int,
+            default=settings.REPORTS['NEAR_EXPIRY_DAYS'],
+            help='Stock expiring within this many days is value at risk '
+                 f"(default: {settings.REPORTS['NEAR_EXPIRY_DAYS']})"
+        )
+        parser.add_argument(
+            '--breakdown',
+            metavar='FILE',
+            help='Also write the value of every medicine to this CSV file'
+        )
+
+    def handle(self, *args, **options):
+        near_expiry_days = options['near_expiry_days']
+        if near_expiry_days < 0:
+            raise CommandError('--near-expiry-days must not be negative')
+
+        path = options['breakdown']
+        if path:
+            try:
+                with open(path, 'w', newline='') as f, reports.snapshot():
+                    valuation = reports.inventory_valuation(near_expiry_days, use_cache=False)
+                    writer = csv.writer(f)
+                    writer.writerow(reports.BREAKDOWN_COLUMNS)
+                    writer.writerows(reports.valuation_rows())
+            except OSError as e:
+                raise CommandError(f'Could not write {path}: {e}')
+        else:
+            valuation = reports.inventory_valuation(near_expiry_days)
+
+        total = valuation['total']
+        at_risk = valuation['at_risk']
+        report(self, f"Inventory value as of {valuation['as_of']} (catalog version {valuation['catalog_version']})", [
+            (bucket['bucket'], bucket['medicines'], bucket['units'], bucket['value'])
+            for bucket in valuation['expiry_buckets']
+        ] + [
+            (f'at risk (within {near_expiry_days} days)', at_risk['medicines'], at_risk['units'], at_risk['value']),
+            ('total', total['medicines'], total['units'], total['value']),
+        ], ['expiry', 'medicines', 'units', 'value'])
+        if path:
+            self.stdout.write(f"Wrote {total['medicines']} medicines to {path}")
@@ -7,6 +7,7 @@ from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
 from pharmacy.models import Medicine, Order
+from pharmacy.services import place_order
 
 
 class Command(BaseCommand):
@@ -149,7 +150,7 @@ class Command(BaseCommand):
         order_statuses = ['Pending', 'Processing', 'Shipped', 'Delivered']
         
         for idx, order_data in enumerate(orders_data):
-            order = Order.objects.create(**order_data)
+            order = place_order(order_data['customer_name'], order_data['medicine'].pk, order_data['quantity'])
             # Update status for some orders
             if idx % 2 == 0 and idx > 0:
                 order.status = order_statuses[min(idx // 2, 3)]
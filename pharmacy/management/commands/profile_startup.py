@@ -0,0 +1,68 @@
+"""
+Management command to profile process startup.
+Usage: python manage.py profile_startup [--path /api/medicines/] [--top 15]
+       python manage.py profile_startup --settings medicart.settings_api
+
+Starts a new interpreter under `python -X importtime` that sets up Django
+and serves one request (see pharmacy/startup.py), then reports where the
+time went: setup, URLconf and first request, the packages that take
+longest to import, and the slowest individual modules.
+"""
+import os
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from pharmacy.benchmarks import report
+from pharmacy.startup import DEFAULT_PATH, measure
+
+
+class Command(BaseCommand):
+    help = 'Break down the startup and first-request time of a fresh process by module'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=DEFAULT_PATH,
+            help=f'Path of the first request (default: {DEFAULT_PATH})'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Number of packages and modules listed (default: 15)'
+        )
+
+    def handle(self, *args, **options):
+        settings_module = os.environ['DJANGO_SETTINGS_MODULE']
+        try:
+            timings, modules = measure(settings_module, options['path'], importtime=True)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        report(self, f'Startup of {settings_module} (GET {options["path"]})', [
+            ('django.setup() and WSGI handler', timings['setup_ms']),
+            ('URLconf', timings['urls_ms']),
+            (f'first request ({timings["status"]})', timings['request_ms']),
+            ('total', timings['total_ms']),
+        ], ['phase', 'ms'])
+
+        packages = defaultdict(lambda: [0, 0])
+        for name, self_us, _ in modules:
+            package = packages[name.split('.')[0]]
+            package[0] += self_us
+            package[1] += 1
+        total_us = sum(self_us for _, self_us, _ in modules)
+        rows = [
+            (name, f'{self_us / 1000:.1f}', f'{self_us / total_us:.0%}', count)
+            for name, (self_us, count) in sorted(packages.items(), key=lambda item: -item[1][0])
+        ][:options['top']]
+        self.stdout.write('')
+        report(self, f'Import time by package ({len(modules)} modules, {total_us / 1000:.0f} ms)', rows,
+               ['package', 'ms', 'share', 'modules'])
+
+        rows = [
+            (name, f'{self_us / 1000:.1f}', f'{cumulative_us / 1000:.1f}')
+            for name, self_us, cumulative_us in sorted(modules, key=lambda module: -module[1])
+        ][:options['top']]
+        self.stdout.write('')
+        report(self, 'Slowest modules', rows, ['module', 'self ms', 'with imports ms'])
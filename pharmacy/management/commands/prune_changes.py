@@ -0,0 +1,59 @@
+"""
+Management command to delete old change feed entries.
+Usage: python manage.py prune_changes [--days 7] [--chunk-size 5000]
+
+Entries are deleted oldest first in chunks, each in its own transaction.
+Consumers that fall further behind than the retention period get
+410 Gone from /api/changes/ and must resynchronize from the full API.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from pharmacy.models import ChangeLogEntry
+
+
+class Command(BaseCommand):
+    help = 'Delete change feed entries older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Keep entries from this many days (default: CHANGES_FEED["RETENTION_DAYS"])'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of entries deleted per transaction (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else settings.CHANGES_FEED['RETENTION_DAYS']
+        if days < 0 or options['chunk_size'] < 1:
+            raise CommandError('--days must not be negative and --chunk-size must be at least 1')
+
+        cutoff = timezone.now() - timedelta(days=days)
+        # Entries are appended in time order, so the cutoff is a seq boundary
+        last_seq = (
+            ChangeLogEntry.objects.filter(created_at__lt=cutoff)
+            .order_by('-seq').values_list('seq', flat=True).first()
+        )
+        deleted = 0
+        while last_seq is not None:
+            with transaction.atomic():
+                seqs = list(
+                    ChangeLogEntry.objects.filter(seq__lte=last_seq)
+                    .order_by('seq').values_list('seq', flat=True)[:options['chunk_size']]
+                )
+                if not seqs:
+                    break
+                deleted += ChangeLogEntry.objects.filter(seq__lte=seqs[-1]).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} change feed entries older than {cutoff:%Y-%m-%d}'
+        ))
@@ -0,0 +1,43 @@
+"""
+Management command to split the stock of hot medicines across shard rows.
+Usage: python manage.py shard_stock <medicine_id> [<medicine_id> ...] [--shards 8]
+
+Orders for a sharded medicine take their units from one of its StockShard
+rows instead of updating the Medicine row, so concurrent orders for it no
+longer queue on a single row lock. Run compact_stock periodically to fold
+the shards back into Medicine.stock. --shards 0 turns sharding off again.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pharmacy.models import Medicine
+
+
+class Command(BaseCommand):
+    help = 'Split the stock of medicines across shard rows, or fold it back with --shards 0'
+
+    def add_arguments(self, parser):
+        parser.add_argument('medicine_ids', nargs='+', type=int, help='Medicines to shard')
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=None,
+            help='Number of shards per medicine, 0 to disable (default: STOCK_SHARDS["COUNT"])'
+        )
+
+    def handle(self, *args, **options):
+        count = options['shards'] if options['shards'] is not None else settings.STOCK_SHARDS['COUNT']
+        if count < 0:
+            raise CommandError('--shards must not be negative')
+
+        medicines = Medicine.objects.in_bulk(options['medicine_ids'])
+        missing = sorted(set(options['medicine_ids']) - set(medicines))
+        if missing:
+            raise CommandError(f'No medicine with id {", ".join(map(str, missing))}')
+
+        for medicine in medicines.values():
+            medicine.set_stock_shards(count)
+            if count:
+                self.stdout.write(f'{medicine.name}: {medicine.stock} units across {count} shards')
+            else:
+                self.stdout.write(f'{medicine.name}: {medicine.stock} units, sharding disabled')
+        self.stdout.write(self.style.SUCCESS(f'Updated {len(medicines)} medicines'))
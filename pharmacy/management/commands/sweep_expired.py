@@ -0,0 +1,129 @@
+"""
+Management command to flag medicines whose expiry date has passed.
+Usage: python manage.py sweep_expired [--chunk-size 500] [--sleep 0.1] [--resume RUN_ID]
+
+The catalog is walked in primary-key order (keyset pagination), one chunk at a
+time. Each chunk is flagged with a single bulk UPDATE and an ExpirySweepLog row
+is written in the same transaction, so an interrupted run can be resumed from
+the last completed chunk.
+"""
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from pharmacy.cache import bump_version_on_commit, MEDICINES_VERSION
+from pharmacy.models import ChangeLogEntry, Medicine, ExpirySweepLog
+
+
+class Command(BaseCommand):
+    help = 'Flag expired medicines in keyset-paginated chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of medicines scanned per chunk (default: 500)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between chunks to throttle write load'
+        )
+        parser.add_argument(
+            '--max-chunks',
+            type=int,
+            default=None,
+            help='Stop after this many chunks (the run can be resumed later)'
+        )
+        parser.add_argument(
+            '--resume',
+            metavar='RUN_ID',
+            help='Continue a previous run after its last completed chunk'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        run_id = options['resume']
+        if run_id:
+            last_id = ExpirySweepLog.objects.filter(run_id=run_id).aggregate(
+                last=Max('last_medicine_id')
+            )['last']
+            if last_id is None:
+                raise CommandError(f'No sweep run found with id "{run_id}"')
+            self.stdout.write(f'Resuming sweep {run_id} after medicine #{last_id}')
+        else:
+            run_id = uuid.uuid4().hex[:12]
+            last_id = 0
+            self.stdout.write(f'Starting sweep {run_id}')
+
+        today = timezone.now().date()
+        chunks = 0
+        total_flagged = 0
+        finished = False
+
+        while options['max_chunks'] is None or chunks < options['max_chunks']:
+            ids = list(
+                Medicine.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not ids:
+                finished = True
+                break
+
+            with transaction.atomic():
+                expired = Medicine.objects.filter(
+                    pk__gte=ids[0],
+                    pk__lte=ids[-1],
+                    expiry_date__lt=today,
+                    is_expired=False,
+                ).select_for_update()
+                # The change feed needs the ids, the UPDATE alone does not return them
+                expired_ids = list(expired.values_list('pk', flat=True))
+                # A new row version changes the medicine's ETag
+                flagged = Medicine.objects.filter(pk__in=expired_ids).update(
+                    is_expired=True, version=F('version') + 1, updated_at=timezone.now()
+                )
+                if flagged:
+                    ChangeLogEntry.record(*(
+                        ('medicine', pk, 'updated', {'is_expired': True}) for pk in expired_ids
+                    ))
+                    bump_version_on_commit(MEDICINES_VERSION)
+                ExpirySweepLog.objects.create(
+                    run_id=run_id,
+                    first_medicine_id=ids[0],
+                    last_medicine_id=ids[-1],
+                    scanned=len(ids),
+                    flagged=flagged,
+                )
+
+            chunks += 1
+            total_flagged += flagged
+            last_id = ids[-1]
+            self.stdout.write(
+                f'Chunk {chunks}: medicines #{ids[0]}-#{ids[-1]}, {flagged} flagged'
+            )
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        if not finished:
+            self.stdout.write(
+                f'Stopped after {chunks} chunks. Resume with: '
+                f'python manage.py sweep_expired --resume {run_id}'
+            )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Sweep {run_id} finished: {chunks} chunks, {total_flagged} medicines flagged as expired'
+            )
+        )
@@ -0,0 +1,445 @@
+"""
+In-process metrics with a Prometheus text exposition endpoint.
+
+Counters and histograms keep one shard per thread, so recording a value
+never takes a lock; shards are only summed when metrics are collected.
+When a thread exits, its shard is folded into a per-metric retired total.
+
+When METRICS['MULTIPROCESS_DIR'] is set, every process periodically writes
+a snapshot file there and /metrics sums the snapshots of all workers.
+Counters and histograms of workers that have exited are folded into one
+retired snapshot; their gauges, and those of snapshots not rewritten for
+METRICS['STALE_AFTER'] seconds, are left out.
+"""
+from contextlib import contextmanager
+from django.conf import settings
+import json
+import os
+import threading
+import time
+import weakref
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+COLLECTORS = []
+
+
+class _ShardOwner:
+    """Kept in a thread's local storage; freed when the thread exits."""
+
+    __slots__ = ('__weakref__',)
+
+
+class _Metric:
+    """Base class for metrics with per-thread shards."""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        # Values recorded by threads that have exited
+        self._retired = {}
+        # Reentrant: a shard may be retired by whichever thread frees its owner
+        self._shards_lock = threading.RLock()
+        REGISTRY.append(self)
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            owner = _ShardOwner()
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            self._local.owner = owner
+            weakref.finalize(owner, self._retire, shard)
+            return shard
+
+    def _retire(self, shard):
+        with self._shards_lock:
+            self._shards = [s for s in self._shards if s is not shard]
+            self._merge(self._retired, dict(shard))
+
+    def _merge(self, total, shard):
+        """Add the values of `shard` into `total`."""
+        raise NotImplementedError
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _snapshot_shards(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+            retired = dict(self._retired)
+        # dict() copies are atomic under the GIL
+        return [retired] + [dict(shard) for shard in shards]
+
+    def _labels(self, key):
+        return tuple(zip(self.labelnames, key))
+
+    def clear(self):
+        with self._shards_lock:
+            self._retired.clear()
+            for shard in self._shards:
+                shard.clear()
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def _merge(self, total, shard):
+        for key, value in shard.items():
+            total[key] = total.get(key, 0) + value
+
+    def value(self, **labels):
+        key = self._key(labels)
+        return sum(shard.get(key, 0) for shard in self._snapshot_shards())
+
+    def collect(self):
+        totals = {}
+        for shard in self._snapshot_shards():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        if not totals and not self.labelnames:
+            totals[()] = 0
+        return [(self.name, self._labels(key), value) for key, value in totals.items()]
+
+
+class Histogram(_Metric):
+    """Histogram with fixed upper bounds, exposed as cumulative buckets."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        state = shard.get(key)
+        if state is None:
+            # One slot per bucket plus +Inf, then sum and count
+            state = shard[key] = [0] * (len(self.buckets) + 3)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[index] += 1
+                break
+        else:
+            state[len(self.buckets)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def _merge(self, total, shard):
+        # New lists, so snapshots already taken of `total` never change
+        for key, state in shard.items():
+            state = list(state)
+            if key in total:
+                state = [a + b for a, b in zip(total[key], state)]
+            total[key] = state
+
+    def collect(self):
+        totals = {}
+        for shard in self._snapshot_shards():
+            for key, state in shard.items():
+                state = list(state)
+                total = totals.setdefault(key, [0] * len(state))
+                for index, value in enumerate(state):
+                    total[index] += value
+
+        samples = []
+        for key, state in totals.items():
+            labels = self._labels(key)
+            cumulative = 0
+            for index, bound in enumerate(self.buckets + (float('inf'),)):
+                cumulative += state[index]
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                samples.append((self.name + '_bucket', labels + (('le', le),), cumulative))
+            samples.append((self.name + '_sum', labels, state[-2]))
+            samples.append((self.name + '_count', labels, state[-1]))
+        return samples
+
+
+def register_collector(name, metric_type, documentation, func):
+    """
+    Register a callback exposing values owned by another component.
+    `func` returns an iterable of (labels dict, value) pairs.
+    """
+    COLLECTORS.append((name, metric_type, documentation, func))
+
+
+# ==================== Metric definitions ====================
+
+request_latency = Histogram(
+    'pharmacy_request_duration_seconds',
+    'Request latency by route name.',
+    ['route', 'method', 'status'],
+)
+db_queries = Counter(
+    'pharmacy_db_queries_total',
+    'Database queries executed, by route name.',
+    ['route'],
+)
+db_query_time = Histogram(
+    'pharmacy_db_query_duration_seconds',
+    'Database query latency by route name.',
+    ['route'],
+)
+orders_created = Counter(
+    'pharmacy_orders_created_total',
+    'Orders successfully created.',
+)
+stock_deducted = Counter(
+    'pharmacy_stock_deducted_units_total',
+    'Units of stock deducted by new orders.',
+)
+insufficient_stock = Counter(
+    'pharmacy_insufficient_stock_rejections_total',
+    'Orders rejected for insufficient stock, by the layer that rejected them.',
+    ['source'],
+)
+exceptions = Counter(
+    'pharmacy_exceptions_total',
+    'Exceptions handled by the API exception handler, by type.',
+    ['type'],
+)
+order_transitions = Counter(
+    'pharmacy_order_transitions_total',
+    'Orders moved to a new status, by target status.',
+    ['status'],
+)
+stock_restocked = Counter(
+    'pharmacy_stock_restocked_units_total',
+    'Units of stock returned by cancelled orders.',
+)
+profiled_requests = Counter(
+    'pharmacy_profiled_requests_total',
+    'Requests sampled by the profiling middleware, by route name.',
+    ['route'],
+)
+stock_shard_deductions = Counter(
+    'pharmacy_stock_shard_deductions_total',
+    'Orders for sharded medicines, by how their stock was taken '
+    '(shard, fallback or fold).',
+    ['path'],
+)
+compressed_bytes_saved = Counter(
+    'pharmacy_compression_saved_bytes_total',
+    'Response bytes saved by compression, by content coding.',
+    ['encoding'],
+)
+
+inventory_reports = Counter(
+    'pharmacy_inventory_reports_total',
+    'Inventory valuations served, by where they came from (cache or database).',
+    ['source'],
+)
+
+# ==================== Collection and exposition ====================
+
+def collect():
+    """Return {name: (type, help, [(sample name, labels, value)])} for this process."""
+    families = {}
+    for metric in REGISTRY:
+        families[metric.name] = (metric.type, metric.documentation, metric.collect())
+    for name, metric_type, documentation, func in COLLECTORS:
+        samples = [
+            (name, tuple(sorted(labels.items())), value)
+            for labels, value in func()
+        ]
+        families[name] = (metric_type, documentation, samples)
+    return families
+
+
+SNAPSHOT_PREFIX = 'pharmacy-metrics-'
+RETIRED_SNAPSHOT = f'{SNAPSHOT_PREFIX}retired.json'
+
+
+def _snapshot_path(directory, pid):
+    return os.path.join(directory, f'{SNAPSHOT_PREFIX}{pid}.json')
+
+
+def _snapshot_pid(filename):
+    """The worker pid in a snapshot file name, or None for the retired snapshot."""
+    pid = filename[len(SNAPSHOT_PREFIX):-len('.json')]
+    return int(pid) if pid.isdigit() else None
+
+
+def _pid_alive(pid):
+    if os.name != 'posix':
+        # No signal 0 to probe with; treat every worker as running
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _directory_lock(directory):
+    """Serialize folding snapshots across the processes sharing `directory`."""
+    import fcntl
+    with open(os.path.join(directory, f'{SNAPSHOT_PREFIX}lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _fold_dead_snapshot(directory, filename):
+    """
+    Add the counters and histograms of an exited worker to the retired
+    snapshot and delete its file, so the sums /metrics reports never go
+    backwards. Its gauges described a process that no longer exists.
+    """
+    path = os.path.join(directory, filename)
+    retired_path = os.path.join(directory, RETIRED_SNAPSHOT)
+    with _directory_lock(directory):
+        # Another worker may have folded it already
+        data = _read_snapshot(path)
+        if data is None:
+            return
+        retired = _read_snapshot(retired_path) or {}
+        for name, (metric_type, documentation, samples) in data.items():
+            if metric_type == 'gauge':
+                continue
+            merged = {
+                (sample_name, tuple(tuple(pair) for pair in labels)): value
+                for sample_name, labels, value in retired.get(name, [None, None, []])[2]
+            }
+            for sample_name, labels, value in samples:
+                key = (sample_name, tuple(tuple(pair) for pair in labels))
+                merged[key] = merged.get(key, 0) + value
+            retired[name] = [metric_type, documentation, [
+                [sample_name, list(map(list, labels)), value] for (sample_name, labels), value in merged.items()
+            ]]
+        _write_snapshot(retired_path, retired)
+        os.remove(path)
+
+
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def flush(force=False):
+    """Write this process's snapshot when running in multi-process mode."""
+    global _last_flush
+    directory = settings.METRICS['MULTIPROCESS_DIR']
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < settings.METRICS['FLUSH_INTERVAL']:
+        return
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _last_flush = now
+        data = {
+            name: [metric_type, documentation, [[s, list(map(list, l)), v] for s, l, v in samples]]
+            for name, (metric_type, documentation, samples) in collect().items()
+        }
+        _write_snapshot(_snapshot_path(directory, os.getpid()), data)
+    except OSError as e:
+        logger.warning(f"Could not write metrics snapshot: {str(e)}")
+    finally:
+        _flush_lock.release()
+
+
+def collect_all():
+    """
+    Collect metrics for every worker process, summing sample values.
+    Snapshots of exited workers are folded into the retired snapshot first.
+    """
+    directory = settings.METRICS['MULTIPROCESS_DIR']
+    if not directory:
+        return collect()
+
+    flush(force=True)
+    families = {}
+    stale_before = time.time() - settings.METRICS['STALE_AFTER']
+    for filename in sorted(os.listdir(directory)):
+        if not (filename.startswith(SNAPSHOT_PREFIX) and filename.endswith('.json')):
+            continue
+        path = os.path.join(directory, filename)
+        pid = _snapshot_pid(filename)
+        if pid is not None and not _pid_alive(pid):
+            try:
+                _fold_dead_snapshot(directory, filename)
+            except OSError as e:
+                logger.warning(f"Could not fold metrics snapshot {filename}: {str(e)}")
+            continue
+        try:
+            # The retired snapshot holds no gauges; live ones go stale when a
+            # worker stops flushing, e.g. in another container's pid namespace
+            stale = pid is not None and os.path.getmtime(path) < stale_before
+        except OSError:
+            continue
+        data = _read_snapshot(path)
+        if data is None:
+            continue
+        for name, (metric_type, documentation, samples) in data.items():
+            if stale and metric_type == 'gauge':
+                continue
+            _, _, merged = families.setdefault(name, (metric_type, documentation, {}))
+            for sample_name, labels, value in samples:
+                key = (sample_name, tuple(tuple(pair) for pair in labels))
+                merged[key] = merged.get(key, 0) + value
+
+    return {
+        name: (metric_type, documentation, [(s, l, v) for (s, l), v in merged.items()])
+        for name, (metric_type, documentation, merged) in families.items()
+    }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render():
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, (metric_type, documentation, samples) in sorted(collect_all().items()):
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for sample_name, labels, value in samples:
+            if labels:
+                label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f'{sample_name}{{{label_text}}} {float(value)!r}')
+            else:
+                lines.append(f'{sample_name} {float(value)!r}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,263 @@
+"""
+Middleware for the MediCart pharmacy application.
+
+All middlewares run natively in async mode under ASGI, so long-poll and
+streaming responses do not occupy a worker thread while they wait.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.text import compress_sequence, compress_string
+from . import metrics, profiling
+import random
+import re
+import sys
+import threading
+import time
+import logging
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional encoder
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """
+    Record request latency and database query counts per route name.
+    Should be placed first in MIDDLEWARE so the whole stack is timed.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = _QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, timer)
+        return response
+
+    async def __acall__(self, request):
+        # Queries of async views run in other threads, so only latency is recorded
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, None)
+        return response
+
+    def record(self, request, response, duration, timer):
+        match = getattr(request, 'resolver_match', None)
+        route = (match.url_name if match else None) or 'unmatched'
+        metrics.request_latency.observe(
+            duration,
+            route=route,
+            method=request.method,
+            status=response.status_code
+        )
+        if timer is not None and timer.count:
+            metrics.db_queries.inc(timer.count, route=route)
+            for query_time in timer.times:
+                metrics.db_query_time.observe(query_time, route=route)
+
+        metrics.flush()
+
+
+class _QueryTimer:
+    """Database execute wrapper counting and timing queries."""
+
+    __slots__ = ('count', 'times')
+
+    def __init__(self):
+        self.count = 0
+        self.times = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.times.append(time.perf_counter() - start)
+
+
+_accept_encoding_re = re.compile(r'([a-z*]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+def accepted_encodings(header):
+    """Return {coding: q} from an Accept-Encoding header."""
+    encodings = {}
+    for part in header.lower().split(','):
+        match = _accept_encoding_re.match(part.strip())
+        if match:
+            try:
+                encodings[match[1]] = float(match[2]) if match[2] else 1.0
+            except ValueError:
+                continue
+    return encodings
+
+
+def choose_encoding(header):
+    """Pick 'br' or 'gzip' for an Accept-Encoding header, or None."""
+    encodings = accepted_encodings(header)
+    wildcard = encodings.get('*', 0)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0
+    for coding in candidates:
+        q = encodings.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+async def _acompress_sequence(chunks):
+    """Gzip each chunk of an async iterator, as GZipMiddleware does."""
+    async for chunk in chunks:
+        yield compress_string(chunk, max_random_bytes=100)
+
+
+class CompressionMiddleware:
+    """
+    Compress text responses with brotli (when installed) or gzip, chosen
+    from the client's Accept-Encoding. Bodies smaller than MIN_SIZE go out
+    as-is, compressing them costs more than it saves.
+
+    Gzip output is padded with random bytes the way GZipMiddleware does,
+    to blunt BREACH-style attacks against pages carrying CSRF tokens.
+    Should be placed near the top of MIDDLEWARE, below MetricsMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = settings.COMPRESSION
+        self.min_size = config['MIN_SIZE']
+        self.content_types = tuple(config['CONTENT_TYPES'])
+        self.brotli_quality = config['BROTLI_QUALITY']
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in self.content_types:
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        # The representation now depends on Accept-Encoding, even if not compressed
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None or (response.streaming and encoding != 'gzip'):
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _acompress_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content, max_random_bytes=100
+                )
+            del response.headers['Content-Length']
+        else:
+            original_size = len(response.content)
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=self.brotli_quality)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=100)
+            if len(compressed) >= original_size:
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+            metrics.compressed_bytes_saved.inc(original_size - len(compressed), encoding=encoding)
+
+        # The body differs byte-for-byte from the uncompressed one
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Sample the stack of a share of requests, aggregated per route name
+    (see pharmacy/profiling.py).
+
+    A request is profiled when a random draw falls under SAMPLE_RATE or it
+    sends "X-Profile: <TOKEN>". Without either setting the middleware is
+    removed at startup, so it costs nothing while profiling is off.
+    Profiled responses carry X-Profile-Samples.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = settings.PROFILING
+        if not config['SAMPLE_RATE'] and not config['TOKEN']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = config['SAMPLE_RATE']
+        self.token = config['TOKEN']
+        self.interval = config['INTERVAL']
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def should_profile(self, request):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        header = request.headers.get('X-Profile')
+        return bool(self.token and header and constant_time_compare(header, self.token))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        sampler = profiling.StackSampler(threading.get_ident(), sys._getframe(), self.interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            samples = sampler.stop()
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        profiling.record((match.url_name if match else None) or 'unmatched', samples, duration)
+        response['X-Profile-Samples'] = str(sum(samples.values()))
+        return response
+
+    async def __acall__(self, request):
+        # Async views spend their time awaiting in the event loop, where
+        # stack samples of one thread do not show what the request does
+        return await self.get_response(request)
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 02:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpirySweepLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_id', models.CharField(db_index=True, max_length=32)),
+                ('first_medicine_id', models.BigIntegerField()),
+                ('last_medicine_id', models.BigIntegerField()),
+                ('scanned', models.IntegerField()),
+                ('flagged', models.IntegerField()),
+                ('swept_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Expiry Sweep Log',
+                'verbose_name_plural': 'Expiry Sweep Logs',
+                'ordering': ['-swept_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='medicine',
+            name='is_expired',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0002_medicine_is_expired_expirysweeplog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
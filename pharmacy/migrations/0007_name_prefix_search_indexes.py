@@ -0,0 +1,47 @@
+# Case-insensitive prefix search indexes for the admin changelists.
+#
+# Django's istartswith compiles to LIKE on SQLite, which can only use an
+# index declared with NOCASE collation, and to UPPER(col) LIKE UPPER(...)
+# on PostgreSQL, which needs an expression index with pattern ops. The
+# index definition is therefore backend specific.
+
+from django.db import migrations
+
+INDEXES = [
+    ('order_customer_prefix_idx', 'pharmacy_order', 'customer_name'),
+    ('medicine_name_prefix_idx', 'pharmacy_medicine', 'name'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    quote = schema_editor.quote_name
+    for name, table, column in INDEXES:
+        if vendor == 'sqlite':
+            expression = f'{quote(column)} COLLATE NOCASE'
+        elif vendor == 'postgresql':
+            expression = f'UPPER({quote(column)}::text) text_pattern_ops'
+        else:
+            # MySQL collations are case-insensitive, a plain index serves LIKE 'x%'
+            expression = quote(column)
+        schema_editor.execute(f'CREATE INDEX {quote(name)} ON {quote(table)} ({expression})')
+
+
+def drop_indexes(apps, schema_editor):
+    quote = schema_editor.quote_name
+    for name, table, _ in INDEXES:
+        if schema_editor.connection.vendor == 'mysql':
+            schema_editor.execute(f'DROP INDEX {quote(name)} ON {quote(table)}')
+        else:
+            schema_editor.execute(f'DROP INDEX {quote(name)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0006_order_date_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
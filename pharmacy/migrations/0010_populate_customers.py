@@ -0,0 +1,58 @@
+# Create a Customer for every distinct customer name and link the orders.
+#
+# Names that differ only in case or whitespace become one customer, named
+# after the first spelling seen with whitespace collapsed. Orders whose
+# name is already in that form are linked with one set-based UPDATE; the
+# remaining spelling variants are linked by primary key.
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def populate_customers(apps, schema_editor):
+    Customer = apps.get_model('pharmacy', 'Customer')
+    Order = apps.get_model('pharmacy', 'Order')
+    db = schema_editor.connection.alias
+
+    names = {}
+    raw_names = Order.objects.using(db).order_by().values_list('customer_name', flat=True).distinct()
+    for raw in raw_names.iterator():
+        name = ' '.join(raw.split())
+        names.setdefault(name.lower(), name)
+    Customer.objects.using(db).bulk_create(
+        [Customer(name=name, name_key=key) for key, name in names.items()],
+        batch_size=BATCH_SIZE
+    )
+
+    Order.objects.using(db).update(customer=Subquery(
+        Customer.objects.using(db).filter(name=OuterRef('customer_name')).values('id')[:1]
+    ))
+
+    customer_ids = {}
+    orders_by_customer = {}
+    unlinked = Order.objects.using(db).filter(customer__isnull=True).values_list('id', 'customer_name')
+    for order_id, raw in unlinked.iterator():
+        orders_by_customer.setdefault(' '.join(raw.split()).lower(), []).append(order_id)
+    if orders_by_customer:
+        customer_ids = dict(
+            Customer.objects.using(db).filter(name_key__in=list(orders_by_customer))
+            .values_list('name_key', 'id')
+        )
+    for key, order_ids in orders_by_customer.items():
+        for start in range(0, len(order_ids), BATCH_SIZE):
+            Order.objects.using(db).filter(pk__in=order_ids[start:start + BATCH_SIZE]).update(
+                customer_id=customer_ids[key]
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0009_customer'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_customers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 03:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0012_changelogentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('stock', models.IntegerField()),
+                ('allotted', models.IntegerField()),
+                ('medicine', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='pharmacy.medicine')),
+            ],
+            options={
+                'ordering': ['medicine', 'index'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockshard',
+            constraint=models.UniqueConstraint(fields=('medicine', 'index'), name='stock_shard_medicine_index_uniq'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-19 03:38
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0013_stock_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceList',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('effective_from', models.DateTimeField(default=django.utils.timezone.now)),
+                ('effective_until', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Price List',
+                'verbose_name_plural': 'Price Lists',
+                'ordering': ['-effective_from'],
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderarchive',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='PriceListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_quantity', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0.01)])),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_items', to='pharmacy.medicine')),
+                ('price_list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='pharmacy.pricelist')),
+            ],
+            options={
+                'ordering': ['price_list', 'medicine', 'min_quantity'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pricelistitem',
+            constraint=models.UniqueConstraint(fields=('price_list', 'medicine', 'min_quantity'), name='price_item_tier_uniq'),
+        ),
+    ]
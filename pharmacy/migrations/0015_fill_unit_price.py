@@ -0,0 +1,43 @@
+# Snapshot the unit price of existing orders and archived orders.
+#
+# total_price was always the catalog price times the quantity, so the unit
+# price is recovered from it with one set-based UPDATE per table. The
+# archive table may live in another database; the hints let the router
+# skip the table a database does not hold.
+
+from django.db import migrations, models
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast, Round
+
+
+def unit_price():
+    # SQLite stores a whole-number total such as 7.00 as an INTEGER, and
+    # INTEGER / INTEGER truncates; divide as floats and round to cents
+    return Round(
+        Cast('total_price', FloatField()) / F('quantity'), 2,
+        output_field=models.DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+def fill_orders(apps, schema_editor):
+    Order = apps.get_model('pharmacy', 'Order')
+    db = schema_editor.connection.alias
+    Order.objects.using(db).filter(total_price__isnull=False).update(unit_price=unit_price())
+
+
+def fill_archive(apps, schema_editor):
+    OrderArchive = apps.get_model('pharmacy', 'OrderArchive')
+    db = schema_editor.connection.alias
+    OrderArchive.objects.using(db).filter(total_price__isnull=False).update(unit_price=unit_price())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0014_price_lists'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_orders, migrations.RunPython.noop, hints={'model_name': 'order'}),
+        migrations.RunPython(fill_archive, migrations.RunPython.noop, hints={'model_name': 'orderarchive'}),
+    ]
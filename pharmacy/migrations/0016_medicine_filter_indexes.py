@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0015_fill_unit_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['price', 'id'], name='medicine_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['stock', 'id'], name='medicine_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['expiry_date', 'id'], name='medicine_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-19 03:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0016_medicine_filter_indexes'),
+    ]
+
+    operations = [
+        # The composite index is built before the one it replaces is dropped
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['medicine', '-order_date', '-id'], name='order_medicine_date_idx'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='medicine',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='orders', to='pharmacy.medicine'),
+        ),
+    ]
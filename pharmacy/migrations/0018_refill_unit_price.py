@@ -0,0 +1,38 @@
+# Repair unit prices backfilled by an earlier 0015_fill_unit_price.
+#
+# That version divided with integer arithmetic on SQLite whenever the
+# total was a whole number, so 2 x 3.50 (7.00) was recorded at 3.00. Every
+# order's total is its unit price times its quantity, so rows where the two
+# disagree are refilled with the corrected expression; other rows, and
+# databases migrated with the corrected 0015, are left alone.
+
+from django.db import migrations
+from django.db.models import F
+
+
+def _refill(model, db):
+    from importlib import import_module
+    unit_price = import_module('pharmacy.migrations.0015_fill_unit_price').unit_price
+    model.objects.using(db).filter(total_price__isnull=False, unit_price__isnull=False).exclude(
+        total_price=F('unit_price') * F('quantity')
+    ).update(unit_price=unit_price())
+
+
+def refill_orders(apps, schema_editor):
+    _refill(apps.get_model('pharmacy', 'Order'), schema_editor.connection.alias)
+
+
+def refill_archive(apps, schema_editor):
+    _refill(apps.get_model('pharmacy', 'OrderArchive'), schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0017_order_medicine_date_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(refill_orders, migrations.RunPython.noop, hints={'model_name': 'order'}),
+        migrations.RunPython(refill_archive, migrations.RunPython.noop, hints={'model_name': 'orderarchive'}),
+    ]
@@ -0,0 +1,47 @@
+# Declare the admin prefix search indexes of 0007 on their models.
+#
+# 0007 created them with raw SQL, unknown to the migration state, so
+# SQLite's table rebuilds in 0011 (pharmacy_order) and 0013
+# (pharmacy_medicine) dropped them. Whatever is left of them is dropped
+# and they are created again as PrefixSearchIndex, which every later
+# rebuild recreates.
+
+from django.db import migrations
+import pharmacy.models
+
+INDEXES = [
+    ('order_customer_prefix_idx', 'pharmacy_order'),
+    ('medicine_name_prefix_idx', 'pharmacy_medicine'),
+]
+
+
+def drop_leftover_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    with connection.cursor() as cursor:
+        for name, table in INDEXES:
+            if name not in connection.introspection.get_constraints(cursor, table):
+                continue
+            if connection.vendor == 'mysql':
+                schema_editor.execute(f'DROP INDEX {quote(name)} ON {quote(table)}')
+            else:
+                schema_editor.execute(f'DROP INDEX {quote(name)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0018_refill_unit_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_leftover_indexes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=pharmacy.models.PrefixSearchIndex(fields=['name'], name='medicine_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=pharmacy.models.PrefixSearchIndex(fields=['customer_name'], name='order_customer_prefix_idx'),
+        ),
+    ]
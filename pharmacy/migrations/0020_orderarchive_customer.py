@@ -0,0 +1,83 @@
+# Link archived orders to their customer, as 0009-0011 did for orders.
+#
+# The archive may live in a separate database, so customers are looked up
+# (and, for orders archived before 0009, created) in the default database
+# under the same name_key 0010_populate_customers uses, and archived rows
+# are linked by customer_name.
+
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def link_archived_orders(apps, schema_editor):
+    Customer = apps.get_model('pharmacy', 'Customer')
+    OrderArchive = apps.get_model('pharmacy', 'OrderArchive')
+    db = schema_editor.connection.alias
+
+    keys_by_name = {}
+    raw_names = (
+        OrderArchive.objects.using(db).filter(customer__isnull=True)
+        .order_by().values_list('customer_name', flat=True).distinct()
+    )
+    for raw in raw_names.iterator():
+        keys_by_name[raw] = ' '.join(raw.split()).lower()
+    if not keys_by_name:
+        return
+
+    customers = Customer.objects.using(DEFAULT_DB_ALIAS)
+    customer_ids = {}
+    keys = sorted(set(keys_by_name.values()))
+    for start in range(0, len(keys), BATCH_SIZE):
+        customer_ids.update(
+            customers.filter(name_key__in=keys[start:start + BATCH_SIZE]).values_list('name_key', 'id')
+        )
+    missing = {}
+    for raw, key in keys_by_name.items():
+        if key not in customer_ids:
+            missing.setdefault(key, ' '.join(raw.split()))
+    if missing:
+        customers.bulk_create(
+            [Customer(name=name, name_key=key) for key, name in missing.items()],
+            batch_size=BATCH_SIZE
+        )
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), BATCH_SIZE):
+            customer_ids.update(
+                customers.filter(name_key__in=missing_keys[start:start + BATCH_SIZE]).values_list('name_key', 'id')
+            )
+
+    names_by_customer = {}
+    for raw, key in keys_by_name.items():
+        names_by_customer.setdefault(customer_ids[key], []).append(raw)
+    for customer_id, names in names_by_customer.items():
+        for start in range(0, len(names), BATCH_SIZE):
+            OrderArchive.objects.using(db).filter(
+                customer__isnull=True, customer_name__in=names[start:start + BATCH_SIZE]
+            ).update(customer_id=customer_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0019_name_prefix_search_indexes_in_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderarchive',
+            name='customer',
+            field=models.ForeignKey(db_constraint=False, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_orders', to='pharmacy.customer'),
+        ),
+        migrations.AddIndex(
+            model_name='orderarchive',
+            index=models.Index(fields=['customer', '-order_date', '-id'], name='archive_customer_date_idx'),
+        ),
+        migrations.RunPython(link_archived_orders, migrations.RunPython.noop, hints={'model_name': 'orderarchive'}),
+        migrations.AlterField(
+            model_name='orderarchive',
+            name='customer',
+            field=models.ForeignKey(db_constraint=False, db_index=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_orders', to='pharmacy.customer'),
+        ),
+    ]
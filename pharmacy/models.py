@@ -1,14 +1,59 @@
 """
 Models for the MediCart pharmacy application.
 """
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from collections import Counter
+from datetime import date
+from .cache import (
+    stock_cache,
+    bump_version_on_commit,
+    MEDICINES_VERSION,
+    ORDERS_VERSION,
+    PRICES_VERSION,
+)
+from .pricing import price_table
+from . import metrics
 import logging
+import random
 
 logger = logging.getLogger(__name__)
 
 
+class PrefixSearchIndex(models.Index):
+    """
+    Index serving case-insensitive prefix searches (istartswith) on one
+    column, such as the admin's '^' search fields.
+    
+    istartswith compiles to LIKE on SQLite, which only uses an index with
+    NOCASE collation, and to UPPER(col::text) LIKE UPPER(...) on PostgreSQL,
+    which needs a matching expression index with pattern ops. MySQL
+    collations are case-insensitive, so a plain index serves LIKE 'x%'.
+    Declared in Meta.indexes, the index is rebuilt with its table.
+    """
+    
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        from django.db.models.functions import Cast, Collate, Upper
+        field = self.fields[0]
+        vendor = schema_editor.connection.vendor
+        if vendor == 'sqlite':
+            index = models.Index(Collate(field, 'nocase'), name=self.name)
+        elif vendor == 'postgresql':
+            from django.contrib.postgres.indexes import OpClass
+            index = models.Index(OpClass(Upper(Cast(field, models.TextField())), 'text_pattern_ops'), name=self.name)
+        else:
+            index = models.Index(fields=[field], name=self.name)
+        return index.create_sql(model, schema_editor, using=using, **kwargs)
+
+
+class TransitionConflict(Exception):
+    """Orders changed status while a bulk transition was being applied."""
+
+
 class Medicine(models.Model):
     """Model representing a medicine in the pharmacy."""
     
@@ -21,6 +66,14 @@ class Medicine(models.Model):
     )
     stock = models.IntegerField(validators=[MinValueValidator(0)])
     expiry_date = models.DateField()
+    # Set by the sweep_expired command so order paths can exclude expired
+    # stock with an indexed flag instead of comparing dates on every request.
+    is_expired = models.BooleanField(default=False, db_index=True)
+    # Incremented on every write, including stock deductions
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # When non-zero, orders take stock from this many StockShard rows and
+    # `stock` is only brought up to date when the shards are folded
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -28,6 +81,14 @@ class Medicine(models.Model):
         ordering = ['name']
         verbose_name = 'Medicine'
         verbose_name_plural = 'Medicines'
+        indexes = [
+            # Range filters and orderings of the medicine API (see MedicineFilter)
+            models.Index(fields=['price', 'id'], name='medicine_price_idx'),
+            models.Index(fields=['stock', 'id'], name='medicine_stock_idx'),
+            models.Index(fields=['expiry_date', 'id'], name='medicine_expiry_idx'),
+            # Admin search by name prefix
+            PrefixSearchIndex(fields=['name'], name='medicine_name_prefix_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - ${self.price}"
@@ -38,9 +99,311 @@ class Medicine(models.Model):
     
     def clean(self):
         """Validate model fields."""
-        from django.utils import timezone
         if self.expiry_date and self.expiry_date < timezone.now().date():
             raise ValidationError('Expiry date cannot be in the past.')
+    
+    def save(self, *args, **kwargs):
+        """Override save to clear the expired flag when expiry is extended."""
+        if (
+            self.is_expired
+            and isinstance(self.expiry_date, date)
+            and self.expiry_date >= timezone.now().date()
+        ):
+            self.is_expired = False
+        self.version = (self.version or 0) + 1
+        action = 'created' if self._state.adding else 'updated'
+        if action == 'updated' and kwargs.get('update_fields') is None:
+            # stock_shards only changes through set_stock_shards(), so a
+            # stale instance must not write it back
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'stock_shards'
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.stock_shards and action == 'updated':
+                # Subtract what the shards sold since the last fold and hand
+                # out the saved stock again
+                self.stock, self.version = StockShard.fold(self.pk)
+            ChangeLogEntry.record(('medicine', self.pk, action, self.change_data()))
+        # A full save may add stock, so cached rows everywhere are suspect once
+        # it commits; invalidating earlier lets a reader re-cache the old row
+        transaction.on_commit(stock_cache.invalidate)
+        bump_version_on_commit(MEDICINES_VERSION)
+    
+    def delete(self, *args, **kwargs):
+        """Override delete to bump the catalog version."""
+        # Archived orders may live in another database, so no foreign key protects them
+        archived = OrderArchive.objects.filter(medicine_id=self.pk)
+        if archived.exists():
+            raise models.ProtectedError(
+                f"Cannot delete {self.name}: it is referenced by archived orders.",
+                set(archived[:10])
+            )
+        pk = self.pk
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            ChangeLogEntry.record(('medicine', pk, 'deleted', {}))
+        bump_version_on_commit(MEDICINES_VERSION)
+        return result
+    
+    def change_data(self):
+        """Fields published to the change feed for this medicine."""
+        return {
+            'name': self.name,
+            'price': self.price,
+            'stock': self.stock,
+            'is_expired': self.is_expired,
+            'version': self.version,
+        }
+    
+    def set_stock_shards(self, count):
+        """
+        Split this medicine's stock across `count` StockShard rows, or fold
+        it back into this row for good when `count` is 0.
+        """
+        with transaction.atomic():
+            stock, version = StockShard.fold(self.pk)
+            StockShard.objects.filter(medicine_id=self.pk).delete()
+            StockShard.objects.bulk_create([
+                StockShard(medicine_id=self.pk, index=index, stock=share, allotted=share)
+                for index, share in enumerate(StockShard.split(stock, count))
+            ])
+            Medicine.objects.filter(pk=self.pk).update(stock_shards=count)
+        self.stock, self.version, self.stock_shards = stock, version, count
+        logger.info(f"Stock of {self.name} split across {count} shards")
+
+
+class StockShard(models.Model):
+    """
+    A slice of a hot medicine's stock that orders can take from without
+    writing the Medicine row.
+    
+    Every order for a medicine updates its row, so concurrent orders for
+    one popular medicine queue on that row lock. With Medicine.stock_shards
+    set, an order instead takes its units from a random shard, and the
+    compact_stock command periodically folds what the shards sold back into
+    Medicine.stock. Between folds Medicine.stock overstates the stock by at
+    most what was sold since the last fold; exact_stock() is always exact.
+    """
+    
+    medicine = models.ForeignKey(
+        Medicine,
+        on_delete=models.CASCADE,
+        related_name='shards',
+        db_index=False
+    )
+    index = models.PositiveSmallIntegerField()
+    # Units left in this shard
+    stock = models.IntegerField()
+    # Units handed to this shard at the last fold
+    allotted = models.IntegerField()
+    
+    class Meta:
+        ordering = ['medicine', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['medicine', 'index'], name='stock_shard_medicine_index_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.medicine_id}/{self.index}: {self.stock} of {self.allotted}"
+    
+    @staticmethod
+    def split(total, count):
+        """Divide `total` units into `count` shares that differ by at most one."""
+        base, extra = divmod(total, count) if count else (0, 0)
+        return [base + (index < extra) for index in range(count)]
+    
+    @classmethod
+    def exact_stock(cls, medicine_id):
+        """Medicine.stock less the units the shards sold since the last fold."""
+        stock = Medicine.objects.filter(pk=medicine_id).values_list('stock', flat=True).get()
+        sold = sum(
+            allotted - left for allotted, left
+            in cls.objects.filter(medicine_id=medicine_id).values_list('allotted', 'stock')
+        )
+        return max(stock - sold, 0)
+    
+    @classmethod
+    def deduct(cls, medicine_id, quantity, shard_count):
+        """
+        Take `quantity` units from the medicine's shards and return whether
+        there were enough. A random shard is tried first, then the fullest
+        one, and only then are the shards folded and drained together.
+        """
+        shards = cls.objects.filter(medicine_id=medicine_id)
+        take = {'stock': F('stock') - quantity}
+        if shards.filter(index=random.randrange(shard_count), stock__gte=quantity).update(**take):
+            metrics.stock_shard_deductions.inc(path='shard')
+            return True
+        
+        fullest = shards.filter(stock__gte=quantity).order_by('-stock').values_list('index', flat=True).first()
+        if fullest is not None and shards.filter(index=fullest, stock__gte=quantity).update(**take):
+            metrics.stock_shard_deductions.inc(path='fallback')
+            return True
+        
+        # No shard holds enough on its own; stock added to the Medicine row
+        # since the last fold may still cover the order
+        metrics.stock_shard_deductions.inc(path='fold')
+        return cls.fold(medicine_id, take=quantity) is not None
+    
+    @classmethod
+    def fold(cls, medicine_id, take=0):
+        """
+        Subtract the units sold by a medicine's shards from Medicine.stock,
+        then split the result evenly across the shards again.
+        
+        When `take` is given those units are deducted in the same step, or
+        None is returned without writing anything if there are not enough.
+        Otherwise returns the medicine's new (stock, version).
+        """
+        with transaction.atomic():
+            # Medicine row first, shards second, like every other writer;
+            # NO KEY UPDATE does not block orders inserting references to it
+            stock, version = Medicine.objects.select_for_update(
+                no_key=connection.features.has_select_for_no_key_update
+            ).values_list('stock', 'version').get(pk=medicine_id)
+            shards = list(cls.objects.select_for_update().filter(medicine_id=medicine_id).order_by('index'))
+            sold = sum(shard.allotted - shard.stock for shard in shards)
+            new_stock = stock - sold - take
+            if new_stock < 0:
+                if take:
+                    return None
+                # Stock was lowered below what the shards had already sold
+                logger.warning(f"Medicine {medicine_id} oversold by {-new_stock} units")
+                new_stock = 0
+            
+            if new_stock != stock:
+                version += 1
+                Medicine.objects.filter(pk=medicine_id).update(
+                    stock=new_stock, version=version, updated_at=timezone.now()
+                )
+                ChangeLogEntry.record(
+                    ('medicine', medicine_id, 'updated', {'stock': new_stock, 'version': version})
+                )
+            changed = []
+            for shard, share in zip(shards, cls.split(new_stock, len(shards))):
+                if shard.stock != share or shard.allotted != share:
+                    shard.stock = shard.allotted = share
+                    changed.append(shard)
+            cls.objects.bulk_update(changed, ['stock', 'allotted'])
+        
+        if new_stock != stock:
+            bump_version_on_commit(MEDICINES_VERSION)
+        return new_stock, version
+
+
+class Customer(models.Model):
+    """A customer, deduplicated by a case- and whitespace-insensitive name."""
+    
+    name = models.CharField(max_length=200, db_index=True)
+    # normalize_name(name); orders find their customer by this key
+    name_key = models.CharField(max_length=200, unique=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Customer'
+        verbose_name_plural = 'Customers'
+    
+    def __str__(self):
+        return self.name
+    
+    @staticmethod
+    def clean_name(name):
+        """Collapse runs of whitespace, the form in which names are displayed."""
+        return ' '.join(name.split())
+    
+    @classmethod
+    def normalize_name(cls, name):
+        """Return the key under which equivalent spellings of a name match."""
+        return cls.clean_name(name).lower()
+    
+    @classmethod
+    def for_name(cls, name):
+        """Return the customer called `name`, creating it on first use."""
+        customer, _ = cls.objects.get_or_create(
+            name_key=cls.normalize_name(name),
+            defaults={'name': cls.clean_name(name)}
+        )
+        return customer
+    
+    def save(self, *args, **kwargs):
+        self.name = self.clean_name(self.name)
+        self.name_key = self.normalize_name(self.name)
+        super().save(*args, **kwargs)
+
+
+class PriceList(models.Model):
+    """
+    Medicine prices in effect from `effective_from` until `effective_until`.
+    Orders are priced by pharmacy.pricing.price_table.
+    """
+    
+    name = models.CharField(max_length=200)
+    effective_from = models.DateTimeField(default=timezone.now)
+    # Open-ended when empty
+    effective_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-effective_from']
+        verbose_name = 'Price List'
+        verbose_name_plural = 'Price Lists'
+    
+    def __str__(self):
+        return self.name
+    
+    def clean(self):
+        """Validate model fields."""
+        if self.effective_until and self.effective_until <= self.effective_from:
+            raise ValidationError('A price list must end after it takes effect.')
+    
+    def save(self, *args, **kwargs):
+        """Override save to reload price tables in every process."""
+        super().save(*args, **kwargs)
+        bump_version_on_commit(PRICES_VERSION)
+    
+    def delete(self, *args, **kwargs):
+        """Override delete to reload price tables in every process."""
+        result = super().delete(*args, **kwargs)
+        bump_version_on_commit(PRICES_VERSION)
+        return result
+
+
+class PriceListItem(models.Model):
+    """The unit price of a medicine in a price list from `min_quantity` units up."""
+    
+    price_list = models.ForeignKey(PriceList, on_delete=models.CASCADE, related_name='items')
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='price_items')
+    min_quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
+    unit_price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(0.01)]
+    )
+    
+    class Meta:
+        ordering = ['price_list', 'medicine', 'min_quantity']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['price_list', 'medicine', 'min_quantity'], name='price_item_tier_uniq'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.medicine_id} from {self.min_quantity}: ${self.unit_price}"
+    
+    def save(self, *args, **kwargs):
+        """Override save to reload price tables in every process."""
+        super().save(*args, **kwargs)
+        bump_version_on_commit(PRICES_VERSION)
+    
+    def delete(self, *args, **kwargs):
+        """Override delete to reload price tables in every process."""
+        result = super().delete(*args, **kwargs)
+        bump_version_on_commit(PRICES_VERSION)
+        return result
 
 
 class Order(models.Model):
@@ -54,30 +417,69 @@ class Order(models.Model):
         ('Cancelled', 'Cancelled'),
     ]
     
+    # Allowed status changes; Delivered and Cancelled are final
+    TRANSITIONS = {
+        'Pending': {'Processing', 'Shipped', 'Delivered', 'Cancelled'},
+        'Processing': {'Shipped', 'Delivered', 'Cancelled'},
+        'Shipped': {'Delivered'},
+        'Delivered': set(),
+        'Cancelled': set(),
+    }
+    
     customer_name = models.CharField(max_length=200)
+    # Resolved from customer_name on save; indexed by order_customer_date_idx
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.PROTECT,
+        related_name='orders',
+        db_index=False,
+        editable=False
+    )
+    # Indexed by order_medicine_date_idx
     medicine = models.ForeignKey(
         Medicine,
         on_delete=models.PROTECT,
-        related_name='orders'
+        related_name='orders',
+        db_index=False
     )
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
-    order_date = models.DateTimeField(auto_now_add=True)
+    order_date = models.DateTimeField(default=timezone.now, editable=False)
     status = models.CharField(
         max_length=20,
         choices=STATUS_CHOICES,
         default='Pending'
     )
+    # Price per unit when the order was placed, so later price changes
+    # leave the order as it was
+    unit_price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        editable=False,
+        null=True
+    )
     total_price = models.DecimalField(
         max_digits=10,
         decimal_places=2,
         editable=False,
         null=True
     )
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-order_date']
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
+        indexes = [
+            # Keyset pagination seeks for the order list, optionally by status
+            models.Index(fields=['-order_date', '-id'], name='order_date_id_idx'),
+            models.Index(fields=['status', '-order_date', '-id'], name='order_status_date_idx'),
+            # Per-customer order history, newest first
+            models.Index(fields=['customer', '-order_date', '-id'], name='order_customer_date_idx'),
+            # Orders of one medicine in list order (see OrderFilter)
+            models.Index(fields=['medicine', '-order_date', '-id'], name='order_medicine_date_idx'),
+            # Admin search by customer name prefix
+            PrefixSearchIndex(fields=['customer_name'], name='order_customer_prefix_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.customer_name}"
@@ -86,44 +488,370 @@ class Order(models.Model):
         """Override save to update stock and calculate total price."""
         is_new = self.pk is None
         
+        update_fields = kwargs.get('update_fields')
+        resolve_customer = update_fields is None or 'customer_name' in update_fields
+        
         if is_new:
-            # Check if medicine has enough stock
-            if self.medicine.stock < self.quantity:
-                logger.warning(
-                    f"Insufficient stock for {self.medicine.name}. "
-                    f"Available: {self.medicine.stock}, Requested: {self.quantity}"
-                )
-                raise ValidationError(
-                    f"Insufficient stock. Only {self.medicine.stock} units available."
+            with transaction.atomic():
+                # The one read of the medicine, current and locked until commit
+                self.medicine = medicine = self._read_medicine()
+                stock_cache.store(medicine)
+                
+                # Expired stock is flagged by the sweep_expired command
+                if medicine.is_expired:
+                    logger.warning(f"Rejected order for expired medicine {medicine.name}")
+                    raise ValidationError({
+                        'medicine': f"{medicine.name} has expired and cannot be ordered."
+                    })
+                
+                # Check if medicine has enough stock
+                if medicine.stock < self.quantity:
+                    metrics.insufficient_stock.inc(source='model')
+                    logger.warning(
+                        f"Insufficient stock for {medicine.name}. "
+                        f"Available: {medicine.stock}, Requested: {self.quantity}"
+                    )
+                    raise ValidationError({
+                        'quantity': f"Insufficient stock. Only {medicine.stock} units available."
+                    })
+                
+                # Only an order that passed the checks creates its customer,
+                # and a later rollback takes the customer with it
+                if resolve_customer:
+                    self._resolve_customer()
+                
+                # Snapshot the price list or catalog price for this quantity
+                self.unit_price = price_table.unit_price(self.medicine_id, self.quantity, medicine.price)
+                self.total_price = self.unit_price * self.quantity
+                
+                # Save the order first
+                super().save(*args, **kwargs)
+                
+                # Reduce stock with a conditional update so concurrent orders
+                # cannot oversell, and without invalidating the stock cache
+                sharded = medicine.stock_shards
+                if sharded:
+                    updated = StockShard.deduct(self.medicine_id, self.quantity, sharded)
+                else:
+                    updated = Medicine.objects.filter(
+                        pk=self.medicine_id,
+                        stock__gte=self.quantity
+                    ).update(
+                        stock=F('stock') - self.quantity,
+                        version=F('version') + 1,
+                        updated_at=timezone.now()
+                    )
+                if not updated:
+                    metrics.insufficient_stock.inc(source='model')
+                    logger.warning(
+                        f"Insufficient stock for {medicine.name} at commit time. "
+                        f"Requested: {self.quantity}"
+                    )
+                    # The order insert is rolled back with the transaction
+                    self.pk = None
+                    raise ValidationError({'quantity': "Insufficient stock for this order."})
+                
+                ChangeLogEntry.record(
+                    ('order', self.pk, 'created', self.change_data()),
+                    ('medicine', self.medicine_id, 'updated', {'stock_delta': -self.quantity}),
                 )
             
-            # Calculate total price
-            self.total_price = self.medicine.price * self.quantity
-            
-            # Save the order first
-            super().save(*args, **kwargs)
-            
-            # Reduce stock
-            self.medicine.stock -= self.quantity
-            self.medicine.save()
+            if not sharded:
+                # A sharded medicine's row is unchanged until the next fold
+                self.medicine.stock -= self.quantity
+                self.medicine.version += 1
+            stock_cache.deduct(self.medicine_id, self.quantity)
+            bump_version_on_commit(ORDERS_VERSION, MEDICINES_VERSION)
+            metrics.orders_created.inc()
+            metrics.stock_deducted.inc(self.quantity)
             
             logger.info(
                 f"New order created: {self.id} for {self.customer_name}. "
                 f"Medicine: {self.medicine.name}, Quantity: {self.quantity}"
             )
         else:
-            # For updates, just save
-            super().save(*args, **kwargs)
+            with transaction.atomic():
+                if resolve_customer:
+                    self._resolve_customer()
+                super().save(*args, **kwargs)
+                ChangeLogEntry.record(('order', self.pk, 'updated', self.change_data()))
+            bump_version_on_commit(ORDERS_VERSION)
             logger.info(f"Order {self.id} updated. Status: {self.status}")
     
+    def _read_medicine(self):
+        """
+        Read the ordered medicine inside the order's transaction. The row is
+        locked, so nothing changes it between the checks and the deduction,
+        except for sharded medicines: their orders only write a shard, and
+        queueing them on the medicine row is what sharding avoids.
+        """
+        medicines = Medicine.objects.all()
+        cached = stock_cache.get(self.medicine_id)
+        if cached is None or not cached.shards:
+            # NO KEY UPDATE does not block orders inserting references to it
+            medicines = medicines.select_for_update(no_key=connection.features.has_select_for_no_key_update)
+        try:
+            return medicines.get(pk=self.medicine_id)
+        except Medicine.DoesNotExist:
+            raise ValidationError({'medicine': f"Medicine {self.medicine_id} does not exist."})
+    
+    def _resolve_customer(self):
+        """Point the order at the Customer its customer_name belongs to."""
+        if (
+            Order.customer.is_cached(self)
+            and self.customer is not None
+            and self.customer.name_key == Customer.normalize_name(self.customer_name)
+        ):
+            return
+        self.customer = Customer.for_name(self.customer_name)
+    
+    def can_transition_to(self, new_status):
+        """Whether the transition graph allows moving this order to `new_status`."""
+        return new_status in self.TRANSITIONS.get(self.status, ())
+    
+    def transition_to(self, new_status):
+        """Move this order to `new_status`, restocking it if cancelled."""
+        result, previous = Order.bulk_transition([self.pk], new_status)[self.pk]
+        if result == 'not_found':
+            raise Order.DoesNotExist(f"Order {self.pk} no longer exists.")
+        if result == 'invalid':
+            raise ValidationError(
+                f"Cannot change order status from {previous} to {new_status}."
+            )
+        self.refresh_from_db(fields=['status', 'updated_at'])
+    
+    @classmethod
+    def bulk_transition(cls, order_ids, new_status):
+        """
+        Move many orders to `new_status` where the transition graph allows it.
+        
+        The orders are locked and read once, then moved with one conditional
+        UPDATE per current status. Cancelled orders return their quantity to
+        stock with one UPDATE per medicine. Returns {order_id: (result,
+        previous_status)} in input order, where result is 'updated',
+        'unchanged', 'invalid' or 'not_found'.
+        """
+        if new_status not in cls.TRANSITIONS:
+            raise ValidationError(f"Invalid status: {new_status}.")
+        
+        results = {pk: ('not_found', None) for pk in order_ids}
+        by_status = {}
+        restock = Counter()
+        now = timezone.now()
+        
+        with transaction.atomic():
+            rows = (
+                cls.objects.select_for_update()
+                .filter(pk__in=list(results))
+                .order_by()
+                .values_list('id', 'status', 'medicine_id', 'quantity')
+            )
+            for pk, current, medicine_id, quantity in rows:
+                if current == new_status:
+                    results[pk] = ('unchanged', current)
+                elif new_status in cls.TRANSITIONS[current]:
+                    results[pk] = ('updated', current)
+                    by_status.setdefault(current, []).append(pk)
+                    if new_status == 'Cancelled':
+                        restock[medicine_id] += quantity
+                else:
+                    results[pk] = ('invalid', current)
+            
+            for current, pks in by_status.items():
+                # The status condition turns a concurrent change into a
+                # count mismatch instead of a silently skipped transition
+                updated = cls.objects.filter(pk__in=pks, status=current).update(
+                    status=new_status, updated_at=now
+                )
+                if updated != len(pks):
+                    raise TransitionConflict(
+                        f"{len(pks) - updated} {current} orders changed status concurrently."
+                    )
+            
+            for medicine_id, quantity in restock.items():
+                Medicine.objects.filter(pk=medicine_id).update(
+                    stock=F('stock') + quantity,
+                    version=F('version') + 1,
+                    updated_at=now
+                )
+            
+            ChangeLogEntry.record(
+                *(
+                    ('order', pk, 'updated', {'status': new_status, 'previous_status': current})
+                    for current, pks in by_status.items() for pk in pks
+                ),
+                *(
+                    ('medicine', medicine_id, 'updated', {'stock_delta': quantity})
+                    for medicine_id, quantity in restock.items()
+                ),
+            )
+        
+        moved = sum(len(pks) for pks in by_status.values())
+        if moved:
+            bump_version_on_commit(ORDERS_VERSION)
+            metrics.order_transitions.inc(moved, status=new_status)
+            logger.info(f"Moved {moved} orders to {new_status}")
+        if restock:
+            # Added stock makes cached rows stale in every process once committed
+            transaction.on_commit(stock_cache.invalidate)
+            bump_version_on_commit(MEDICINES_VERSION)
+            metrics.stock_restocked.inc(sum(restock.values()))
+            logger.info(f"Restocked {sum(restock.values())} units across {len(restock)} medicines")
+        return results
+    
     def delete(self, *args, **kwargs):
         """Override delete to restore stock."""
-        # Restore stock when order is deleted
-        if self.status == 'Pending':
-            self.medicine.stock += self.quantity
-            self.medicine.save()
-            logger.info(
-                f"Order {self.id} deleted. Stock restored for {self.medicine.name}"
-            )
-        super().delete(*args, **kwargs)
+        pk = self.pk
+        with transaction.atomic():
+            # Restore stock when order is deleted
+            if self.status == 'Pending':
+                self.medicine.stock += self.quantity
+                self.medicine.save()
+                logger.info(
+                    f"Order {self.id} deleted. Stock restored for {self.medicine.name}"
+                )
+            result = super().delete(*args, **kwargs)
+            ChangeLogEntry.record(('order', pk, 'deleted', {}))
+        bump_version_on_commit(ORDERS_VERSION)
+        return result
+    
+    def change_data(self):
+        """Fields published to the change feed for this order."""
+        return {
+            'customer': self.customer_id,
+            'medicine': self.medicine_id,
+            'quantity': self.quantity,
+            'status': self.status,
+            'unit_price': self.unit_price,
+            'total_price': self.total_price,
+        }
+
+
+class OrderArchive(models.Model):
+    """
+    Closed orders moved out of the Order table by the archive_orders command.
+    
+    Rows keep their original order id. The table may live in a separate
+    database (see ORDER_ARCHIVE and pharmacy.routers), so the customer and
+    medicine references are not enforced by database constraints.
+    """
+    
+    id = models.BigIntegerField(primary_key=True)
+    customer_name = models.CharField(max_length=200)
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        editable=False,
+        related_name='archived_orders'
+    )
+    medicine = models.ForeignKey(
+        Medicine,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='archived_orders'
+    )
+    quantity = models.IntegerField()
+    order_date = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    # Columns copied from Order when archiving
+    ORDER_FIELDS = [
+        'id', 'customer_name', 'customer_id', 'medicine_id', 'quantity',
+        'order_date', 'status', 'unit_price', 'total_price', 'updated_at',
+    ]
+    
+    class Meta:
+        ordering = ['-order_date']
+        verbose_name = 'Archived Order'
+        verbose_name_plural = 'Archived Orders'
+        indexes = [
+            models.Index(fields=['-order_date', '-id'], name='archive_date_id_idx'),
+            # A customer's order history, newest first, as order_customer_date_idx
+            models.Index(fields=['customer', '-order_date', '-id'], name='archive_customer_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Archived order #{self.id} - {self.customer_name}"
+
 
+class ChangeLogEntry(models.Model):
+    """
+    Append-only log of medicine and order changes, served by /api/changes/.
+    
+    Entries are written in the transaction that makes the change, so the
+    log never shows a change that was rolled back. `seq` grows with every
+    entry; consumers remember the last one they processed and ask for
+    what follows. Medicine entries carry either the saved fields or, for
+    order placements and cancellations, a `stock_delta`.
+    """
+    
+    ENTITY_CHOICES = [
+        ('medicine', 'Medicine'),
+        ('order', 'Order'),
+    ]
+    ACTION_CHOICES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('deleted', 'Deleted'),
+    ]
+    
+    seq = models.BigAutoField(primary_key=True)
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    entity_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    data = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['seq']
+        verbose_name = 'Change Log Entry'
+        verbose_name_plural = 'Change Log Entries'
+    
+    def __str__(self):
+        return f"#{self.seq} {self.entity} {self.entity_id} {self.action}"
+    
+    @classmethod
+    def record(cls, *changes):
+        """Append (entity, entity_id, action, data) tuples in one INSERT."""
+        cls.objects.bulk_create([
+            cls(entity=entity, entity_id=entity_id, action=action, data=data)
+            for entity, entity_id, action, data in changes
+        ])
+    
+    def as_dict(self):
+        return {
+            'seq': self.seq,
+            'entity': self.entity,
+            'id': self.entity_id,
+            'action': self.action,
+            'data': self.data,
+            'at': self.created_at,
+        }
+
+
+class ExpirySweepLog(models.Model):
+    """Audit record written for every chunk processed by sweep_expired."""
+    
+    run_id = models.CharField(max_length=32, db_index=True)
+    first_medicine_id = models.BigIntegerField()
+    last_medicine_id = models.BigIntegerField()
+    scanned = models.IntegerField()
+    flagged = models.IntegerField()
+    swept_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-swept_at']
+        verbose_name = 'Expiry Sweep Log'
+        verbose_name_plural = 'Expiry Sweep Logs'
+    
+    def __str__(self):
+        return (
+            f"Sweep {self.run_id}: medicines {self.first_medicine_id}-"
+            f"{self.last_medicine_id} ({self.flagged} flagged)"
+        )
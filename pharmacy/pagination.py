@@ -0,0 +1,266 @@
+"""
+Keyset pagination for the template list views.
+
+Pages are addressed by a cursor holding the ordering-key values of the
+first or last row on the neighbouring page, so fetching page N is an index
+seek costing the same as page 1. Totals come from SQLite's sqlite_stat1
+statistics when available, or from a COUNT(*), cached for a short time.
+The same estimates back EstimatedCountPaginator, used by the admin.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import cached_property
+from hashlib import md5
+from operator import attrgetter
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connection, DatabaseError
+from django.db.models import Q
+from django.utils.http import urlencode
+import json
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_row_estimate(model):
+    """Return the row count recorded by ANALYZE for a model's table, or None."""
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1",
+                [model._meta.db_table]
+            )
+            row = cursor.fetchone()
+    except DatabaseError:
+        # sqlite_stat1 only exists once ANALYZE has been run
+        return None
+    if not row:
+        return None
+    return int(row[0].split()[0])
+
+
+def estimate_count(queryset):
+    """
+    Return a cheap total for a queryset: the ANALYZE estimate for an
+    unfiltered table, otherwise an exact COUNT(*). Either is cached briefly.
+    """
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # Filters that can match nothing, such as an empty id list
+        return 0
+    key = 'pharmacy:count:' + md5(f'{sql}{params}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        if not queryset.query.where:
+            count = sqlite_row_estimate(queryset.model)
+        if count is None:
+            count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class EstimatedCountPaginator(Paginator):
+    """Django Paginator whose total comes from estimate_count()."""
+
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+
+class KeysetPaginator:
+    """Paginate a queryset by seeking on its ordering keys."""
+
+    def __init__(self, queryset, per_page, ordering, params=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        # [(field name, descending?)], the last key must be unique
+        self.keys = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.params = {k: v for k, v in (params or {}).items() if v}
+
+    @cached_property
+    def count(self):
+        return estimate_count(self.queryset)
+
+    @cached_property
+    def num_pages(self):
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def encode_cursor(self, obj):
+        values = []
+        for name, _ in self.keys:
+            value = getattr(obj, name)
+            values.append(value if isinstance(value, (int, float, str)) else str(value))
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        """Return the key values held by a cursor, or None if it is invalid."""
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.keys):
+                return None
+            return [
+                self.queryset.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.keys, values)
+            ]
+        except (ValueError, TypeError, ValidationError, FieldDoesNotExist):
+            return None
+
+    def _seek(self, values, forward):
+        """Filter to rows strictly after (or before) the given key values."""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.keys, values):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _rows(self, queryset, values, forward):
+        """Up to per_page + 1 rows of `queryset` past the key values, in fetch order."""
+        queryset = queryset.order_by(*[
+            ('-' if descending == forward else '') + name
+            for name, descending in self.keys
+        ])
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        return list(queryset[:self.per_page + 1])
+
+    def _fetch(self, values, forward):
+        rows = self._rows(self.queryset, values, forward)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        return rows, has_more
+
+    def get_page(self, query):
+        """Return the KeysetPage selected by request query parameters."""
+        try:
+            number = max(int(query.get('page', 1)), 1)
+        except (TypeError, ValueError):
+            number = 1
+
+        after = self.decode_cursor(query['after']) if query.get('after') else None
+        before = self.decode_cursor(query['before']) if query.get('before') else None
+
+        if query.get('last'):
+            rows, has_previous = self._fetch(None, forward=False)
+            has_next = False
+            number = self.num_pages
+        elif before is not None:
+            rows, has_previous = self._fetch(before, forward=False)
+            has_next = True
+        elif after is not None:
+            rows, has_next = self._fetch(after, forward=True)
+            has_previous = True
+        else:
+            rows, has_next = self._fetch(None, forward=True)
+            has_previous = False
+            number = 1
+
+        # Estimated totals can drift, keep the page number plausible
+        if has_previous:
+            number = max(number, 2)
+        else:
+            number = 1
+        return KeysetPage(rows, number, has_previous, has_next, self)
+
+
+class MergedKeysetPaginator(KeysetPaginator):
+    """
+    Keyset pagination over several querysets sharing the ordering keys, such
+    as hot and archived orders, as one list. Each page seeks every queryset
+    on its own index and merges the rows. A row found in more than one
+    queryset, as left by an interrupted move between them, is listed once,
+    from the first queryset.
+    """
+
+    def __init__(self, querysets, per_page, ordering, params=None):
+        # Cursors are decoded against the first queryset's model
+        super().__init__(querysets[0], per_page, ordering, params=params)
+        self.querysets = querysets
+
+    @cached_property
+    def count(self):
+        return sum(estimate_count(queryset) for queryset in self.querysets)
+
+    def _fetch(self, values, forward):
+        rows = [row for queryset in self.querysets for row in self._rows(queryset, values, forward)]
+        # Stable sorts, least significant key first, keep the first queryset's duplicate first
+        for name, descending in reversed(self.keys):
+            rows.sort(key=attrgetter(name), reverse=descending == forward)
+        merged, seen = [], set()
+        for row in rows:
+            if row.pk not in seen:
+                seen.add(row.pk)
+                merged.append(row)
+        rows = merged
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        return rows, has_more
+
+
+class KeysetPage:
+    """A page of rows with navigation links, mirroring Django's Page."""
+
+    def __init__(self, object_list, number, has_previous, has_next, paginator):
+        self.object_list = object_list
+        self.number = number
+        self._has_previous = has_previous
+        self._has_next = has_next
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def _query(self, **params):
+        return urlencode({**self.paginator.params, **params})
+
+    @property
+    def first_query(self):
+        return self._query()
+
+    @property
+    def last_query(self):
+        return self._query(last=1)
+
+    @property
+    def previous_query(self):
+        if not self.object_list:
+            return self.first_query
+        return self._query(
+            before=self.paginator.encode_cursor(self.object_list[0]),
+            page=self.number - 1
+        )
+
+    @property
+    def next_query(self):
+        if not self.object_list:
+            return self.first_query
+        return self._query(
+            after=self.paginator.encode_cursor(self.object_list[-1]),
+            page=self.number + 1
+        )
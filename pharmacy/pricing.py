@@ -0,0 +1,76 @@
+"""
+Unit prices from effective-dated price lists with quantity tiers.
+
+A PriceListItem sets the unit price of one medicine from a minimum quantity
+upwards while its PriceList is in effect. An order is priced by the list
+that took effect most recently, at the highest tier its quantity reaches;
+medicines without an applicable item sell at Medicine.price.
+
+Every process keeps all current and future tiers in a PriceTable loaded
+with one query and dropped whenever the shared 'prices' version changes,
+so pricing an order reads no price rows. Lists that start or end later are
+loaded ahead of time and selected by date on each lookup.
+"""
+from django.db.models import Q
+from django.utils import timezone
+from .cache import get_version, PRICES_VERSION
+import threading
+
+
+class PriceTable:
+    """Per-process table of price list tiers, keyed by medicine id."""
+
+    def __init__(self):
+        self._tiers = None
+        self._version = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _current(self):
+        # Read the version before loading, so a change committed while
+        # loading is picked up by the next lookup
+        version = get_version(PRICES_VERSION)
+        with self._lock:
+            if self._tiers is None or version != self._version:
+                self._tiers = self._load()
+                self._version = version
+                self.loads += 1
+            return self._tiers
+
+    def _load(self):
+        from .models import PriceListItem
+        rows = (
+            PriceListItem.objects
+            .filter(Q(price_list__effective_until__isnull=True) | Q(price_list__effective_until__gt=timezone.now()))
+            # Newest list first, then highest tier first
+            .order_by('medicine_id', '-price_list__effective_from', '-min_quantity')
+            .values_list(
+                'medicine_id', 'price_list__effective_from', 'price_list__effective_until',
+                'min_quantity', 'unit_price'
+            )
+        )
+        tiers = {}
+        for medicine_id, *tier in rows:
+            tiers.setdefault(medicine_id, []).append(tuple(tier))
+        return tiers
+
+    def unit_price(self, medicine_id, quantity, base_price, at=None):
+        """The unit price for `quantity` units at time `at` (default: now)."""
+        at = at or timezone.now()
+        for effective_from, effective_until, min_quantity, price in self._current().get(medicine_id, ()):
+            if (
+                min_quantity <= quantity
+                and effective_from <= at
+                and (effective_until is None or at < effective_until)
+            ):
+                return price
+        return base_price
+
+    def clear(self):
+        """Drop the table held by this process."""
+        with self._lock:
+            self._tiers = None
+            self._version = None
+
+
+price_table = PriceTable()
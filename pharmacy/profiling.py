@@ -0,0 +1,168 @@
+"""
+Sampling profiler for individual requests.
+
+ProfilingMiddleware (pharmacy/middleware.py) profiles a random
+PROFILING['SAMPLE_RATE'] share of requests, plus any request whose
+X-Profile header carries PROFILING['TOKEN']. While the view runs, a helper
+thread records the request thread's stack every PROFILING['INTERVAL']
+seconds. Samples are aggregated per URL name in this process and, with
+PROFILING['OUTPUT_DIR'] set, appended to <url name>.<pid>.folded files in
+the collapsed-stack format read by flamegraph.pl and speedscope:
+
+    cat profiles/order-list.*.folded | flamegraph.pl > order-list.svg
+
+Staff read the hottest functions per URL name from /api/profiles/.
+"""
+from collections import Counter
+from django.conf import settings
+from . import metrics
+import os
+import re
+import sys
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Samples of new stacks once a URL name has PROFILING['MAX_STACKS'] are counted here
+OTHER_STACK = '[other]'
+
+
+class StackSampler:
+    """Collect the stacks of one thread from a helper thread until stopped."""
+
+    def __init__(self, thread_id, root, interval):
+        self.thread_id = thread_id
+        # Frames from `root` upwards (the server and the middleware) are left out
+        self.root = root
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and return {collapsed stack: samples}."""
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[self._collapse(frame)] += 1
+
+    def _collapse(self, frame):
+        names = []
+        while frame is not None and frame is not self.root:
+            code = frame.f_code
+            # co_qualname (Class.method) is new in Python 3.11
+            name = getattr(code, 'co_qualname', code.co_name)
+            names.append(f"{frame.f_globals.get('__name__', '?')}.{name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+
+class ProfileStore:
+    """Samples aggregated per URL name for this process."""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, samples, duration):
+        max_stacks = settings.PROFILING['MAX_STACKS']
+        with self._lock:
+            entry = self._routes.setdefault(route, {'requests': 0, 'seconds': 0.0, 'stacks': Counter()})
+            entry['requests'] += 1
+            entry['seconds'] += duration
+            stacks = entry['stacks']
+            for stack, count in samples.items():
+                if stack in stacks or len(stacks) < max_stacks:
+                    stacks[stack] += count
+                else:
+                    stacks[OTHER_STACK] += count
+
+    def summary(self, limit, route=None):
+        """Requests, samples and the `limit` hottest functions per URL name."""
+        with self._lock:
+            routes = {
+                name: (entry['requests'], entry['seconds'], Counter(entry['stacks']))
+                for name, entry in self._routes.items()
+                if route is None or name == route
+            }
+        return {
+            name: {
+                'requests': requests,
+                'mean_ms': round(seconds * 1000 / requests, 2),
+                'samples': sum(stacks.values()),
+                'top': top_functions(stacks, limit),
+            }
+            for name, (requests, seconds, stacks) in routes.items()
+        }
+
+    def collapsed(self, route=None):
+        """All samples in collapsed-stack format, one 'stack count' line each."""
+        with self._lock:
+            lines = [
+                f'{name};{stack} {count}' if route is None else f'{stack} {count}'
+                for name, entry in self._routes.items() if route is None or name == route
+                for stack, count in entry['stacks'].items()
+            ]
+        return ''.join(f'{line}\n' for line in lines)
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+
+def top_functions(stacks, limit):
+    """
+    The `limit` functions with the most samples on top of the stack (self),
+    with the samples they appear anywhere in (total).
+    """
+    samples = sum(stacks.values()) or 1
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        self_counts[frames[-1]] += count
+        for name in set(frames):
+            total_counts[name] += count
+    return [
+        {
+            'function': name,
+            'self': count,
+            'total': total_counts[name],
+            'self_percent': round(count * 100 / samples, 1),
+            'total_percent': round(total_counts[name] * 100 / samples, 1),
+        }
+        for name, count in self_counts.most_common(limit)
+    ]
+
+
+def write_folded(route, samples):
+    """Append samples to this process's collapsed-stack file for `route`."""
+    directory = settings.PROFILING['OUTPUT_DIR']
+    if not directory or not samples:
+        return
+    filename = f"{re.sub(r'[^A-Za-z0-9_.-]', '_', route)}.{os.getpid()}.folded"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, filename), 'a') as f:
+            f.writelines(f'{stack} {count}\n' for stack, count in samples.items())
+    except OSError:
+        logger.exception(f"Could not write profile samples for {route}")
+
+
+def record(route, samples, duration):
+    """Keep the samples of one profiled request."""
+    profiles.add(route, samples, duration)
+    write_folded(route, samples)
+    metrics.profiled_requests.inc(route=route)
+
+
+profiles = ProfileStore()
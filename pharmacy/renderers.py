@@ -0,0 +1,83 @@
+"""
+Renderers for the MediCart pharmacy API.
+
+FastJSONRenderer produces the same compact JSON as DRF's JSONRenderer.
+It uses orjson when installed and the stdlib encoder otherwise. Values
+JSON cannot represent are encoded through a per-type lookup table
+instead of DRF's chain of isinstance checks.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from decimal import Decimal
+from uuid import UUID
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional accelerator
+    orjson = None
+
+
+def _encode_datetime(value):
+    text = value.isoformat()
+    if text.endswith('+00:00'):
+        text = text[:-6] + 'Z'
+    return text
+
+
+_fallback = JSONEncoder().default
+
+# Exact type -> encoder, mirroring rest_framework.utils.encoders.JSONEncoder
+_ENCODERS = {
+    # Serializers already coerce decimals to strings, this is for raw data
+    Decimal: float,
+    datetime.datetime: _encode_datetime,
+    datetime.date: datetime.date.isoformat,
+    UUID: str,
+}
+
+
+def encode_default(value):
+    """Encode a value JSON has no native form for."""
+    encoder = _ENCODERS.get(type(value))
+    if encoder is not None:
+        return encoder(value)
+    # Lazy strings, querysets, timedeltas and other rarer types
+    return _fallback(value)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Drop-in replacement for JSONRenderer with a faster encode path."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            # Indented output is only requested by humans, keep DRF's formatting
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if orjson is not None and not self.ensure_ascii:
+            try:
+                ret = orjson.dumps(
+                    data,
+                    default=encode_default,
+                    option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+                )
+            except TypeError:
+                # Integers beyond 64 bits and similar edge cases
+                pass
+            else:
+                if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+                    ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+                return ret
+
+        ret = json.dumps(
+            data, default=encode_default, ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict, separators=(',', ':')
+        )
+        # Match JSONRenderer: escape the separators JavaScript treats as newlines
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
@@ -0,0 +1,188 @@
+"""
+Inventory valuation for finance.
+
+inventory_valuation() values the catalog at Medicine.price: the total, the
+value per expiry bucket and the value at risk from stock expiring within
+REPORTS['NEAR_EXPIRY_DAYS'] days. Every figure comes from one aggregate
+query over Medicine, so they all add up and describe the same moment.
+Results are cached under the medicines table version and the day they were
+computed for; any committed stock or price change bumps the version.
+
+valuation_rows() yields the per-medicine breakdown behind those figures
+from one query read in chunks, for streaming. Run both inside snapshot()
+to get a breakdown that matches its summary row for row.
+
+Sharded medicines are valued at their exact stock, Medicine.stock less
+what their shards sold since the last fold (see StockShard).
+"""
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from .cache import get_version, MEDICINES_VERSION
+from .models import Medicine, StockShard
+from . import metrics
+
+CACHE_KEY_PREFIX = 'pharmacy:inventory:'
+
+# (name, first day, day after the last) relative to the report date; None is open-ended
+EXPIRY_BUCKETS = [
+    ('expired', None, 0),
+    ('0-30 days', 0, 31),
+    ('31-90 days', 31, 91),
+    ('91-180 days', 91, 181),
+    ('181-365 days', 181, 366),
+    ('over 365 days', 366, None),
+]
+
+BREAKDOWN_COLUMNS = ['id', 'name', 'expiry_date', 'bucket', 'price', 'units', 'value']
+
+VALUE_FIELD = DecimalField(max_digits=20, decimal_places=2)
+
+
+@contextmanager
+def snapshot(using=DEFAULT_DB_ALIAS):
+    """
+    A read-only transaction in which every query sees the same committed
+    state. SQLite reads from one snapshot for the whole transaction, as does
+    MySQL's default REPEATABLE READ; PostgreSQL needs to be asked.
+    """
+    connection = connections[using]
+    outermost = not connection.in_atomic_block
+    with transaction.atomic(using=using):
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        yield
+
+
+def units_expression():
+    """Units in stock per medicine, exact for sharded medicines."""
+    sold = (
+        StockShard.objects.filter(medicine=OuterRef('pk'))
+        .order_by()
+        .values('medicine_id')
+        .annotate(sold=Sum(F('allotted') - F('stock')))
+        .values('sold')
+    )
+    return Case(
+        When(stock_shards__gt=0, then=Greatest(F('stock') - Coalesce(Subquery(sold), 0), 0)),
+        default=F('stock'),
+    )
+
+
+def expiry_range(as_of, first_day, end_day):
+    """Q for expiry dates from `first_day` up to `end_day` days after `as_of`."""
+    condition = Q()
+    if first_day is not None:
+        condition &= Q(expiry_date__gte=as_of + timedelta(days=first_day))
+    if end_day is not None:
+        condition &= Q(expiry_date__lt=as_of + timedelta(days=end_day))
+    return condition
+
+
+def bucket_for(expiry_date, as_of):
+    """The EXPIRY_BUCKETS name an expiry date falls in."""
+    days = (expiry_date - as_of).days
+    for name, first_day, end_day in EXPIRY_BUCKETS:
+        if (first_day is None or days >= first_day) and (end_day is None or days < end_day):
+            return name
+
+
+def _valued(queryset):
+    return queryset.annotate(units=units_expression()).annotate(
+        value=ExpressionWrapper(F('price') * F('units'), output_field=VALUE_FIELD)
+    )
+
+
+def _compute(as_of, near_expiry_days):
+    groups = {'total': Q()}
+    for index, (_, first_day, end_day) in enumerate(EXPIRY_BUCKETS):
+        groups[f'bucket{index}'] = expiry_range(as_of, first_day, end_day)
+    # Not yet expired, but expiring within near_expiry_days (inclusive)
+    groups['at_risk'] = expiry_range(as_of, 0, near_expiry_days + 1)
+
+    aggregates = {}
+    for group, condition in groups.items():
+        condition = condition or None
+        aggregates[f'{group}_medicines'] = Count('id', filter=condition)
+        aggregates[f'{group}_units'] = Sum('units', filter=condition)
+        aggregates[f'{group}_value'] = Sum('value', filter=condition, output_field=VALUE_FIELD)
+    row = _valued(Medicine.objects.all()).aggregate(**aggregates)
+
+    def figures(group):
+        return {
+            'medicines': row[f'{group}_medicines'],
+            'units': row[f'{group}_units'] or 0,
+            'value': f"{row[f'{group}_value'] or 0:.2f}",
+        }
+
+    return {
+        'as_of': as_of.isoformat(),
+        'total': figures('total'),
+        'expiry_buckets': [
+            {
+                'bucket': name,
+                'expires_from': (as_of + timedelta(days=first_day)).isoformat() if first_day is not None else None,
+                'expires_before': (as_of + timedelta(days=end_day)).isoformat() if end_day is not None else None,
+                **figures(f'bucket{index}'),
+            }
+            for index, (name, first_day, end_day) in enumerate(EXPIRY_BUCKETS)
+        ],
+        'at_risk': {
+            'near_expiry_days': near_expiry_days,
+            'expires_before': (as_of + timedelta(days=near_expiry_days + 1)).isoformat(),
+            **figures('at_risk'),
+        },
+    }
+
+
+def inventory_valuation(near_expiry_days=None, use_cache=True):
+    """
+    The valuation of today's catalog as a JSON-ready dict. Values are
+    decimal strings, as elsewhere in the API.
+
+    Pass use_cache=False inside snapshot() to value exactly the state a
+    breakdown read in the same transaction sees.
+    """
+    if near_expiry_days is None:
+        near_expiry_days = settings.REPORTS['NEAR_EXPIRY_DAYS']
+    as_of = timezone.now().date()
+    # Read the version before computing, so a change committed meanwhile
+    # is picked up by the next request
+    version = get_version(MEDICINES_VERSION)
+    key = f'{CACHE_KEY_PREFIX}{version}:{as_of.isoformat()}:{near_expiry_days}'
+    if use_cache:
+        report = cache.get(key)
+        if report is not None:
+            metrics.inventory_reports.inc(source='cache')
+            return report
+
+    with snapshot():
+        report = {'catalog_version': version, **_compute(as_of, near_expiry_days)}
+    metrics.inventory_reports.inc(source='database')
+    if use_cache:
+        cache.set(key, report, settings.REPORTS['CACHE_TIMEOUT'])
+    return report
+
+
+def valuation_rows(as_of=None):
+    """
+    Yield one BREAKDOWN_COLUMNS tuple per medicine, in id order, from a
+    single query read REPORTS['BREAKDOWN_CHUNK_SIZE'] rows at a time.
+    """
+    as_of = as_of or timezone.now().date()
+    rows = (
+        _valued(Medicine.objects.order_by('id'))
+        .values_list('id', 'name', 'expiry_date', 'price', 'units', 'value')
+        .iterator(chunk_size=settings.REPORTS['BREAKDOWN_CHUNK_SIZE'])
+    )
+    for pk, name, expiry_date, price, units, value in rows:
+        yield (
+            pk, name, expiry_date.isoformat(), bucket_for(expiry_date, as_of),
+            f'{price:.2f}', units, f'{value:.2f}',
+        )
@@ -0,0 +1,45 @@
+"""
+Database router placing archived orders in the database named by
+ORDER_ARCHIVE['DATABASE'], which may be a separate SQLite file.
+"""
+from django.conf import settings
+
+
+def archive_database():
+    """Return the database alias holding OrderArchive rows."""
+    return settings.ORDER_ARCHIVE['DATABASE']
+
+
+class ArchiveRouter:
+    """Route OrderArchive to the archive database, other pharmacy models to default."""
+
+    def _db_for(self, model):
+        if model._meta.app_label != 'pharmacy':
+            return None
+        if model._meta.model_name == 'orderarchive':
+            return archive_database()
+        # Archived rows link to medicines; never look those up in the archive
+        return 'default'
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        labels = {obj1._meta.app_label, obj2._meta.app_label}
+        if labels == {'pharmacy'}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        archive = archive_database()
+        if archive == 'default':
+            return None
+        if db == archive:
+            # The archive database only holds the archive table
+            return app_label == 'pharmacy' and model_name == 'orderarchive'
+        if app_label == 'pharmacy' and model_name == 'orderarchive':
+            return False
+        return None
@@ -2,7 +2,11 @@
 Serializers for the MediCart pharmacy application.
 """
 from rest_framework import serializers
-from .models import Medicine, Order
+from .models import Customer, Medicine, Order, OrderArchive
+from .cache import stock_cache
+from .services import place_order
+from . import metrics
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils import timezone
 import logging
 
@@ -18,9 +22,9 @@ class MedicineSerializer(serializers.ModelSerializer):
         model = Medicine
         fields = [
             'id', 'name', 'description', 'price', 'stock',
-            'expiry_date', 'is_in_stock', 'created_at', 'updated_at'
+            'expiry_date', 'is_in_stock', 'is_expired', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'is_expired', 'created_at', 'updated_at']
     
     def validate_expiry_date(self, value):
         """Validate that expiry date is not in the past."""
@@ -42,12 +46,41 @@ class MedicineSerializer(serializers.ModelSerializer):
         return value
 
 
+class CustomerSerializer(serializers.ModelSerializer):
+    """Serializer for Customer model."""
+    
+    class Meta:
+        model = Customer
+        fields = ['id', 'name', 'created_at']
+        read_only_fields = fields
+
+
+class MedicineIdField(serializers.PrimaryKeyRelatedField):
+    """
+    Medicine of an order. New orders keep the bare id for place_order,
+    which reads the row itself under a lock; reading it here as well would
+    only give the stock checks a stale copy.
+    """
+    
+    def to_internal_value(self, data):
+        if self.parent.instance is not None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
 class OrderSerializer(serializers.ModelSerializer):
     """Serializer for Order model."""
     
+    medicine = MedicineIdField(queryset=Medicine.objects.all())
     medicine_name = serializers.CharField(source='medicine.name', read_only=True)
+    # The unit price charged, snapshotted when the order was placed
     medicine_price = serializers.DecimalField(
-        source='medicine.price',
+        source='unit_price',
         max_digits=10,
         decimal_places=2,
         read_only=True
@@ -56,10 +89,47 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = [
-            'id', 'customer_name', 'medicine', 'medicine_name',
+            'id', 'customer_name', 'customer', 'medicine', 'medicine_name',
             'medicine_price', 'quantity', 'order_date', 'status', 'total_price'
         ]
-        read_only_fields = ['id', 'order_date', 'total_price']
+        read_only_fields = ['id', 'customer', 'order_date', 'total_price']
+    
+    def to_internal_value(self, data):
+        """Reject obvious insufficient-stock orders before touching the database."""
+        if self.instance is None:
+            self._check_cached_stock(data)
+        return super().to_internal_value(data)
+    
+    def _check_cached_stock(self, data):
+        """Compare the requested quantity against the hot-SKU stock cache."""
+        try:
+            medicine_id = int(data.get('medicine'))
+            quantity = int(data.get('quantity'))
+        except (AttributeError, TypeError, ValueError):
+            # Leave malformed input to the regular field validation
+            return
+        
+        cached = stock_cache.get(medicine_id)
+        if cached is not None and cached.stock < quantity:
+            metrics.insufficient_stock.inc(source='cache')
+            logger.warning(
+                f"Order validation failed from cache: Insufficient stock for medicine {medicine_id}"
+            )
+            raise serializers.ValidationError({
+                'quantity': [f"Insufficient stock. Only {cached.stock} units available."]
+            })
+    
+    def validate_status(self, value):
+        """Only allow status changes permitted by the transition graph."""
+        return validate_transition(self.instance, value)
+    
+    def update(self, instance, validated_data):
+        """Apply a status change through Order.transition_to so it restocks."""
+        new_status = validated_data.pop('status', instance.status)
+        instance = super().update(instance, validated_data)
+        if new_status != instance.status:
+            apply_transition(instance, new_status)
+        return instance
     
     def validate_quantity(self, value):
         """Validate quantity is positive."""
@@ -67,21 +137,17 @@ class OrderSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Quantity must be greater than 0.")
         return value
     
-    def validate(self, data):
-        """Validate that medicine has enough stock."""
-        medicine = data.get('medicine')
-        quantity = data.get('quantity')
-        
-        if medicine and quantity:
-            if medicine.stock < quantity:
-                logger.warning(
-                    f"Order validation failed: Insufficient stock for {medicine.name}"
-                )
-                raise serializers.ValidationError({
-                    'quantity': f"Insufficient stock. Only {medicine.stock} units available."
-                })
-        
-        return data
+    def create(self, validated_data):
+        """Place the order; expiry and stock are checked against the locked row."""
+        try:
+            return place_order(
+                validated_data['customer_name'],
+                validated_data['medicine'],
+                validated_data['quantity'],
+                status=validated_data.get('status', 'Pending')
+            )
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.message_dict)
 
 
 class OrderStatusUpdateSerializer(serializers.ModelSerializer):
@@ -92,11 +158,67 @@ class OrderStatusUpdateSerializer(serializers.ModelSerializer):
         fields = ['status']
     
     def validate_status(self, value):
-        """Validate status is a valid choice."""
+        """Validate status is a valid choice and an allowed transition."""
         valid_statuses = [choice[0] for choice in Order.STATUS_CHOICES]
         if value not in valid_statuses:
             raise serializers.ValidationError(
                 f"Invalid status. Choose from: {', '.join(valid_statuses)}"
             )
-        return value
+        return validate_transition(self.instance, value)
+    
+    def update(self, instance, validated_data):
+        if validated_data.get('status', instance.status) != instance.status:
+            apply_transition(instance, validated_data['status'])
+        return instance
+
 
+class BulkTransitionSerializer(serializers.Serializer):
+    """Input for moving many orders to one status."""
+    
+    MAX_IDS = 10000
+    
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_IDS
+    )
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+
+def validate_transition(order, new_status):
+    """Reject a status change the transition graph does not allow."""
+    if order is not None and new_status != order.status and not order.can_transition_to(new_status):
+        raise serializers.ValidationError(
+            f"Cannot change order status from {order.status} to {new_status}."
+        )
+    return new_status
+
+
+def apply_transition(order, new_status):
+    """Run Order.transition_to, reporting a lost race as a validation error."""
+    try:
+        order.transition_to(new_status)
+    except DjangoValidationError as e:
+        raise serializers.ValidationError({'status': e.messages})
+
+
+class OrderArchiveSerializer(serializers.ModelSerializer):
+    """Read-only serializer for archived orders, shaped like OrderSerializer."""
+    
+    medicine_name = serializers.CharField(source='medicine.name', read_only=True)
+    # The unit price charged, snapshotted when the order was placed
+    medicine_price = serializers.DecimalField(
+        source='unit_price',
+        max_digits=10,
+        decimal_places=2,
+        read_only=True
+    )
+    
+    class Meta:
+        model = OrderArchive
+        fields = [
+            'id', 'customer_name', 'customer', 'medicine', 'medicine_name',
+            'medicine_price', 'quantity', 'order_date', 'status', 'total_price',
+            'archived_at'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,19 @@
+"""
+Order placement shared by the API, the order form and populate_data.
+"""
+from .models import Order
+
+
+def place_order(customer_name, medicine_id, quantity, status='Pending'):
+    """
+    Place an order for `quantity` units of a medicine and return it.
+
+    Callers pass the medicine's id rather than a Medicine they read
+    themselves: Order.save reads the row once, locked, in the order's
+    transaction, checks expiry and stock against it, and deducts the stock
+    with one conditional UPDATE. Raises ValidationError keyed by 'medicine'
+    or 'quantity' when the order cannot be placed.
+    """
+    order = Order(customer_name=customer_name, medicine_id=medicine_id, quantity=quantity, status=status)
+    order.save()
+    return order
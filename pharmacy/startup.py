@@ -0,0 +1,103 @@
+"""
+Measure how long a fresh process takes to serve its first request.
+
+Run in a new interpreter, with DJANGO_SETTINGS_MODULE naming the settings
+profile to measure:
+    python -m pharmacy.startup [/api/medicines/]
+
+Prints one JSON object with milliseconds spent importing and setting up
+Django, loading the URLconf and serving the path through the WSGI handler,
+plus the number of modules loaded. `manage.py profile_startup` runs this
+under `python -X importtime` for a per-module breakdown, and
+`manage.py benchmark startup` compares settings profiles with it.
+"""
+import time
+
+STARTED = time.perf_counter()
+
+import io  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+
+DEFAULT_PATH = '/api/medicines/'
+
+
+def _ms(since):
+    return round((time.perf_counter() - since) * 1000, 1)
+
+
+def first_request(path):
+    """Set up Django, then serve `path` once and return the timings."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medicart.settings')
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    setup_ms = _ms(STARTED)
+
+    from django.conf import settings
+    from django.urls import get_resolver
+    start = time.perf_counter()
+    get_resolver().url_patterns
+    urls_ms = _ms(start)
+
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': settings.ALLOWED_HOSTS[0],
+        'SERVER_PORT': '80',
+        'HTTP_HOST': settings.ALLOWED_HOSTS[0],
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    statuses = []
+    start = time.perf_counter()
+    body = b''.join(application(environ, lambda status, headers, *args: statuses.append(status)))
+    request_ms = _ms(start)
+
+    return {
+        'settings': os.environ['DJANGO_SETTINGS_MODULE'],
+        'setup_ms': setup_ms,
+        'urls_ms': urls_ms,
+        'request_ms': request_ms,
+        'total_ms': _ms(STARTED),
+        'status': int(statuses[0].split()[0]),
+        'bytes': len(body),
+        'modules': len(sys.modules),
+    }
+
+
+def parse_importtime(output):
+    """Return (module, self_us, cumulative_us) for each line of -X importtime output."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def measure(settings_module, path=DEFAULT_PATH, importtime=False):
+    """
+    Run first_request() in a new interpreter with `settings_module`.
+    Returns its timings and, with `importtime`, the parsed per-module
+    import times.
+    """
+    import subprocess
+    from django.conf import settings
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-m', 'pharmacy.startup', path]
+    result = subprocess.run(
+        command, capture_output=True, text=True, cwd=settings.BASE_DIR,
+        env={**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module},
+    )
+    if result.returncode:
+        raise RuntimeError(f'{settings_module}: {result.stderr.strip().splitlines()[-1]}')
+    return json.loads(result.stdout.splitlines()[-1]), parse_importtime(result.stderr)
+
+
+if __name__ == '__main__':
+    print(json.dumps(first_request(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH)))
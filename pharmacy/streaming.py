@@ -0,0 +1,137 @@
+"""
+In-process fan-out of medicine stock changes to streaming clients.
+
+One StockBroadcaster per process tails the change log for medicine entries
+and reads the current stock of the changed medicines that somebody is
+watching, then hands the rows to every subscriber of those medicines. The
+database work per poll is the same for one client or thousands; an idle
+subscriber is a coroutine waiting on an asyncio.Event.
+
+Subscribers keep only the latest row per medicine, so a slow client skips
+intermediate values instead of queueing them.
+"""
+from django.conf import settings
+from .models import ChangeLogEntry, Medicine
+from . import metrics
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+STOCK_FIELDS = ('id', 'stock', 'price', 'is_expired', 'version')
+
+
+class Subscription:
+    """The medicines one client watches and the rows not yet sent to it."""
+
+    def __init__(self, medicine_ids):
+        self.medicine_ids = frozenset(medicine_ids)
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, row):
+        self.pending[row['id']] = row
+        self.ready.set()
+
+    async def wait(self, timeout):
+        """Return the rows that changed, or [] if `timeout` passes first."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.ready.clear()
+        rows, self.pending = list(self.pending.values()), {}
+        return rows
+
+
+class StockBroadcaster:
+    """Poll the change log once per interval and fan out to subscribers."""
+
+    def __init__(self):
+        self._watchers = {}
+        self._task = None
+        self._loop = None
+        self._last_seq = None
+
+    @property
+    def subscriber_count(self):
+        return len({id(s) for subs in self._watchers.values() for s in subs})
+
+    async def subscribe(self, medicine_ids):
+        """Register a subscription and start polling if needed."""
+        self._bind_loop()
+        if self._last_seq is None:
+            self._last_seq = await self._latest_seq()
+        subscription = Subscription(medicine_ids)
+        for medicine_id in subscription.medicine_ids:
+            self._watchers.setdefault(medicine_id, set()).add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for medicine_id in subscription.medicine_ids:
+            watchers = self._watchers.get(medicine_id)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self._watchers[medicine_id]
+
+    def _bind_loop(self):
+        # Subscribers and the poller must share one event loop; start over
+        # if a new loop took over (e.g. one loop per test)
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._watchers = {}
+            self._task = None
+            self._last_seq = None
+
+    async def _latest_seq(self):
+        seq = await ChangeLogEntry.objects.order_by('-seq').values_list('seq', flat=True).afirst()
+        return seq or 0
+
+    async def _run(self):
+        interval = settings.CHANGES_FEED['POLL_INTERVAL']
+        while self._watchers:
+            try:
+                await self.poll()
+            except Exception:
+                # Keep streaming; the next poll resumes from the same seq
+                logger.exception("Stock broadcaster poll failed")
+            await asyncio.sleep(interval)
+        # Nobody is watching; the next subscriber starts from the newest entry
+        self._last_seq = None
+
+    async def poll(self):
+        """Publish the current rows of watched medicines changed since the last poll."""
+        entries = ChangeLogEntry.objects.filter(
+            seq__gt=self._last_seq, entity='medicine'
+        ).order_by('seq').values_list('seq', 'entity_id')
+        changed = set()
+        async for seq, medicine_id in entries:
+            self._last_seq = seq
+            changed.add(medicine_id)
+        watched = [medicine_id for medicine_id in changed if medicine_id in self._watchers]
+        if not watched:
+            return
+        rows = Medicine.objects.filter(pk__in=watched).values(*STOCK_FIELDS)
+        async for row in rows:
+            for subscription in list(self._watchers.get(row['id'], ())):
+                subscription.push(row)
+
+
+async def current_rows(medicine_ids):
+    """The current stock rows for `medicine_ids`, sent when a client connects."""
+    rows = Medicine.objects.filter(pk__in=list(medicine_ids)).values(*STOCK_FIELDS)
+    return [row async for row in rows]
+
+
+broadcaster = StockBroadcaster()
+
+metrics.register_collector(
+    'pharmacy_stock_stream_subscribers',
+    'gauge',
+    'Clients currently subscribed to live stock updates in this process.',
+    lambda: [({}, broadcaster.subscriber_count)],
+)
@@ -1,28 +1,93 @@
 """
 Comprehensive tests for the MediCart pharmacy application.
+
+Fixtures are built once per class with setUpTestData. Run the suite with
+pytest, or in parallel with:
+    python manage.py test --settings=medicart.settings_test --parallel auto
 """
-from django.test import TestCase, Client
+from django.conf import settings
+from django.test import TestCase
 from django.urls import reverse
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase
 from rest_framework import status
 from django.utils import timezone
+from contextlib import contextmanager
+from unittest import skipUnless
 from datetime import timedelta
 from decimal import Decimal
-from .models import Medicine, Order
+from .models import Customer, Medicine, Order
+from .pricing import price_table
+import os
+import time
+
+# Wall-clock budgets depend on machine load, so they only run with TEST_TIME_BUDGETS=1
+TIME_BUDGETS = os.environ.get('TEST_TIME_BUDGETS', '') == '1'
+# Multiplier for time budgets on slow machines, e.g. TEST_TIME_BUDGET_SCALE=3
+TIME_BUDGET_SCALE = float(os.environ.get('TEST_TIME_BUDGET_SCALE', '1'))
+
+
+def make_medicine(name, **fields):
+    """Create a Medicine, filling in defaults for the fields not given."""
+    fields.setdefault('description', f'{name} description')
+    fields.setdefault('price', Decimal('10.00'))
+    fields.setdefault('stock', 100)
+    fields.setdefault('expiry_date', timezone.now().date() + timedelta(days=365))
+    return Medicine.objects.create(name=name, **fields)
+
+
+def make_orders(medicine, *customer_names, quantity=1, status='Pending'):
+    """
+    Insert orders in one query without going through Order.save(), so stock
+    is not deducted. Tests about stock bookkeeping use Order.objects.create.
+    """
+    customers = {name: Customer.for_name(name) for name in set(customer_names)}
+    return Order.objects.bulk_create([
+        Order(
+            customer_name=name,
+            customer=customers[name],
+            medicine=medicine,
+            quantity=quantity,
+            status=status,
+            unit_price=medicine.price,
+            total_price=medicine.price * quantity,
+        )
+        for name in customer_names
+    ])
+
+
+class FixtureTestMixin:
+    """
+    Reset process-local caches before each test. Class-level fixtures are
+    restored by transaction rollback, but cached stock and counts are not.
+    """
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from .cache import stock_cache
+        super().setUp()
+        cache.clear()
+        stock_cache.clear()
+        price_table.clear()
+    
+    @contextmanager
+    def assertTimeBudget(self, seconds):
+        """Fail if the block takes longer than `seconds` (scaled by TIME_BUDGET_SCALE)."""
+        budget = seconds * TIME_BUDGET_SCALE
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        self.assertLessEqual(
+            elapsed, budget, f"Took {elapsed * 1000:.0f}ms, budget {budget * 1000:.0f}ms"
+        )
 
 
 class MedicineModelTest(TestCase):
     """Test cases for Medicine model."""
     
-    def setUp(self):
+    @classmethod
+    def setUpTestData(cls):
         """Set up test data."""
-        self.medicine = Medicine.objects.create(
-            name="Aspirin",
-            description="Pain reliever",
-            price=Decimal("9.99"),
-            stock=100,
-            expiry_date=timezone.now().date() + timedelta(days=365)
-        )
+        cls.medicine = make_medicine("Aspirin", description="Pain reliever", price=Decimal("9.99"))
     
     def test_medicine_creation(self):
         """Test medicine creation."""
@@ -56,17 +121,14 @@ class MedicineModelTest(TestCase):
             medicine.full_clean()
 
 
-class OrderModelTest(TestCase):
+class OrderModelTest(FixtureTestMixin, TestCase):
     """Test cases for Order model."""
     
-    def setUp(self):
+    @classmethod
+    def setUpTestData(cls):
         """Set up test data."""
-        self.medicine = Medicine.objects.create(
-            name="Ibuprofen",
-            description="Anti-inflammatory",
-            price=Decimal("15.50"),
-            stock=50,
-            expiry_date=timezone.now().date() + timedelta(days=365)
+        cls.medicine = make_medicine(
+            "Ibuprofen", description="Anti-inflammatory", price=Decimal("15.50"), stock=50
         )
     
     def test_order_creation(self):
@@ -90,11 +152,7 @@ class OrderModelTest(TestCase):
     
     def test_order_string_representation(self):
         """Test __str__ method."""
-        order = Order.objects.create(
-            customer_name="Jane Smith",
-            medicine=self.medicine,
-            quantity=2
-        )
+        order, = make_orders(self.medicine, "Jane Smith", quantity=2)
         expected = f"Order #{order.id} - Jane Smith"
         self.assertEqual(str(order), expected)
     
@@ -128,26 +186,20 @@ class OrderModelTest(TestCase):
         self.assertEqual(self.medicine.stock, initial_stock)
 
 
-class MedicineAPITest(APITestCase):
+class MedicineAPITest(FixtureTestMixin, APITestCase):
     """Test cases for Medicine API endpoints."""
     
-    def setUp(self):
-        """Set up test data and API client."""
-        self.client = APIClient()
-        self.medicine_data = {
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        cls.medicine_data = {
             'name': 'Paracetamol',
             'description': 'Fever reducer',
             'price': '12.99',
             'stock': 200,
             'expiry_date': (timezone.now().date() + timedelta(days=365)).isoformat()
         }
-        self.medicine = Medicine.objects.create(
-            name="Aspirin",
-            description="Pain reliever",
-            price=Decimal("9.99"),
-            stock=100,
-            expiry_date=timezone.now().date() + timedelta(days=365)
-        )
+        cls.medicine = make_medicine("Aspirin", description="Pain reliever", price=Decimal("9.99"))
     
     def test_get_all_medicines(self):
         """Test retrieving all medicines."""
@@ -221,12 +273,7 @@ class MedicineAPITest(APITestCase):
     
     def test_delete_medicine_with_pending_orders(self):
         """Test that medicine with pending orders cannot be deleted."""
-        # Create a pending order
-        Order.objects.create(
-            customer_name="Test User",
-            medicine=self.medicine,
-            quantity=5
-        )
+        make_orders(self.medicine, "Test User", quantity=5)
         
         url = reverse('medicine-detail', args=[self.medicine.id])
         response = self.client.delete(url)
@@ -235,33 +282,24 @@ class MedicineAPITest(APITestCase):
         self.assertEqual(Medicine.objects.count(), 1)
 
 
-class OrderAPITest(APITestCase):
+class OrderAPITest(FixtureTestMixin, APITestCase):
     """Test cases for Order API endpoints."""
     
-    def setUp(self):
-        """Set up test data and API client."""
-        self.client = APIClient()
-        self.medicine = Medicine.objects.create(
-            name="Vitamin C",
-            description="Immune booster",
-            price=Decimal("20.00"),
-            stock=100,
-            expiry_date=timezone.now().date() + timedelta(days=365)
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        cls.medicine = make_medicine(
+            "Vitamin C", description="Immune booster", price=Decimal("20.00")
         )
-        self.order_data = {
+        cls.order, = make_orders(cls.medicine, "Test User", quantity=5)
+        cls.order_data = {
             'customer_name': 'Alice Johnson',
-            'medicine': self.medicine.id,
+            'medicine': cls.medicine.id,
             'quantity': 3
         }
     
     def test_get_all_orders(self):
         """Test retrieving all orders."""
-        Order.objects.create(
-            customer_name="Test User",
-            medicine=self.medicine,
-            quantity=5
-        )
-        
         url = reverse('order-list')
         response = self.client.get(url)
         
@@ -270,13 +308,7 @@ class OrderAPITest(APITestCase):
     
     def test_get_single_order(self):
         """Test retrieving a single order."""
-        order = Order.objects.create(
-            customer_name="Test User",
-            medicine=self.medicine,
-            quantity=5
-        )
-        
-        url = reverse('order-detail', args=[order.id])
+        url = reverse('order-detail', args=[self.order.id])
         response = self.client.get(url)
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -288,7 +320,7 @@ class OrderAPITest(APITestCase):
         response = self.client.post(url, self.order_data, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Order.objects.count(), 2)
         
         # Check stock was reduced
         self.medicine.refresh_from_db()
@@ -303,23 +335,17 @@ class OrderAPITest(APITestCase):
         response = self.client.post(url, invalid_data, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(Order.objects.count(), 1)
     
     def test_update_order_status(self):
         """Test updating order status."""
-        order = Order.objects.create(
-            customer_name="Test User",
-            medicine=self.medicine,
-            quantity=5
-        )
-        
-        url = reverse('order-update-status', args=[order.id])
+        url = reverse('order-update-status', args=[self.order.id])
         status_data = {'status': 'Delivered'}
         response = self.client.patch(url, status_data, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        order.refresh_from_db()
-        self.assertEqual(order.status, 'Delivered')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'Delivered')
     
     def test_delete_order(self):
         """Test deleting an order."""
@@ -335,26 +361,23 @@ class OrderAPITest(APITestCase):
         response = self.client.delete(url)
         
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
-        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(Order.objects.count(), 1)
         
         # Check stock was restored
         self.medicine.refresh_from_db()
         self.assertEqual(self.medicine.stock, initial_stock)
 
 
-class TemplateViewTest(TestCase):
+class TemplateViewTest(FixtureTestMixin, TestCase):
     """Test cases for template views."""
     
-    def setUp(self):
-        """Set up test data and client."""
-        self.client = Client()
-        self.medicine = Medicine.objects.create(
-            name="Test Medicine",
-            description="Test description",
-            price=Decimal("25.00"),
-            stock=50,
-            expiry_date=timezone.now().date() + timedelta(days=365)
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        cls.medicine = make_medicine(
+            "Test Medicine", description="Test description", price=Decimal("25.00"), stock=50
         )
+        cls.order, _ = make_orders(cls.medicine, "Detail Test", "Test Customer", quantity=2)
     
     def test_home_page(self):
         """Test home page loads correctly."""
@@ -397,12 +420,6 @@ class TemplateViewTest(TestCase):
     
     def test_order_list_page(self):
         """Test order list page."""
-        Order.objects.create(
-            customer_name="Test Customer",
-            medicine=self.medicine,
-            quantity=5
-        )
-        
         url = reverse('order_list')
         response = self.client.get(url)
         
@@ -432,16 +449,1761 @@ class TemplateViewTest(TestCase):
     
     def test_order_detail_page(self):
         """Test order detail page."""
-        order = Order.objects.create(
-            customer_name="Detail Test",
-            medicine=self.medicine,
-            quantity=2
+        url = reverse('order_detail', args=[self.order.id])
+        response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Detail Test')
+        self.assertContains(response, f'Order #{self.order.id}')
+
+
+class SweepExpiredCommandTest(TestCase):
+    """Test cases for the sweep_expired management command."""
+    
+    def setUp(self):
+        """Set up a mix of expired and valid medicines."""
+        today = timezone.now().date()
+        self.expired = [
+            Medicine.objects.create(
+                name=f"Expired {i}",
+                description="Past its date",
+                price=Decimal("5.00"),
+                stock=10,
+                expiry_date=today - timedelta(days=i + 1)
+            )
+            for i in range(3)
+        ]
+        self.valid = Medicine.objects.create(
+            name="Valid",
+            description="Still good",
+            price=Decimal("5.00"),
+            stock=10,
+            expiry_date=today + timedelta(days=30)
         )
+    
+    def test_sweep_flags_expired_medicines_in_chunks(self):
+        """Test that every expired medicine is flagged and each chunk is audited."""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import ExpirySweepLog
+        
+        call_command('sweep_expired', chunk_size=2, stdout=StringIO())
+        
+        self.assertEqual(Medicine.objects.filter(is_expired=True).count(), 3)
+        self.valid.refresh_from_db()
+        self.assertFalse(self.valid.is_expired)
+        self.assertEqual(ExpirySweepLog.objects.count(), 2)
+        self.assertEqual(
+            sum(ExpirySweepLog.objects.values_list('flagged', flat=True)), 3
+        )
+    
+    def test_sweep_can_be_resumed(self):
+        """Test that a stopped run continues after its last chunk."""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import ExpirySweepLog
+        
+        call_command('sweep_expired', chunk_size=1, max_chunks=1, stdout=StringIO())
+        run_id = ExpirySweepLog.objects.get().run_id
+        self.assertEqual(Medicine.objects.filter(is_expired=True).count(), 1)
+        
+        call_command('sweep_expired', chunk_size=1, resume=run_id, stdout=StringIO())
+        
+        self.assertEqual(Medicine.objects.filter(is_expired=True).count(), 3)
+        self.assertEqual(ExpirySweepLog.objects.filter(run_id=run_id).count(), 4)
+    
+    def test_sweep_invalidates_cached_medicine(self):
+        """Test that a conditional GET after a sweep returns the flagged medicine."""
+        from django.core.management import call_command
+        from io import StringIO
+        
+        detail_url = reverse('medicine-detail', args=[self.expired[0].pk])
+        list_url = reverse('medicine-list')
+        detail_etag = self.client.get(detail_url, HTTP_ACCEPT='application/json')['ETag']
+        list_etag = self.client.get(list_url, HTTP_ACCEPT='application/json')['ETag']
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('sweep_expired', stdout=StringIO())
+        
+        response = self.client.get(detail_url, HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_expired'])
+        response = self.client.get(list_url, HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+    
+    def test_expired_medicine_cannot_be_ordered(self):
+        """Test that flagged medicines are excluded from the order paths."""
+        from django.core.exceptions import ValidationError
+        from django.core.management import call_command
+        from io import StringIO
+        
+        call_command('sweep_expired', stdout=StringIO())
+        medicine = Medicine.objects.get(pk=self.expired[0].pk)
+        
+        with self.assertRaises(ValidationError):
+            Order.objects.create(customer_name="Late Buyer", medicine=medicine, quantity=1)
+        
+        response = self.client.get(reverse('order_place'))
+        self.assertNotContains(response, 'Expired 0')
+        self.assertContains(response, 'Valid')
+    
+    def test_extending_expiry_clears_flag(self):
+        """Test that saving a future expiry date makes the medicine orderable again."""
+        medicine = self.expired[0]
+        medicine.is_expired = True
+        medicine.expiry_date = timezone.now().date() + timedelta(days=90)
+        medicine.save()
+        
+        medicine.refresh_from_db()
+        self.assertFalse(medicine.is_expired)
+
+
+class StockCacheTest(TestCase):
+    """Test cases for the hot-SKU stock cache."""
+    
+    def setUp(self):
+        """Set up test data and an empty cache."""
+        from .cache import stock_cache
+        stock_cache.clear()
+        self.medicine = Medicine.objects.create(
+            name="Flash Sale",
+            description="Hot item",
+            price=Decimal("3.00"),
+            stock=10,
+            expiry_date=timezone.now().date() + timedelta(days=365)
+        )
+    
+    def test_lru_eviction_and_ttl(self):
+        """Test that the cache is bounded by size and entry age."""
+        from .cache import StockCache
+        cache = StockCache(max_size=1, ttl=60)
+        other = Medicine(pk=999, price=Decimal("1.00"), stock=1, version=0)
+        
+        cache.store(self.medicine)
+        cache.store(other)
+        self.assertIsNone(cache.get(self.medicine.pk))
+        self.assertEqual(cache.get(999).stock, 1)
+        
+        expired = StockCache(max_size=1, ttl=-1)
+        expired.store(self.medicine)
+        self.assertIsNone(expired.get(self.medicine.pk))
+    
+    def test_restock_invalidates_cache(self):
+        """Test that a full medicine save drops cached rows once it commits."""
+        from .cache import StockCache
+        cache = StockCache(max_size=10, ttl=60)
+        cache.store(self.medicine)
         
-        url = reverse('order_detail', args=[order.id])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.medicine.stock = 50
+            self.medicine.save()
+            # Until the commit other readers still see, and may re-cache, the old row
+            self.assertEqual(cache.get(self.medicine.pk).stock, 10)
+        for callback in callbacks:
+            callback()
+        
+        self.assertIsNone(cache.get(self.medicine.pk))
+    
+    def test_order_writes_through_and_rejects_without_queries(self):
+        """Test that a cached row rejects oversized orders without database access."""
+        from .cache import stock_cache
+        from .serializers import OrderSerializer
+        
+        first = OrderSerializer(data={
+            'customer_name': 'Buyer', 'medicine': self.medicine.pk, 'quantity': 4
+        })
+        self.assertTrue(first.is_valid())
+        first.save()
+        self.assertEqual(stock_cache.get(self.medicine.pk).stock, 6)
+        
+        second = OrderSerializer(data={
+            'customer_name': 'Buyer', 'medicine': self.medicine.pk, 'quantity': 7
+        })
+        with self.assertNumQueries(0):
+            self.assertFalse(second.is_valid())
+        self.assertIn('quantity', second.errors)
+
+
+class SharedCacheCheckTest(TestCase):
+    """Test cases for the system check on process-local default caches."""
+    
+    def test_process_local_cache_warns_without_debug(self):
+        """Test that only a production deployment on a process-local cache is warned."""
+        from django.test import override_settings
+        from .checks import check_shared_cache
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        
+        with override_settings(DEBUG=False, CACHES=locmem):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['pharmacy.W001'])
+        with override_settings(DEBUG=True, CACHES=locmem):
+            self.assertEqual(check_shared_cache(None), [])
+        with override_settings(DEBUG=False, CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class AdmissionControlTest(APITestCase):
+    """Test cases for write rate limiting and load shedding."""
+    
+    def setUp(self):
+        """Set up test data and reset limiter state."""
+        from .throttling import admission
+        admission.reset()
+        self.addCleanup(admission.reset)
+        self.medicine = Medicine.objects.create(
+            name="Throttled",
+            description="Popular",
+            price=Decimal("1.00"),
+            stock=100,
+            expiry_date=timezone.now().date() + timedelta(days=365)
+        )
+        self.order_data = {
+            'customer_name': 'Rapid Buyer',
+            'medicine': self.medicine.id,
+            'quantity': 1
+        }
+    
+    def test_rate_limit_returns_429_with_retry_after(self):
+        """Test that a client exceeding its bucket is rejected before any write."""
+        from django.test import override_settings
+        from .throttling import admission
+        
+        rates = {'RATES': {'orders': '2/minute'}, 'MAX_CONCURRENT_WRITES': 16, 'RETRY_AFTER': 1}
+        with override_settings(WRITE_ADMISSION=rates):
+            url = reverse('order-list')
+            for _ in range(2):
+                response = self.client.post(url, self.order_data, format='json')
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            response = self.client.post(url, self.order_data, format='json')
+            
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertIn('Retry-After', response)
+            self.assertEqual(Order.objects.count(), 2)
+            self.assertEqual(admission.get_rejection_counts()[('orders', 'rate_limited')], 1)
+            
+            # Reads are never throttled
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+    
+    def test_concurrency_limit_sheds_load_with_503(self):
+        """Test that writes are shed when every write slot is taken."""
+        from django.test import override_settings
+        from .throttling import admission
+        
+        limits = {'RATES': {}, 'MAX_CONCURRENT_WRITES': 1, 'RETRY_AFTER': 2}
+        with override_settings(WRITE_ADMISSION=limits):
+            self.assertTrue(admission.acquire_write_slot('test'))
+            response = self.client.post(reverse('order-list'), self.order_data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(response['Retry-After'], '2')
+            
+            page = self.client.post(reverse('order_place'), self.order_data)
+            self.assertEqual(page.status_code, 503)
+            
+            admission.release_write_slot()
+            response = self.client.post(reverse('order-list'), self.order_data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            # The slot taken by the successful request was released again
+            self.assertTrue(admission.acquire_write_slot('test'))
+
+
+class MetricsTest(APITestCase):
+    """Test cases for the /metrics endpoint."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.medicine = Medicine.objects.create(
+            name="Measured",
+            description="Observed",
+            price=Decimal("2.00"),
+            stock=10,
+            expiry_date=timezone.now().date() + timedelta(days=365)
+        )
+    
+    def test_metrics_endpoint_reports_requests_and_business_counters(self):
+        """Test that route latency, query counts and order counters are exposed."""
+        from . import metrics
+        created_before = metrics.orders_created.value()
+        
+        self.client.post(
+            reverse('order-list'),
+            {'customer_name': 'Counted', 'medicine': self.medicine.id, 'quantity': 2},
+            format='json'
+        )
+        self.client.post(
+            reverse('order-list'),
+            {'customer_name': 'Counted', 'medicine': self.medicine.id, 'quantity': 50},
+            format='json'
+        )
+        response = self.client.get(reverse('metrics'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE pharmacy_request_duration_seconds histogram', body)
+        self.assertIn('pharmacy_request_duration_seconds_count{route="order-list",method="POST",status="201"}', body)
+        self.assertIn('pharmacy_db_queries_total{route="order-list"}', body)
+        self.assertIn('pharmacy_insufficient_stock_rejections_total', body)
+        self.assertIn('pharmacy_stock_cache_requests_total{result="hit"}', body)
+        self.assertEqual(metrics.orders_created.value(), created_before + 1)
+    
+    def test_multiprocess_snapshots_are_summed(self):
+        """Test that snapshots written by other workers are aggregated."""
+        import json
+        import os
+        import tempfile
+        from django.test import override_settings
+        from . import metrics
+        
+        with tempfile.TemporaryDirectory() as directory:
+            other = {
+                'pharmacy_orders_created_total': ['counter', 'Orders successfully created.', [
+                    ['pharmacy_orders_created_total', [], 1000]
+                ]]
+            }
+            with open(os.path.join(directory, f'pharmacy-metrics-{os.getppid()}.json'), 'w') as f:
+                json.dump(other, f)
+            
+            config = {'MULTIPROCESS_DIR': directory, 'FLUSH_INTERVAL': 1, 'STALE_AFTER': 60}
+            with override_settings(METRICS=config):
+                families = metrics.collect_all()
+        
+        samples = families['pharmacy_orders_created_total'][2]
+        self.assertEqual(samples[0][2], 1000 + metrics.orders_created.value())
+    
+    @skipUnless(os.name == 'posix', 'exited workers are detected by pid on POSIX')
+    def test_exited_workers_keep_counters_but_not_gauges(self):
+        """Test that a dead worker's counters are folded into the retired snapshot and its gauges dropped."""
+        import json
+        import subprocess
+        import sys
+        import tempfile
+        from django.test import override_settings
+        from . import metrics
+        
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        snapshot = {
+            'pharmacy_orders_created_total': ['counter', 'Orders successfully created.', [
+                ['pharmacy_orders_created_total', [], 1000]
+            ]],
+            'test_worker_subscribers': ['gauge', 'Clients subscribed.', [
+                ['test_worker_subscribers', [], 7]
+            ]],
+        }
+        
+        def orders_and_subscribers(families):
+            subscribers = families.get('test_worker_subscribers', (None, None, []))[2]
+            return (
+                families['pharmacy_orders_created_total'][2][0][2] - metrics.orders_created.value(),
+                sum(value for _, _, value in subscribers),
+            )
+        
+        with tempfile.TemporaryDirectory() as directory:
+            config = {'MULTIPROCESS_DIR': directory, 'FLUSH_INTERVAL': 1, 'STALE_AFTER': 60}
+            for pid in (exited.pid, exited.pid):
+                with open(os.path.join(directory, f'pharmacy-metrics-{pid}.json'), 'w') as f:
+                    json.dump(snapshot, f)
+                with override_settings(METRICS=config):
+                    families = metrics.collect_all()
+            self.assertEqual(orders_and_subscribers(families), (2000, 0))
+            self.assertNotIn(f'pharmacy-metrics-{exited.pid}.json', os.listdir(directory))
+            
+            # A live worker that stopped flushing keeps its counters, not its gauges
+            live = os.path.join(directory, f'pharmacy-metrics-{os.getppid()}.json')
+            with open(live, 'w') as f:
+                json.dump(snapshot, f)
+            with override_settings(METRICS=config):
+                self.assertEqual(orders_and_subscribers(metrics.collect_all()), (3000, 7))
+            os.utime(live, (time.time() - 120, time.time() - 120))
+            with override_settings(METRICS=config):
+                self.assertEqual(orders_and_subscribers(metrics.collect_all()), (3000, 0))
+    
+    def test_exited_threads_fold_their_shards(self):
+        """Test that a thread's shard is folded into the retired total when it exits."""
+        import gc
+        import threading
+        from . import metrics
+        
+        counter = metrics.Counter('test_threads_total', 'Test counter.', ['kind'])
+        histogram = metrics.Histogram('test_thread_seconds', 'Test histogram.', buckets=(1.0,))
+        try:
+            def record():
+                counter.inc(kind='a')
+                histogram.observe(0.5)
+            
+            for _ in range(5):
+                thread = threading.Thread(target=record)
+                thread.start()
+                thread.join()
+            gc.collect()
+            
+            self.assertEqual(counter._shards, [])
+            self.assertEqual(histogram._shards, [])
+            self.assertEqual(counter.value(kind='a'), 5)
+            self.assertIn(('test_thread_seconds_count', (), 5), histogram.collect())
+        finally:
+            metrics.REGISTRY.remove(counter)
+            metrics.REGISTRY.remove(histogram)
+
+
+class ExceptionHandlerLoggingTest(TestCase):
+    """Test cases for tiered error logging in the API exception handler."""
+    
+    def setUp(self):
+        """Reset the traceback limiter."""
+        from .utils import error_log_limiter
+        error_log_limiter.reset()
+    
+    def test_client_errors_are_logged_without_traceback(self):
+        """Test that expected validation errors produce a one-line event."""
+        from django.core.exceptions import ValidationError
+        from django.test import override_settings
+        from .utils import custom_exception_handler
+        
+        config = {'CLIENT_ERROR_SAMPLE_RATE': 1.0, 'DEDUP_WINDOW': 60, 'MAX_TRACEBACKS_PER_MINUTE': 10}
+        with override_settings(ERROR_LOGGING=config):
+            with self.assertLogs('pharmacy.utils', level='WARNING') as logs:
+                response = custom_exception_handler(ValidationError('Insufficient stock.'), {})
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].levelname, 'WARNING')
+        self.assertIsNone(logs.records[0].exc_info)
+        self.assertIn('event=client_error status=400', logs.output[0])
+    
+    def test_client_errors_are_sampled(self):
+        """Test that a zero sample rate skips client error logging entirely."""
+        from django.core.exceptions import ValidationError
+        from django.test import override_settings
+        from .utils import custom_exception_handler
+        
+        config = {'CLIENT_ERROR_SAMPLE_RATE': 0.0, 'DEDUP_WINDOW': 60, 'MAX_TRACEBACKS_PER_MINUTE': 10}
+        with override_settings(ERROR_LOGGING=config):
+            with self.assertNoLogs('pharmacy.utils', level='DEBUG'):
+                custom_exception_handler(ValidationError('Insufficient stock.'), {})
+    
+    def test_handled_server_errors_are_not_sampled(self):
+        """Test that a handled 5xx API error is logged at error level despite sampling, once per window."""
+        from django.test import override_settings
+        from rest_framework.exceptions import APIException
+        from .throttling import ServiceOverloaded
+        from .utils import custom_exception_handler
+        
+        class ServiceUnavailable(APIException):
+            status_code = 503
+            default_detail = 'Try again later.'
+        
+        def raised(exc):
+            try:
+                raise exc
+            except APIException as e:
+                return e
+        
+        config = {'CLIENT_ERROR_SAMPLE_RATE': 0.0, 'DEDUP_WINDOW': 60, 'MAX_TRACEBACKS_PER_MINUTE': 10}
+        with override_settings(ERROR_LOGGING=config):
+            with self.assertLogs('pharmacy.utils', level='ERROR') as logs:
+                for _ in range(3):
+                    response = custom_exception_handler(raised(ServiceUnavailable()), {})
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('event=server_error status=503', logs.output[0])
+        
+        # Shed writes are expected under load: a deduplicated warning, not an error
+        with override_settings(ERROR_LOGGING=config):
+            with self.assertLogs('pharmacy.utils', level='WARNING') as logs:
+                for _ in range(3):
+                    custom_exception_handler(raised(ServiceOverloaded(wait=1)), {})
+        self.assertEqual([record.levelname for record in logs.records], ['WARNING'])
+        self.assertIn('type=ServiceOverloaded', logs.output[0])
+    
+    def test_server_errors_are_deduplicated(self):
+        """Test that repeated unexpected errors log one traceback and count repeats."""
+        from django.test import override_settings
+        from .utils import custom_exception_handler
+        
+        def fail():
+            raise RuntimeError('database is locked')
+        
+        config = {'CLIENT_ERROR_SAMPLE_RATE': 1.0, 'DEDUP_WINDOW': 0, 'MAX_TRACEBACKS_PER_MINUTE': 10}
+        errors = []
+        for _ in range(3):
+            try:
+                fail()
+            except RuntimeError as e:
+                errors.append(e)
+        
+        with override_settings(ERROR_LOGGING=dict(config, DEDUP_WINDOW=60)):
+            with self.assertLogs('pharmacy.utils', level='ERROR') as logs:
+                for exc in errors[:2]:
+                    response = custom_exception_handler(exc, {})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIsNotNone(logs.records[0].exc_info)
+        
+        with override_settings(ERROR_LOGGING=config):
+            with self.assertLogs('pharmacy.utils', level='ERROR') as logs:
+                custom_exception_handler(errors[2], {})
+        self.assertIn('1 similar errors suppressed', logs.output[0])
+
+
+class TemplateRenderingTest(TestCase):
+    """Test cases for static CSS extraction, fragment caching and the render benchmark."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.medicine = Medicine.objects.create(
+            name="Cached Row",
+            description="Rendered once",
+            price=Decimal("4.00"),
+            stock=20,
+            expiry_date=timezone.now().date() + timedelta(days=365)
+        )
+    
+    def test_pages_link_external_stylesheet(self):
+        """Test that pages reference the static stylesheet instead of inline CSS."""
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'css/style.css')
+        self.assertNotContains(response, '<style>')
+    
+    def test_row_fragment_refreshes_when_row_changes(self):
+        """Test that cached rows are keyed on updated_at."""
+        self.assertContains(self.client.get(reverse('medicine_list')), '<td>20</td>')
+        
+        self.medicine.stock = 35
+        self.medicine.save()
+        
+        response = self.client.get(reverse('medicine_list'))
+        self.assertContains(response, '<td>35</td>')
+        self.assertNotContains(response, '<td>20</td>')
+    
+    def test_template_benchmark_runs(self):
+        """Test that the render benchmark reports every template."""
+        from django.core.management import call_command
+        from io import StringIO
+        
+        Order.objects.create(customer_name="Bench", medicine=self.medicine, quantity=1)
+        out = StringIO()
+        call_command('benchmark', 'templates', iterations=2, stdout=out)
+        
+        self.assertIn('pharmacy/medicine_list.html', out.getvalue())
+        self.assertIn('pharmacy/order_detail.html', out.getvalue())
+
+
+class KeysetPaginationTest(FixtureTestMixin, TestCase):
+    """Test cases for keyset pagination in the template list views."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up 25 medicines and orders."""
+        cls.medicine = make_medicine("Med 00", description="Paged", price=Decimal("1.00"), stock=1000)
+        Medicine.objects.bulk_create([
+            Medicine(
+                name=f"Med {i:02d}", description="Paged", price=Decimal("1.00"),
+                stock=10, expiry_date=cls.medicine.expiry_date
+            )
+            for i in range(1, 25)
+        ])
+        make_orders(cls.medicine, *(f"Customer {i:02d}" for i in range(25)))
+    
+    def test_navigation_walks_every_row_once(self):
+        """Test that following Next links visits each medicine exactly once."""
+        seen = []
+        query = ''
+        for expected_page in (1, 2, 3):
+            response = self.client.get(reverse('medicine_list') + '?' + query)
+            page = response.context['medicines']
+            self.assertEqual(page.number, expected_page)
+            self.assertEqual(page.paginator.num_pages, 3)
+            seen.extend(m.name for m in page)
+            query = page.next_query
+        
+        self.assertFalse(page.has_next())
+        self.assertEqual(seen, [f"Med {i:02d}" for i in range(25)])
+    
+    def test_last_and_previous_links(self):
+        """Test that Last and Previous seek backwards from the end."""
+        response = self.client.get(reverse('order_list') + '?status=Pending&last=1')
+        page = response.context['orders']
+        self.assertEqual(page.number, 3)
+        self.assertFalse(page.has_next())
+        self.assertEqual(page[0].customer_name, "Customer 09")
+        self.assertIn('status=Pending', page.previous_query)
+        
+        response = self.client.get(reverse('order_list') + '?' + page.previous_query)
+        previous = response.context['orders']
+        self.assertEqual(previous.number, 2)
+        self.assertEqual(previous[-1].customer_name, "Customer 10")
+    
+    def test_deep_page_costs_same_as_first_page(self):
+        """Test that a cursor page runs the same number of queries as page 1."""
+        first = self.client.get(reverse('order_list'))
+        cursor = first.context['orders'].next_query
+        
+        with self.assertNumQueries(1):
+            self.client.get(reverse('order_list') + '?' + cursor)
+    
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        """Test that a malformed cursor is ignored."""
+        response = self.client.get(reverse('medicine_list') + '?after=not-a-cursor&page=7')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['medicines'].number, 1)
+
+
+class ConditionalGetTest(FixtureTestMixin, APITestCase):
+    """Test cases for ETag-based conditional responses."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        cls.medicine = make_medicine(
+            "Validated", description="Cached by clients", price=Decimal("6.00"), stock=40
+        )
+        cls.order, = make_orders(cls.medicine, "Revisit")
+    
+    def test_api_list_returns_304_until_catalog_changes(self):
+        """Test that an unchanged list is answered with 304."""
+        url = reverse('medicine-list')
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        etag = response['ETag']
+        self.assertIn('Accept', response['Vary'])
+        
+        response = self.client.get(url, HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('medicine-detail', args=[self.medicine.id]), {'stock': 41}, format='json'
+            )
+        response = self.client.get(url, HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_browsable_api_and_json_have_different_etags(self):
+        """Test that representations negotiated by Accept are validated separately."""
+        url = reverse('order-detail', args=[self.order.id])
+        json_response = self.client.get(url, HTTP_ACCEPT='application/json')
+        html_response = self.client.get(url, HTTP_ACCEPT='text/html')
+        
+        self.assertNotEqual(json_response['ETag'], html_response['ETag'])
+        self.assertIn('Cookie', html_response['Vary'])
+        self.assertIn('private', html_response['Cache-Control'])
+        response = self.client.get(
+            url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=json_response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+    
+    def test_order_detail_page_validators_skip_rendering(self):
+        """Test that the order page answers 304 from a single validator query."""
+        url = reverse('order_detail', args=[self.order.id])
         response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
         
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.status = 'Processing'
+            self.order.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
         self.assertEqual(response.status_code, 200)
-        self.assertContains(response, 'Detail Test')
-        self.assertContains(response, f'Order #{order.id}')
 
+
+class RenderingAndCompressionTest(FixtureTestMixin, APITestCase):
+    """Test cases for the fast JSON renderer and response compression."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        cls.medicine = make_medicine(
+            "Bulk Listed", description="Long description " * 20, price=Decimal("3.25"), stock=500
+        )
+        make_orders(cls.medicine, *(f"Customer {i}" for i in range(10)))
+    
+    def test_fast_renderer_matches_drf_output(self):
+        """Test that FastJSONRenderer is byte-identical to JSONRenderer."""
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+        from .serializers import MedicineSerializer, OrderSerializer
+        
+        data = {
+            'medicines': MedicineSerializer(Medicine.objects.all(), many=True).data,
+            'orders': OrderSerializer(Order.objects.all(), many=True).data,
+            'raw': [Decimal("1.50"), timezone.now(), timezone.now().date()],
+        }
+        fast = FastJSONRenderer()
+        self.assertEqual(fast.render(data), JSONRenderer().render(data))
+        
+        # The stdlib fallback produces the same bytes
+        fast.ensure_ascii = True
+        self.assertEqual(fast.render(data), JSONRenderer().render(data))
+    
+    def test_large_responses_are_gzipped_when_accepted(self):
+        """Test that compression is negotiated and keeps conditional GET working."""
+        import gzip
+        import json
+        url = reverse('order-list')
+        
+        plain = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        
+        response = self.client.get(url, HTTP_ACCEPT='application/json', HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), plain.json())
+        self.assertTrue(response['ETag'].startswith('W/'))
+        
+        response = self.client.get(
+            url, HTTP_ACCEPT='application/json', HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+    
+    def test_small_responses_are_not_compressed(self):
+        """Test that bodies under the size threshold are sent as-is."""
+        response = self.client.get(
+            reverse('order-detail', args=[Order.objects.first().id]),
+            HTTP_ACCEPT='application/json', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+
+
+class GenerateDatasetCommandTest(TestCase):
+    """Test cases for the generate_dataset management command."""
+    
+    def _generate(self, **options):
+        from django.core.management import call_command
+        from io import StringIO
+        out = StringIO()
+        options.setdefault('until', timezone.now())
+        call_command('generate_dataset', medicines=20, orders=600, batch_size=250,
+                     clear=True, stdout=out, **options)
+        return out.getvalue()
+    
+    def _snapshot(self):
+        return list(Order.objects.order_by('id').values_list(
+            'customer_name', 'medicine__name', 'quantity', 'order_date', 'status', 'total_price'
+        ))
+    
+    def test_same_seed_produces_same_rows(self):
+        """Test that generation is deterministic for a seed."""
+        until = timezone.now()
+        output = self._generate(seed=7, until=until)
+        self.assertIn('rows/sec', output)
+        self.assertEqual(Order.objects.count(), 600)
+        first = self._snapshot()
+        
+        self._generate(seed=7, until=until)
+        self.assertEqual(self._snapshot(), first)
+        
+        self._generate(seed=8, until=until)
+        self.assertNotEqual(self._snapshot(), first)
+    
+    def test_popularity_is_skewed_and_statuses_follow_age(self):
+        """Test Zipf-skewed medicine popularity and age-dependent statuses."""
+        from django.db.models import Count
+        self._generate(seed=1)
+        
+        counts = [row['n'] for row in Order.objects.values('medicine').annotate(n=Count('id')).order_by('-n')]
+        # Uniform popularity would give each of the 20 medicines about 30 orders
+        self.assertGreater(counts[0], 100)
+        
+        old = Order.objects.filter(order_date__lt=timezone.now() - timedelta(days=30))
+        self.assertFalse(old.filter(status__in=['Pending', 'Processing', 'Shipped']).exists())
+        for order in Order.objects.select_related('medicine')[:50]:
+            self.assertEqual(order.total_price, order.medicine.price * order.quantity)
+    
+    def test_refuses_to_mix_with_existing_data(self):
+        """Test that existing data is only replaced with --clear."""
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        self._generate(seed=1)
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', medicines=5, orders=5)
+
+
+class HotPathPerformanceTest(FixtureTestMixin, APITestCase):
+    """Query-count and time-budget guards for the hot request paths."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up a catalog of 30 medicines and 300 orders."""
+        medicines = [make_medicine(f"Hot {i:02d}", stock=1000) for i in range(30)]
+        for i, medicine in enumerate(medicines):
+            make_orders(medicine, *(f"Customer {i}-{j}" for j in range(10)))
+        cls.medicine = medicines[0]
+    
+    def test_api_lists_run_constant_queries(self):
+        """Test that list endpoints do not issue a query per row."""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('order-list'), HTTP_ACCEPT='application/json')
+        self.assertEqual(len(response.json()), 300)
+        
+        with self.assertNumQueries(1):
+            self.client.get(reverse('medicine-list'), HTTP_ACCEPT='application/json')
+    
+    def test_list_pages_run_constant_queries(self):
+        """Test that paginated pages cost the same however many rows exist."""
+        # Page query plus the row count estimate, then the cached count is reused
+        for url in (reverse('order_list'), reverse('medicine_list')):
+            with self.assertNumQueries(3):
+                self.client.get(url)
+            with self.assertNumQueries(1):
+                self.client.get(url)
+    
+    def test_order_placement_queries(self):
+        """Test the number of queries spent placing an order through the API."""
+        # A returning customer costs one lookup, a new one also an insert
+        data = {'customer_name': 'Customer 0-0', 'medicine': self.medicine.id, 'quantity': 1}
+        # Prices come from the per-process price table, loaded once
+        price_table.unit_price(self.medicine.id, 1, self.medicine.price)
+        # The order and its stock change are logged to the change feed in one INSERT
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('order-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    
+    @skipUnless(TIME_BUDGETS, 'set TEST_TIME_BUDGETS=1 to check wall-clock budgets')
+    def test_order_list_time_budget(self):
+        """Test that serializing and rendering 300 orders stays within budget."""
+        url = reverse('order-list')
+        self.client.get(url, HTTP_ACCEPT='application/json')  # Warm up
+        with self.assertTimeBudget(1.0):
+            for _ in range(5):
+                self.client.get(url, HTTP_ACCEPT='application/json')
+
+
+class AdminChangelistTest(FixtureTestMixin, TestCase):
+    """Test cases for admin changelist performance settings."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up an admin user, medicines and orders."""
+        from django.contrib.auth import get_user_model
+        cls.admin = get_user_model().objects.create_superuser('admin', password='secret')
+        cls.vitamin = make_medicine("Vitamin C 500mg")
+        cls.aspirin = make_medicine("Aspirin")
+        make_orders(cls.vitamin, *(f"Jane Doe {i}" for i in range(15)))
+        make_orders(cls.aspirin, "John Smith", "Vita Nova")
+    
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+    
+    def test_order_changelist_queries_do_not_grow_with_rows(self):
+        """Test that medicines are joined and the total is not recounted."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse('admin:pharmacy_order_changelist')
+        self.client.get(url)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 17)
+        # Session, user and one joined page query; the cached estimate replaces COUNT(*)
+        self.assertEqual(len(queries), 3)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in queries.captured_queries))
+    
+    def test_search_matches_whole_term_as_prefix(self):
+        """Test prefix search on customer names and medicine names."""
+        url = reverse('admin:pharmacy_order_changelist')
+        
+        response = self.client.get(url, {'q': 'Vitamin C'})
+        self.assertEqual(len(response.context['cl'].result_list), 15)
+        
+        response = self.client.get(url, {'q': 'vita'})
+        names = {o.customer_name for o in response.context['cl'].result_list}
+        self.assertIn("Vita Nova", names)
+        self.assertEqual(len(names), 16)
+        
+        response = self.client.get(url, {'q': 'Smith'})
+        self.assertEqual(len(response.context['cl'].result_list), 0)
+    
+    def test_prefix_search_uses_nocase_indexes(self):
+        """Test that the migrated schema keeps the prefix indexes and searches seek them."""
+        from django.contrib.admin.sites import site
+        from django.test import RequestFactory
+        request = RequestFactory().get('/')
+        for model, index in [(Medicine, 'medicine_name_prefix_idx'), (Order, 'order_customer_prefix_idx')]:
+            queryset, _ = site._registry[model].get_search_results(request, model.objects.all(), 'vit')
+            self.assertIn(f'USING INDEX {index}', queryset.explain())
+    
+    def test_medicine_autocomplete(self):
+        """Test that the order form looks medicines up by name prefix."""
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'asp', 'app_label': 'pharmacy', 'model_name': 'order', 'field_name': 'medicine',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['id'] for r in response.json()['results']], [str(self.aspirin.id)])
+
+
+class OrderArchiveTest(FixtureTestMixin, APITestCase):
+    """Test cases for the order archive and ?include_archived=."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up old closed orders, an old pending order and a recent delivered one."""
+        cls.medicine = make_medicine("Archivable")
+        old = timezone.now() - timedelta(days=400)
+        cls.delivered = make_orders(cls.medicine, "Old 1", "Old 2", "Old 3", status='Delivered')
+        cls.cancelled = make_orders(cls.medicine, "Old 4", status='Cancelled')
+        cls.pending = make_orders(cls.medicine, "Old Pending")
+        Order.objects.filter(customer_name__startswith="Old").update(order_date=old)
+        cls.recent, = make_orders(cls.medicine, "Recent", status='Delivered')
+    
+    def _archive(self, **options):
+        from django.core.management import call_command
+        from io import StringIO
+        out = StringIO()
+        call_command('archive_orders', days=180, stdout=out, **options)
+        return out.getvalue()
+    
+    def test_closed_old_orders_are_moved_in_chunks(self):
+        """Test that only old delivered/cancelled orders leave the hot table."""
+        from .models import OrderArchive
+        output = self._archive(chunk_size=3)
+        
+        self.assertIn('Archived 4 orders in 2 chunks', output)
+        self.assertEqual(
+            set(Order.objects.values_list('customer_name', flat=True)), {"Old Pending", "Recent"}
+        )
+        archived = OrderArchive.objects.get(pk=self.delivered[0].pk)
+        self.assertEqual(archived.customer_name, "Old 1")
+        self.assertEqual(archived.customer_id, self.delivered[0].customer_id)
+        self.assertEqual(archived.total_price, self.delivered[0].total_price)
+        
+        # Running again finds nothing left to move
+        self.assertIn('Archived 0 orders', self._archive())
+        self.assertEqual(OrderArchive.objects.count(), 4)
+    
+    def test_archived_orders_are_queryable_on_request(self):
+        """Test the include_archived flag on the order list and detail endpoints."""
+        self._archive()
+        order_id = self.cancelled[0].pk
+        
+        response = self.client.get(reverse('order-list'))
+        self.assertEqual(len(response.data), 2)
+        response = self.client.get(reverse('order-list'), {'include_archived': 'true'})
+        self.assertEqual(
+            [o['customer_name'] for o in response.data['results']],
+            ["Recent", "Old Pending", "Old 4", "Old 3", "Old 2", "Old 1"]
+        )
+        self.assertIsNone(response.data['next'])
+        self.assertIn('archived_at', response.data['results'][-1])
+        
+        url = reverse('order-detail', args=[order_id])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(url, {'include_archived': '1'})
+        self.assertEqual(response.data['status'], 'Cancelled')
+        
+        page = self.client.get(reverse('order_detail', args=[order_id]))
+        self.assertContains(page, 'Archived:')
+        self.assertNotContains(page, 'Update Status')
+
+    def test_customer_history_includes_archived_orders(self):
+        """Test that a customer's order history pages hot and archived orders together."""
+        from unittest import mock
+        from .views import CustomerViewSet
+        customer = self.delivered[0].customer
+        reorder, = make_orders(self.medicine, "Old 1")
+        self._archive()
+        url = reverse('customer-orders', args=[customer.pk])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [o['id'] for o in response.data['results']], [reorder.pk, self.delivered[0].pk]
+        )
+        self.assertNotIn('archived_at', response.data['results'][0])
+        self.assertEqual(response.data['results'][1]['customer'], customer.pk)
+        self.assertIn('archived_at', response.data['results'][1])
+
+        with mock.patch.object(CustomerViewSet, 'page_size', 1):
+            first = self.client.get(url)
+            second = self.client.get(first.data['next'])
+        self.assertEqual(second.data['results'][0]['id'], self.delivered[0].pk)
+        self.assertIsNone(second.data['next'])
+
+    def test_archived_and_hot_orders_interleave_across_pages(self):
+        """Test that a hot order older than archived ones is paged in date order, with filters."""
+        from unittest import mock
+        from .models import ChangeLogEntry
+        from .views import OrderViewSet
+        Order.objects.filter(pk=self.pending[0].pk).update(order_date=timezone.now() - timedelta(days=500))
+        self._archive()
+        entries = ChangeLogEntry.objects.filter(entity='order', action='deleted')
+        self.assertEqual(
+            sorted(entries.values_list('entity_id', flat=True)),
+            sorted(order.pk for order in [*self.delivered, *self.cancelled])
+        )
+        self.assertTrue(all(entry.data == {'archived': True} for entry in entries))
+        
+        names = []
+        with mock.patch.object(OrderViewSet, 'page_size', 2):
+            url = f"{reverse('order-list')}?include_archived=1"
+            while url:
+                response = self.client.get(url)
+                names += [order['customer_name'] for order in response.data['results']]
+                url = response.data['next']
+        self.assertEqual(names, ["Recent", "Old 4", "Old 3", "Old 2", "Old 1", "Old Pending"])
+        
+        def names_for(**params):
+            response = self.client.get(reverse('order-list'), {'include_archived': '1', **params})
+            return [order['customer_name'] for order in response.data['results']]
+        self.assertEqual(names_for(status='Cancelled'), ["Old 4"])
+        self.assertEqual(names_for(status='Pending'), ["Old Pending"])
+        self.assertEqual(
+            names_for(placed_before=(timezone.now() - timedelta(days=450)).isoformat()), ["Old Pending"]
+        )
+    
+    def test_medicine_with_archived_orders_cannot_be_deleted(self):
+        """Test that archived orders protect their medicine like live orders do."""
+        from django.db.models import ProtectedError
+        self._archive()
+        Order.objects.all().delete()
+        
+        with self.assertRaises(ProtectedError):
+            self.medicine.delete()
+
+
+class OrderTransitionTest(FixtureTestMixin, APITestCase):
+    """Test cases for the order status transition graph and bulk transitions."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up two medicines with orders in several states."""
+        cls.first = make_medicine("Transition A", stock=50)
+        cls.second = make_medicine("Transition B", stock=50)
+        cls.pending = make_orders(cls.first, "P1", "P2", quantity=2)
+        cls.processing = make_orders(cls.second, "R1", quantity=5, status='Processing')
+        cls.delivered = make_orders(cls.first, "D1", status='Delivered')
+    
+    def test_update_status_rejects_disallowed_transition(self):
+        """Test that final states cannot be left through the API."""
+        url = reverse('order-update-status', args=[self.delivered[0].id])
+        response = self.client.patch(url, {'status': 'Pending'}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Cannot change order status from Delivered to Pending', str(response.data))
+        self.delivered[0].refresh_from_db()
+        self.assertEqual(self.delivered[0].status, 'Delivered')
+    
+    def test_cancelling_one_order_restocks(self):
+        """Test that cancelling through update_status returns the quantity to stock."""
+        url = reverse('order-update-status', args=[self.pending[0].id])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(url, {'status': 'Cancelled'}, format='json')
+        
+        self.assertEqual(response.data, {'status': 'Cancelled'})
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.stock, 52)
+    
+    def test_bulk_transition_reports_per_id_and_aggregates_restock(self):
+        """Test one UPDATE per source state and one restock UPDATE per medicine."""
+        ids = [o.id for o in (*self.pending, *self.processing, *self.delivered)] + [999999]
+        with self.assertNumQueries(8):
+            # savepoint, locked read, 2 status updates, 2 restocks, change log, release
+            response = self.client.post(
+                reverse('order-bulk-transition'), {'ids': ids, 'status': 'Cancelled'}, format='json'
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 3)
+        results = {r['id']: (r['result'], r['previous_status']) for r in response.data['results']}
+        self.assertEqual(results[self.processing[0].id], ('updated', 'Processing'))
+        self.assertEqual(results[self.delivered[0].id], ('invalid', 'Delivered'))
+        self.assertEqual(results[999999], ('not_found', None))
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.stock, self.second.stock), (54, 55))
+        self.assertEqual(Order.objects.filter(status='Cancelled').count(), 3)
+    
+    def test_status_page_only_offers_allowed_transitions(self):
+        """Test that the HTML form lists allowed states and rejects others."""
+        url = reverse('order_update_status', args=[self.processing[0].id])
+        response = self.client.get(url)
+        self.assertNotContains(response, 'value="Pending"')
+        self.assertContains(response, 'value="Shipped"')
+        
+        response = self.client.post(url, {'status': 'Pending'})
+        self.assertContains(response, 'Cannot change order status from Processing to Pending')
+
+
+class CustomerTest(FixtureTestMixin, APITestCase):
+    """Test cases for customers and the per-customer order history."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up 55 orders for one customer and one for another."""
+        cls.medicine = make_medicine("Customer Medicine")
+        cls.orders = make_orders(cls.medicine, *(["Jane Roe"] * 55))
+        make_orders(cls.medicine, "Someone Else")
+        cls.customer = Customer.objects.get(name="Jane Roe")
+    
+    def test_spellings_of_a_name_share_one_customer(self):
+        """Test that orders are linked by case- and whitespace-insensitive name."""
+        order = Order.objects.create(customer_name="  jane   ROE ", medicine=self.medicine, quantity=1)
+        self.assertEqual(order.customer_id, self.customer.id)
+        
+        response = self.client.get(reverse('customer-list'), {'name': 'JANE roe'})
+        self.assertEqual([c['id'] for c in response.data['results']], [self.customer.id])
+    
+    def test_customer_orders_are_keyset_paginated(self):
+        """Test that order history pages cost the same queries and do not overlap."""
+        url = reverse('customer-orders', args=[self.customer.id])
+        # The customer, then one seek each on the hot and archived orders
+        with self.assertNumQueries(3):
+            first = self.client.get(url).data
+        self.assertEqual(len(first['results']), 50)
+        self.assertIsNone(first['previous'])
+        
+        with self.assertNumQueries(3):
+            second = self.client.get(first['next']).data
+        self.assertEqual(len(second['results']), 5)
+        self.assertIsNone(second['next'])
+        ids = [o['id'] for o in first['results'] + second['results']]
+        self.assertEqual(sorted(ids), sorted(o.id for o in self.orders))
+        self.assertEqual(first['results'][0]['customer'], self.customer.id)
+
+
+class ChangeFeedTest(FixtureTestMixin, TestCase):
+    """Test cases for the change log and /api/changes/."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up one medicine; creating it is the first change."""
+        cls.medicine = make_medicine("Feed Medicine", stock=5)
+    
+    def test_changes_are_logged_in_order_and_served_after_since(self):
+        """Test that writes append entries and rolled-back writes do not."""
+        from django.core.exceptions import ValidationError
+        from .models import ChangeLogEntry
+        start = ChangeLogEntry.objects.get(entity='medicine', action='created').seq
+        
+        order = Order.objects.create(customer_name="Feed Buyer", medicine=self.medicine, quantity=2)
+        with self.assertRaises(ValidationError):
+            Order.objects.create(customer_name="Too Many", medicine=self.medicine, quantity=50)
+        order.transition_to('Cancelled')
+        
+        response = self.client.get(reverse('changes'), {'since': start})
+        changes = response.json()['changes']
+        self.assertEqual(
+            [(c['entity'], c['action']) for c in changes],
+            [('order', 'created'), ('medicine', 'updated'), ('order', 'updated'), ('medicine', 'updated')]
+        )
+        self.assertEqual(changes[0]['data']['total_price'], '20.00')
+        self.assertEqual([c['data'].get('stock_delta') for c in changes[1::2]], [-2, 2])
+        self.assertEqual(response.json()['last_seq'], changes[-1]['seq'])
+        
+        response = self.client.get(reverse('changes'), {'since': changes[-1]['seq'], 'wait': '0.05'})
+        self.assertEqual(response.json()['changes'], [])
+    
+    def test_pruned_history_answers_gone(self):
+        """Test that consumers behind the retention window are told to resync."""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import ChangeLogEntry
+        self.medicine.save()
+        self.medicine.save()
+        first, second, _ = ChangeLogEntry.objects.order_by('seq')
+        ChangeLogEntry.objects.filter(seq__lte=second.seq).update(created_at=timezone.now() - timedelta(days=30))
+        call_command('prune_changes', days=7, stdout=StringIO())
+        
+        # A consumer that processed `first` never saw `second`
+        self.assertEqual(self.client.get(reverse('changes'), {'since': first.seq}).status_code, 410)
+        self.assertEqual(self.client.get(reverse('changes'), {'since': second.seq}).status_code, 200)
+        self.assertEqual(self.client.get(reverse('changes'), {'since': 'x'}).status_code, 400)
+    
+    async def test_event_stream_under_asgi(self):
+        """Test that text/event-stream clients receive change events."""
+        from django.test import AsyncClient, override_settings
+        feed = {**settings.CHANGES_FEED, 'STREAM_SECONDS': 0.05, 'POLL_INTERVAL': 0.01}
+        with override_settings(CHANGES_FEED=feed):
+            response = await AsyncClient().get(reverse('changes'), headers={'Accept': 'text/event-stream'})
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('event: change', body)
+        self.assertIn('"entity": "medicine"', body)
+
+
+class StockStreamTest(FixtureTestMixin, TestCase):
+    """Test cases for live stock updates over Server-Sent Events."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up one watched and one unwatched medicine."""
+        cls.medicine = make_medicine("Streamed", stock=20)
+        cls.other = make_medicine("Unwatched", stock=20)
+    
+    def _fast_stream(self, seconds):
+        from django.test import override_settings
+        return override_settings(CHANGES_FEED={
+            **settings.CHANGES_FEED, 'STREAM_SECONDS': seconds, 'POLL_INTERVAL': 0.01,
+        })
+    
+    async def test_stream_sends_snapshot_then_changes(self):
+        """Test that an ASGI client sees the current stock and then the new stock."""
+        import asyncio
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+        url = reverse('stock_stream')
+        
+        async def read_stream():
+            response = await AsyncClient().get(url, {'ids': str(self.medicine.id)})
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+        
+        with self._fast_stream(0.3):
+            reader = asyncio.ensure_future(read_stream())
+            await asyncio.sleep(0.05)
+            await sync_to_async(Order.objects.create)(
+                customer_name="Streamer", medicine=self.medicine, quantity=3
+            )
+            await sync_to_async(Order.objects.create)(
+                customer_name="Streamer", medicine=self.other, quantity=1
+            )
+            body = await reader
+        
+        self.assertIn('"stock": 20', body)
+        self.assertIn('"stock": 17', body)
+        self.assertNotIn(f'"id": {self.other.id},', body)
+    
+    async def test_one_poll_serves_every_subscriber(self):
+        """Test that many subscribers share the broadcaster's database reads."""
+        from asgiref.sync import sync_to_async
+        from unittest import mock
+        from .streaming import broadcaster
+        
+        stock_reads = []
+        filter_medicines = Medicine.objects.filter
+        
+        def counting_filter(*args, **kwargs):
+            if 'pk__in' in kwargs:
+                stock_reads.append(kwargs['pk__in'])
+            return filter_medicines(*args, **kwargs)
+        
+        with self._fast_stream(1), mock.patch.object(Medicine.objects, 'filter', counting_filter):
+            subscriptions = [await broadcaster.subscribe([self.medicine.id]) for _ in range(200)]
+            await sync_to_async(self.medicine.save)()
+            try:
+                received = [await s.wait(2) for s in subscriptions]
+            finally:
+                for subscription in subscriptions:
+                    broadcaster.unsubscribe(subscription)
+        
+        self.assertTrue(all(rows and rows[0]['stock'] == 20 for rows in received))
+        self.assertEqual(stock_reads, [[self.medicine.id]])
+    
+    def test_wsgi_fallback_sends_a_snapshot(self):
+        """Test that a WSGI request gets the current stock and a reconnect delay."""
+        url = reverse('stock_stream')
+        response = self.client.get(url, {'ids': f'{self.medicine.id},{self.other.id}'})
+        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertContains(response, 'retry: 30000')
+        self.assertContains(response, 'event: stock', count=2)
+        self.assertEqual(self.client.get(url, {'ids': 'a,b'}).status_code, 400)
+
+
+class ShardedStockTest(FixtureTestMixin, TestCase):
+    """Test cases for medicines whose stock is split across shard rows."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up a hot medicine with 40 units across 4 shards."""
+        cls.medicine = make_medicine("Sharded", stock=40)
+        cls.medicine.set_stock_shards(4)
+    
+    def _order(self, quantity):
+        return Order.objects.create(customer_name="Hot", medicine=self.medicine, quantity=quantity)
+    
+    def test_orders_take_from_shards_until_folded(self):
+        """Test that orders leave the Medicine row alone and compact_stock folds them."""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import StockShard
+        self._order(3)
+        self._order(2)
+        
+        self.assertEqual(Medicine.objects.get(pk=self.medicine.pk).stock, 40)
+        self.assertEqual(StockShard.exact_stock(self.medicine.pk), 35)
+        call_command('compact_stock', stdout=StringIO())
+        self.assertEqual(Medicine.objects.get(pk=self.medicine.pk).stock, 35)
+        self.assertEqual(
+            list(self.medicine.shards.values_list('stock', 'allotted')),
+            [(9, 9), (9, 9), (9, 9), (8, 8)]
+        )
+    
+    def test_order_larger_than_any_shard_is_filled_by_folding(self):
+        """Test the fallback across shards and the rejection when none is left."""
+        from django.core.exceptions import ValidationError
+        self._order(25)
+        self.assertEqual(Medicine.objects.get(pk=self.medicine.pk).stock, 15)
+        
+        with self.assertRaises(ValidationError):
+            self._order(16)
+        self._order(15)
+        self.assertEqual(Medicine.objects.get(pk=self.medicine.pk).stock, 0)
+        self.assertEqual(Order.objects.filter(medicine=self.medicine).count(), 2)
+    
+    def test_saving_stock_keeps_sold_units_and_sharding(self):
+        """Test that an edit from a stale instance subtracts units sold since the last fold."""
+        stale = Medicine.objects.get(pk=self.medicine.pk)
+        self._order(4)
+        stale.stock = 50
+        stale.save()
+        
+        self.medicine.refresh_from_db()
+        self.assertEqual((self.medicine.stock, self.medicine.stock_shards), (46, 4))
+        self.assertEqual(sum(self.medicine.shards.values_list('stock', flat=True)), 46)
+
+
+class UnitPriceMigrationTest(FixtureTestMixin, TestCase):
+    """Test cases for the unit price backfill migrations."""
+    
+    def test_backfill_keeps_cents_of_whole_number_totals(self):
+        """Test that 2 x 3.50, stored by SQLite as the integer total 7, is backfilled as 3.50."""
+        from importlib import import_module
+        from types import SimpleNamespace
+        from django.apps import apps
+        from django.db import connection
+        medicine = make_medicine("Halves", price=Decimal('3.50'))
+        order, = make_orders(medicine, "Backfilled", quantity=2)
+        thirds, = make_orders(medicine, "Thirds", quantity=3)
+        Order.objects.filter(pk=order.pk).update(unit_price=None, total_price=Decimal('7.00'))
+        Order.objects.filter(pk=thirds.pk).update(unit_price=None, total_price=Decimal('10.00'))
+        schema_editor = SimpleNamespace(connection=connection)
+        
+        import_module('pharmacy.migrations.0015_fill_unit_price').fill_orders(apps, schema_editor)
+        self.assertEqual(Order.objects.get(pk=order.pk).unit_price, Decimal('3.50'))
+        self.assertEqual(Order.objects.get(pk=thirds.pk).unit_price, Decimal('3.33'))
+        
+        # Rows filled by the old integer division are repaired by 0018
+        Order.objects.filter(pk=order.pk).update(unit_price=Decimal('3.00'))
+        import_module('pharmacy.migrations.0018_refill_unit_price').refill_orders(apps, schema_editor)
+        self.assertEqual(Order.objects.get(pk=order.pk).unit_price, Decimal('3.50'))
+
+
+class PricingTest(FixtureTestMixin, APITestCase):
+    """Test cases for price lists, quantity tiers and price snapshots."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up a medicine with a current tiered list and a future list."""
+        from .models import PriceList
+        now = timezone.now()
+        cls.medicine = make_medicine("Priced", price=Decimal('10.00'))
+        current = PriceList.objects.create(name="Current", effective_from=now - timedelta(days=1))
+        current.items.create(medicine=cls.medicine, min_quantity=1, unit_price=Decimal('9.00'))
+        current.items.create(medicine=cls.medicine, min_quantity=10, unit_price=Decimal('7.50'))
+        cls.future = PriceList.objects.create(name="Next month", effective_from=now + timedelta(days=30))
+        cls.future.items.create(medicine=cls.medicine, min_quantity=1, unit_price=Decimal('11.00'))
+    
+    def test_tiers_and_effective_dates(self):
+        """Test that the newest list in effect and the highest reached tier win."""
+        now = timezone.now()
+        other = make_medicine("Unlisted", price=Decimal('4.00'))
+        
+        self.assertEqual(price_table.unit_price(self.medicine.id, 9, self.medicine.price), Decimal('9.00'))
+        self.assertEqual(price_table.unit_price(self.medicine.id, 10, self.medicine.price), Decimal('7.50'))
+        self.assertEqual(
+            price_table.unit_price(self.medicine.id, 10, self.medicine.price, at=now + timedelta(days=31)),
+            Decimal('11.00')
+        )
+        self.assertEqual(price_table.unit_price(other.id, 50, other.price), Decimal('4.00'))
+    
+    def test_order_keeps_its_price_after_changes(self):
+        """Test that orders snapshot the unit price and the table reloads on changes."""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('order-list'), {
+                'customer_name': 'Bulk buyer', 'medicine': self.medicine.id, 'quantity': 12
+            }, format='json')
+        self.assertEqual(response.data['medicine_price'], '7.50')
+        self.assertEqual(response.data['total_price'], '90.00')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.future.effective_from = timezone.now() - timedelta(minutes=1)
+            self.future.save()
+            self.medicine.price = Decimal('20.00')
+            self.medicine.save()
+        
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual((order.unit_price, order.total_price), (Decimal('7.50'), Decimal('90.00')))
+        self.assertEqual(price_table.unit_price(self.medicine.id, 12, self.medicine.price), Decimal('11.00'))
+
+
+class StartupProfileTest(TestCase):
+    """Test cases for the lean API profile and the startup profiler."""
+    
+    def test_api_urlconf_serves_only_the_api(self):
+        """Test that the lean profile's URLconf has the API but no pages or admin."""
+        from django.urls import Resolver404, resolve
+        self.assertEqual(resolve('/api/orders/', urlconf='medicart.urls_api').url_name, 'order-list')
+        self.assertEqual(resolve('/api/changes/', urlconf='medicart.urls_api').url_name, 'changes')
+        for path in ('/', '/orders/', '/admin/'):
+            with self.assertRaises(Resolver404):
+                resolve(path, urlconf='medicart.urls_api')
+    
+    def test_parse_importtime(self):
+        """Test that -X importtime output is parsed into per-module timings."""
+        from .startup import parse_importtime
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   json.decoder\n"
+            "import time:       300 |        420 | json\n"
+            "INFO unrelated log line\n"
+        )
+        self.assertEqual(parse_importtime(output), [('json.decoder', 120, 120), ('json', 300, 420)])
+
+
+class ProfilingTest(FixtureTestMixin, APITestCase):
+    """Test cases for the sampling profiler middleware and its summary endpoint."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up a staff user."""
+        from django.contrib.auth import get_user_model
+        cls.staff = get_user_model().objects.create_user('ops', password='secret', is_staff=True)
+    
+    def setUp(self):
+        from .profiling import profiles
+        super().setUp()
+        profiles.clear()
+    
+    def test_token_request_is_sampled_per_route(self):
+        """Test that a request with the token is sampled into the summary and a folded file."""
+        import tempfile
+        from unittest import mock
+        from django.test import override_settings
+        from .views import OrderViewSet
+        original_list = OrderViewSet.list
+        
+        def slow_list(viewset, request, *args, **kwargs):
+            time.sleep(0.05)  # Releases the GIL so the sampler runs
+            return original_list(viewset, request, *args, **kwargs)
+        
+        with tempfile.TemporaryDirectory() as directory, override_settings(PROFILING={
+            **settings.PROFILING, 'TOKEN': 'let-me-in', 'INTERVAL': 0.002, 'OUTPUT_DIR': directory,
+        }), mock.patch.object(OrderViewSet, 'list', slow_list):
+            self.assertNotIn('X-Profile-Samples', self.client.get(reverse('order-list'), HTTP_X_PROFILE='wrong'))
+            response = self.client.get(reverse('order-list'), HTTP_X_PROFILE='let-me-in')
+            self.assertGreater(int(response['X-Profile-Samples']), 0)
+            
+            self.client.force_authenticate(self.staff)
+            summary = self.client.get(reverse('profiles'), {'route': 'order-list'}).data
+            folded = os.listdir(directory)
+        
+        self.assertEqual(summary['order-list']['requests'], 1)
+        self.assertTrue(any(row['function'].endswith('slow_list') for row in summary['order-list']['top']))
+        self.assertEqual(folded, [f'order-list.{os.getpid()}.folded'])
+    
+    def test_sampler_collects_stacks(self):
+        """Test that the sampler records the sampled thread's stack, with or without co_qualname."""
+        import sys
+        import threading
+        from types import SimpleNamespace
+        from .profiling import StackSampler
+        
+        def sleeping_view():
+            time.sleep(0.05)
+        
+        sampler = StackSampler(threading.get_ident(), sys._getframe(), 0.002)
+        sampler.start()
+        sleeping_view()
+        samples = sampler.stop()
+        self.assertGreater(sum(samples.values()), 0)
+        self.assertTrue(any(stack.split(';')[0].endswith('sleeping_view') for stack in samples))
+        
+        # Code objects before Python 3.11 have no co_qualname
+        frame = SimpleNamespace(
+            f_code=SimpleNamespace(co_name='list'), f_globals={'__name__': 'pharmacy.views'}, f_back=None
+        )
+        self.assertEqual(sampler._collapse(frame), 'pharmacy.views.list')
+    
+    def test_disabled_by_default_and_staff_only(self):
+        """Test that nothing is profiled without settings and only staff read profiles."""
+        response = self.client.get(reverse('order-list'), HTTP_X_PROFILE='')
+        self.assertNotIn('X-Profile-Samples', response)
+        self.assertEqual(self.client.get(reverse('profiles')).status_code, status.HTTP_403_FORBIDDEN)
+        
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.get(reverse('profiles')).data, {})
+
+
+class PlaceOrderTest(FixtureTestMixin, APITestCase):
+    """Test cases for the order-placement service shared by every entry point."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up a medicine and a returning customer."""
+        cls.medicine = make_medicine("Placed", stock=10)
+        make_orders(cls.medicine, "Regular")
+    
+    def assertPlacesWithMinimalQueries(self, place):
+        """Assert that `place` reads the medicine once and writes it once."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        price_table.unit_price(self.medicine.id, 1, self.medicine.price)
+        with CaptureQueriesContext(connection) as queries:
+            place()
+        statements = [query['sql'] for query in queries]
+        medicine = [
+            sql for sql in statements
+            if 'FROM "pharmacy_medicine"' in sql or sql.startswith('UPDATE "pharmacy_medicine"')
+        ]
+        self.assertEqual([sql.split()[0] for sql in medicine], ['SELECT', 'UPDATE'])
+        # The write is conditional on the stock still covering the order
+        self.assertIn('"stock" >= 1', medicine[1])
+        # Customer lookup, the order and change log inserts, and the savepoint pair
+        self.assertEqual(len(statements), 7, '\n'.join(statements))
+    
+    def test_every_entry_point_reads_and_writes_the_medicine_once(self):
+        """Test the statements issued by the API, the order form and the service."""
+        from .services import place_order
+        data = {'customer_name': 'Regular', 'medicine': self.medicine.id, 'quantity': 1}
+        self.assertPlacesWithMinimalQueries(lambda: self.client.post(reverse('order-list'), data, format='json'))
+        self.assertPlacesWithMinimalQueries(lambda: self.client.post(reverse('order_place'), data))
+        self.assertPlacesWithMinimalQueries(lambda: place_order('Regular', self.medicine.id, 1))
+        
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.stock, 7)
+    
+    def test_rejections_are_keyed_by_field(self):
+        """Test that stock and unknown medicines are reported against their fields, leaving no customer behind."""
+        from django.core.exceptions import ValidationError
+        from .services import place_order
+        url = reverse('order-list')
+        customers = Customer.objects.count()
+        response = self.client.post(url, {'customer_name': 'Newcomer', 'medicine': self.medicine.id, 'quantity': 11}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('quantity', response.json()['errors'])
+        
+        response = self.client.post(url, {'customer_name': 'Newcomer', 'medicine': 999, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('medicine', response.json()['errors'])
+        
+        with self.assertRaises(ValidationError) as raised:
+            place_order('Newcomer', self.medicine.id, 11)
+        self.assertIn('quantity', raised.exception.message_dict)
+        lapsed = make_medicine("Lapsed", is_expired=True, expiry_date=timezone.now().date() - timedelta(days=1))
+        with self.assertRaises(ValidationError) as raised:
+            place_order('Newcomer', lapsed.id, 1)
+        self.assertIn('medicine', raised.exception.message_dict)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Customer.objects.count(), customers)
+
+
+class MedicineFilterTest(FixtureTestMixin, APITestCase):
+    """Test cases for filtering and ordering the medicine API."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up medicines spread over price, stock and expiry date."""
+        today = timezone.now().date()
+        cls.cheap_soon = make_medicine("Cheap Soon", price=Decimal('5.00'), stock=10, expiry_date=today + timedelta(days=30))
+        cls.cheap_late = make_medicine("Cheap Late", price=Decimal('15.00'), stock=3, expiry_date=today + timedelta(days=400))
+        cls.cheap_sold_out = make_medicine("Cheap Sold Out", price=Decimal('8.00'), stock=0, expiry_date=today + timedelta(days=400))
+        cls.dear_late = make_medicine("Dear Late", price=Decimal('45.00'), stock=7, expiry_date=today + timedelta(days=400))
+        cls.after = (today + timedelta(days=90)).isoformat()
+    
+    def names(self, **params):
+        response = self.client.get(reverse('medicine-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return [row['name'] for row in response.json()]
+    
+    def test_storefront_filters_and_orderings(self):
+        """Test in-stock items under a price expiring after a date, and orderings."""
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.names(is_in_stock='true', price_max='20', expires_after=self.after),
+                ["Cheap Late"]
+            )
+        # A range orders by its column unless another filtered column is named
+        self.assertEqual(self.names(price_max='20'), ["Cheap Soon", "Cheap Sold Out", "Cheap Late"])
+        self.assertEqual(self.names(price_max='20', stock_min='1', ordering='-stock'), ["Cheap Soon", "Cheap Late"])
+        self.assertEqual(self.names(is_in_stock='false'), ["Cheap Sold Out"])
+        self.assertEqual(self.names(is_in_stock='true', ordering='-price'), ["Dear Late", "Cheap Late", "Cheap Soon"])
+        self.assertEqual(self.names(), ["Cheap Late", "Cheap Sold Out", "Cheap Soon", "Dear Late"])
+    
+    def test_unsupported_parameters_are_rejected(self):
+        """Test that unknown, malformed, inverted and unindexed combinations return 400."""
+        url = reverse('medicine-list')
+        for params, field in [
+            ({'colour': 'red'}, 'colour'),
+            ({'price_max': 'cheap'}, 'price_max'),
+            ({'price_min': '20', 'price_max': '10'}, 'price_max'),
+            ({'price_max': '20', 'ordering': 'name'}, 'ordering'),
+            ({'ordering': 'description'}, 'ordering'),
+            ({'is_in_stock': 'false', 'stock_min': '3'}, 'stock_min'),
+        ]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertIn(field, response.json()['errors'], params)
+        response = self.client.get(f'{url}?stock_min=1&stock_min=2')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_accepted_filters_seek_an_index(self):
+        """Test that every filtered query plan searches an index without sorting."""
+        from django.db import connection
+        from django.http import QueryDict
+        from .filters import MedicineFilter
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite')
+        for query in [
+            'price_min=5&price_max=20', 'expires_before=2030-01-01&ordering=-expiry_date',
+            'stock_max=3', 'is_in_stock=false',
+            f'is_in_stock=true&price_max=20&expires_after={self.after}&ordering=expiry_date',
+        ]:
+            medicine_filter = MedicineFilter(QueryDict(query))
+            self.assertTrue(medicine_filter.is_valid(), query)
+            sql, params = medicine_filter.apply(Medicine.objects.all()).query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+            self.assertRegex(plan, r'^SEARCH pharmacy_medicine USING INDEX medicine_\w+_idx', query)
+            self.assertNotIn('TEMP B-TREE', plan, query)
+
+
+class OrderFilterTest(FixtureTestMixin, APITestCase):
+    """Test cases for filtering the order API and order list page."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up orders for two medicines and three customers over two weeks."""
+        cls.aspirin = make_medicine("Aspirin")
+        cls.ibuprofen = make_medicine("Ibuprofen")
+        orders = [
+            *make_orders(cls.aspirin, "Alice Brown", "Alan Smith"),
+            *make_orders(cls.aspirin, "Alice Brown", status='Delivered'),
+            *make_orders(cls.ibuprofen, "Bob Jones"),
+        ]
+        now = timezone.now()
+        for days, order in zip([1, 2, 3, 10], orders):
+            Order.objects.filter(pk=order.pk).update(order_date=now - timedelta(days=days))
+        cls.recent, cls.alan, cls.delivered, cls.old = orders
+        cls.week_ago = (now - timedelta(days=7)).date().isoformat()
+    
+    def ids(self, **params):
+        response = self.client.get(reverse('order-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return [row['id'] for row in response.json()]
+    
+    def test_api_filters_compose_in_keyset_order(self):
+        """Test pending orders for one medicine this week, and customer prefixes."""
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.ids(status='Pending', medicine=self.aspirin.id, placed_from=self.week_ago),
+                [self.recent.id, self.alan.id]
+            )
+        self.assertEqual(self.ids(placed_before=self.week_ago), [self.old.id])
+        # Customer names match case-insensitively from the start
+        with self.assertNumQueries(2):
+            self.assertEqual(self.ids(customer_name='alice'), [self.recent.id, self.delivered.id])
+        self.assertEqual(self.ids(customer_name='AL', status='Pending'), [self.recent.id, self.alan.id])
+        self.assertEqual(self.ids(customer_name='Zed'), [])
+    
+    def test_api_rejects_bad_and_unindexed_filters(self):
+        """Test malformed filters, filtered archives and over-broad prefixes on large tables."""
+        from django.test import override_settings
+        url = reverse('order-list')
+        for params, field in [
+            ({'status': 'Lost'}, 'status'),
+            ({'placed_from': 'yesterday'}, 'placed_from'),
+            ({'ordering': 'quantity'}, 'ordering'),
+            ({'include_archived': 'true', 'medicine': '1'}, 'include_archived'),
+        ]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertIn(field, response.json()['errors'], params)
+        
+        with override_settings(ORDER_FILTERS={'MAX_PREFIX_CUSTOMERS': 1, 'GUARD_MIN_ROWS': 4}):
+            response = self.client.get(url, {'customer_name': 'Al'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('customer_name', response.json()['errors'])
+            # Narrowed by another indexed filter, the same prefix is served
+            self.assertEqual(self.ids(customer_name='Al', status='Delivered'), [self.delivered.id])
+        with override_settings(ORDER_FILTERS={'MAX_PREFIX_CUSTOMERS': 1, 'GUARD_MIN_ROWS': 5}):
+            self.assertEqual(len(self.ids(customer_name='Al')), 3)
+    
+    def test_order_list_page_filters(self):
+        """Test that the page applies the form's filters and reports bad ones."""
+        response = self.client.get(reverse('order_list'), {
+            'status': 'Pending', 'customer_name': 'al', 'medicine': '', 'placed_from': '', 'placed_before': '',
+        })
+        self.assertEqual([order.id for order in response.context['orders']], [self.recent.id, self.alan.id])
+        self.assertContains(response, 'value="al"')
+        
+        response = self.client.get(reverse('order_list'), {'medicine': 'aspirin'})
+        self.assertEqual(len(response.context['orders']), 0)
+        self.assertContains(response, 'medicine: A valid integer is required.')
+
+
+class InventoryReportTest(FixtureTestMixin, APITestCase):
+    """Test cases for the inventory valuation report."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up a staff user and a medicine in three expiry buckets, one of them sharded."""
+        from django.contrib.auth import get_user_model
+        from .services import place_order
+        cls.staff = get_user_model().objects.create_user('finance', password='secret', is_staff=True)
+        today = timezone.now().date()
+        make_medicine('Expired', price=Decimal('2.00'), stock=5, expiry_date=today - timedelta(days=1))
+        make_medicine('Soon', price=Decimal('2.50'), stock=10, expiry_date=today + timedelta(days=10))
+        cls.sharded = make_medicine('Later', price=Decimal('3.00'), stock=20, expiry_date=today + timedelta(days=400))
+        cls.sharded.set_stock_shards(4)
+        # Taken from a shard; Medicine.stock still says 20 until the next fold
+        place_order('Alice', cls.sharded.id, 2)
+    
+    def test_summary_is_one_query(self):
+        """Test that every bucket comes from a single query, with sharded stock exact."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .reports import inventory_valuation
+        with CaptureQueriesContext(connection) as queries:
+            valuation = inventory_valuation(near_expiry_days=30)
+        
+        self.assertEqual([query['sql'].split()[0] for query in queries].count('SELECT'), 1)
+        self.assertEqual(valuation['total'], {'medicines': 3, 'units': 33, 'value': '89.00'})
+        buckets = {bucket['bucket']: bucket['value'] for bucket in valuation['expiry_buckets']}
+        self.assertEqual(buckets['expired'], '10.00')
+        self.assertEqual(buckets['0-30 days'], '25.00')
+        self.assertEqual(buckets['over 365 days'], '54.00')
+        self.assertEqual(valuation['at_risk']['value'], '25.00')
+    
+    def test_cached_until_catalog_changes(self):
+        """Test that the report is served from the cache until a medicine changes."""
+        url = reverse('inventory-report')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.get(url).data['total']['value'], '89.00')
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            soon = Medicine.objects.get(name='Soon')
+            soon.stock = 0
+            soon.save()
+        self.assertEqual(self.client.get(url).data['total']['value'], '64.00')
+        self.assertEqual(
+            self.client.get(url, {'near_expiry_days': 'soon'}).status_code, status.HTTP_400_BAD_REQUEST
+        )
+    
+    def test_breakdown_is_streamed_csv(self):
+        """Test that the breakdown streams one CSV row per medicine matching the summary, from a spool."""
+        import csv
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(reverse('inventory-report'), {'breakdown': '1'})
+        self.assertTrue(response.streaming)
+        self.assertIn('filename="inventory.csv"', response['Content-Disposition'])
+        # Spooled inside the snapshot: the download itself reads nothing
+        with self.assertNumQueries(0):
+            content = b''.join(response.streaming_content)
+        rows = list(csv.DictReader(content.decode().splitlines()))
+        
+        self.assertEqual([row['name'] for row in rows], ['Expired', 'Soon', 'Later'])
+        self.assertEqual(rows[2]['units'], '18')
+        self.assertEqual(rows[2]['bucket'], 'over 365 days')
+        self.assertEqual(sum(Decimal(row['value']) for row in rows), Decimal('89.00'))
@@ -0,0 +1,242 @@
+"""
+Rate limiting and admission control for write endpoints.
+
+Two layers run before any database work is done:
+
+- A token bucket per client and endpoint scope, rejecting with 429.
+- A global limit on in-flight writes per process, shedding load with 503.
+
+Both are DRF throttles for the API viewsets, and the admission_control
+decorator applies the same limits to the template views.
+"""
+from collections import Counter
+from functools import wraps
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+from . import metrics
+import math
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Idle buckets are pruned once the table grows past this size
+MAX_BUCKETS = 10000
+
+
+class ServiceOverloaded(APIException):
+    """Raised when too many writes are already in progress."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy. Please retry shortly.'
+    default_code = 'overloaded'
+
+    def __init__(self, wait, detail=None, code=None):
+        super().__init__(detail, code)
+        self.wait = wait
+
+
+class TokenBucket:
+    """Token bucket holding up to `capacity` tokens refilled at `rate` per second."""
+
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def consume(self):
+        """Take one token. Return 0 if allowed, otherwise seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def is_idle(self, now):
+        """Return True if the bucket would be full again by now."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class AdmissionController:
+    """In-memory store for rate buckets, the write concurrency limit and rejection counts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._active_writes = 0
+        self.rejections = Counter()
+
+    @staticmethod
+    def parse_rate(rate):
+        """Parse a rate such as '20/second' into (burst, tokens per second)."""
+        num, period = rate.split('/')
+        duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+        return int(num), int(num) / duration
+
+    def consume(self, scope, ident):
+        """Charge one request to a client's bucket. Return seconds to wait, or 0."""
+        rate = settings.WRITE_ADMISSION['RATES'].get(scope)
+        if not rate:
+            return 0
+        capacity, refill = self.parse_rate(rate)
+        key = (scope, ident)
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.capacity != capacity:
+                if len(self._buckets) >= MAX_BUCKETS:
+                    self._prune()
+                bucket = self._buckets[key] = TokenBucket(capacity, refill)
+            wait = bucket.consume()
+            if wait:
+                self.rejections[(scope, 'rate_limited')] += 1
+        return wait
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [k for k, b in self._buckets.items() if b.is_idle(now)]:
+            del self._buckets[key]
+
+    def acquire_write_slot(self, scope):
+        """Reserve one of the in-flight write slots. Return False if all are taken."""
+        limit = settings.WRITE_ADMISSION['MAX_CONCURRENT_WRITES']
+        with self._lock:
+            if limit and self._active_writes >= limit:
+                self.rejections[(scope, 'overloaded')] += 1
+                return False
+            self._active_writes += 1
+            return True
+
+    def release_write_slot(self):
+        with self._lock:
+            self._active_writes = max(self._active_writes - 1, 0)
+
+    def get_rejection_counts(self):
+        """Return a snapshot of rejections keyed by (scope, reason)."""
+        with self._lock:
+            return dict(self.rejections)
+
+    def reset(self):
+        """Forget all buckets, slots and counters."""
+        with self._lock:
+            self._buckets.clear()
+            self._active_writes = 0
+            self.rejections.clear()
+
+
+admission = AdmissionController()
+
+metrics.register_collector(
+    'pharmacy_admission_rejections_total',
+    'counter',
+    'Write requests rejected before any work was done, by scope and reason.',
+    lambda: [
+        ({'scope': scope, 'reason': reason}, count)
+        for (scope, reason), count in admission.get_rejection_counts().items()
+    ],
+)
+
+
+def _hold_slot(request):
+    """Mark the underlying HttpRequest as holding a write slot."""
+    getattr(request, '_request', request)._holds_write_slot = True
+
+
+def release_write_slot(request):
+    """Release the write slot held by a request, if any."""
+    request = getattr(request, '_request', request)
+    if getattr(request, '_holds_write_slot', False):
+        request._holds_write_slot = False
+        admission.release_write_slot()
+
+
+class WriteRateThrottle(BaseThrottle):
+    """Token-bucket throttle per client for the view's `throttle_scope`."""
+
+    def allow_request(self, request, view):
+        self._wait = None
+        if request.method not in WRITE_METHODS:
+            return True
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None:
+            return True
+
+        wait = admission.consume(scope, self.get_ident(request))
+        if wait:
+            self._wait = wait
+            logger.debug(f"Rate limited {request.method} {request.path} for scope {scope}")
+            return False
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class WriteConcurrencyThrottle(BaseThrottle):
+    """Global limit on concurrent writes; sheds excess load with 503."""
+
+    def allow_request(self, request, view):
+        if request.method not in WRITE_METHODS:
+            return True
+        scope = getattr(view, 'throttle_scope', None) or 'default'
+
+        if not admission.acquire_write_slot(scope):
+            logger.debug(f"Shed {request.method} {request.path}: write concurrency limit reached")
+            raise ServiceOverloaded(wait=settings.WRITE_ADMISSION['RETRY_AFTER'])
+        _hold_slot(request)
+        return True
+
+
+class AdmissionControlMixin:
+    """
+    ViewSet mixin applying the write throttles and releasing the write
+    slot once the response is finalized.
+    """
+    throttle_classes = [WriteRateThrottle, WriteConcurrencyThrottle]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        release_write_slot(request)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def _rejection_response(status_code, wait, message):
+    response = HttpResponse(message, status=status_code, content_type='text/plain')
+    response['Retry-After'] = str(max(math.ceil(wait), 1))
+    return response
+
+
+def admission_control(scope):
+    """Decorator applying the write throttles to a template view."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in WRITE_METHODS:
+                return view_func(request, *args, **kwargs)
+
+            wait = admission.consume(scope, BaseThrottle().get_ident(request))
+            if wait:
+                return _rejection_response(
+                    429, wait, 'Too many requests. Please slow down.'
+                )
+            if not admission.acquire_write_slot(scope):
+                return _rejection_response(
+                    503,
+                    settings.WRITE_ADMISSION['RETRY_AFTER'],
+                    'Server is busy. Please retry shortly.'
+                )
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                admission.release_write_slot()
+        return wrapper
+    return decorator
@@ -4,20 +4,135 @@ Utility functions for the pharmacy application.
 from rest_framework.views import exception_handler
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from .throttling import ServiceOverloaded
+from . import metrics
+import random
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class ErrorLogLimiter:
+    """
+    Deduplicate and rate-limit traceback logging for unexpected errors.
+    
+    The first occurrence of an error signature within the dedup window is
+    logged with its traceback; repeats are counted and reported with the
+    next traceback for that signature. At most `max_per_minute` tracebacks
+    are written overall.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        """Forget all seen signatures."""
+        self._seen = {}
+        self._window_start = 0.0
+        self._logged_in_window = 0
+    
+    @staticmethod
+    def signature(exc):
+        """Identify an error by its type and the innermost frame that raised it."""
+        tb = exc.__traceback__
+        while tb is not None and tb.tb_next is not None:
+            tb = tb.tb_next
+        if tb is None:
+            return (exc.__class__.__name__, None, None)
+        return (exc.__class__.__name__, tb.tb_frame.f_code.co_filename, tb.tb_lineno)
+    
+    def should_log_traceback(self, exc):
+        """Return (log traceback?, number of repeats suppressed since last logged)."""
+        config = settings.ERROR_LOGGING
+        key = self.signature(exc)
+        now = time.monotonic()
+        
+        with self._lock:
+            if now - self._window_start >= 60:
+                self._window_start = now
+                self._logged_in_window = 0
+            
+            last_logged, suppressed = self._seen.get(key, (None, 0))
+            if last_logged is not None and now - last_logged < config['DEDUP_WINDOW']:
+                self._seen[key] = (last_logged, suppressed + 1)
+                return False, 0
+            if self._logged_in_window >= config['MAX_TRACEBACKS_PER_MINUTE']:
+                self._seen[key] = (last_logged, suppressed + 1)
+                return False, 0
+            
+            if len(self._seen) > 1000:
+                self._seen.clear()
+            self._seen[key] = (now, 0)
+            self._logged_in_window += 1
+            return True, suppressed
+
+
+error_log_limiter = ErrorLogLimiter()
+
+
+def _log_client_error(exc, status_code, view_name, method, path):
+    """Log a sampled, traceback-free event for an expected error."""
+    if random.random() >= settings.ERROR_LOGGING['CLIENT_ERROR_SAMPLE_RATE']:
+        return
+    logger.warning(
+        f"event=client_error status={status_code} type={exc.__class__.__name__} "
+        f"view={view_name} method={method} path={path} detail={str(exc)[:200]!r}"
+    )
+
+
+def _log_handled_server_error(exc, status_code, view_name, method, path):
+    """
+    Log a handled 5xx API error as a one-line event, deduplicated and
+    rate-limited by ErrorLogLimiter like unexpected errors. Shed writes
+    (ServiceOverloaded) are expected under load and already counted by
+    pharmacy_admission_rejections_total, so they are only warnings.
+    """
+    log_event, suppressed = error_log_limiter.should_log_traceback(exc)
+    if not log_event:
+        return
+    
+    level = logging.WARNING if isinstance(exc, ServiceOverloaded) else logging.ERROR
+    message = (
+        f"event=server_error status={status_code} type={exc.__class__.__name__} "
+        f"view={view_name} method={method} path={path} detail={str(exc)[:200]!r}"
+    )
+    if suppressed:
+        message += f" suppressed={suppressed}"
+    logger.log(level, message)
+
+
+def _log_server_error(exc, view_name, method, path):
+    """Log an unexpected error with its traceback, deduplicated and rate-limited."""
+    log_traceback, suppressed = error_log_limiter.should_log_traceback(exc)
+    if not log_traceback:
+        return
+    
+    message = f"Exception in {view_name} ({method} {path}): {str(exc)}"
+    if suppressed:
+        message += f" ({suppressed} similar errors suppressed)"
+    logger.error(message, exc_info=exc)
+
+
 def custom_exception_handler(exc, context):
     """
     Custom exception handler for REST Framework.
     Provides consistent error responses with logging.
+    
+    Expected client errors (validation failures and other handled 4xx API
+    errors) are logged as sampled one-line events; handled 5xx API errors
+    as one-line errors and unexpected errors with full tracebacks, both
+    deduplicated and rate-limited by ErrorLogLimiter.
     """
     # Call REST framework's default exception handler first
     response = exception_handler(exc, context)
     
+    metrics.exceptions.inc(type=exc.__class__.__name__)
+    
     # Log the exception
     view = context.get('view', None)
     request = context.get('request', None)
@@ -34,10 +149,14 @@ def custom_exception_handler(exc, context):
         method = 'Unknown'
         path = 'Unknown'
     
-    logger.error(
-        f"Exception in {view_name} ({method} {path}): {str(exc)}",
-        exc_info=True
-    )
+    if isinstance(exc, ValidationError):
+        _log_client_error(exc, status.HTTP_400_BAD_REQUEST, view_name, method, path)
+    elif response is not None and response.status_code >= 500:
+        _log_handled_server_error(exc, response.status_code, view_name, method, path)
+    elif response is not None:
+        _log_client_error(exc, response.status_code, view_name, method, path)
+    else:
+        _log_server_error(exc, view_name, method, path)
     
     # Handle Django ValidationError
     if isinstance(exc, ValidationError):
@@ -2,30 +2,46 @@
 Views for the MediCart pharmacy application.
 """
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.core.paginator import Paginator
-from .models import Medicine, Order
+from django.core.exceptions import ValidationError
+from .models import Customer, Medicine, Order, OrderArchive, TransitionConflict
+from .filters import MedicineFilter, OrderFilter
+from .pagination import KeysetPaginator, MergedKeysetPaginator
+from .cache import MEDICINES_VERSION, ORDERS_VERSION
+from .conditional import ConditionalGetMixin, conditional_page, version_etag
 from .serializers import (
+    CustomerSerializer,
     MedicineSerializer,
     OrderSerializer,
-    OrderStatusUpdateSerializer
+    OrderArchiveSerializer,
+    OrderStatusUpdateSerializer,
+    BulkTransitionSerializer
 )
+from .throttling import AdmissionControlMixin, admission_control
+from .services import place_order
+from . import metrics, profiling, reports
+import csv
+import io
 import logging
+import tempfile
 
 logger = logging.getLogger(__name__)
 
 
 # ==================== API Views ====================
 
-class MedicineViewSet(viewsets.ModelViewSet):
+class MedicineViewSet(AdmissionControlMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """
     API ViewSet for Medicine CRUD operations.
     
     Provides:
-    - list: Get all medicines
+    - list: Get all medicines, filtered and ordered by MedicineFilter
     - retrieve: Get a specific medicine
     - create: Add a new medicine
     - update: Update a medicine
@@ -34,12 +50,34 @@ class MedicineViewSet(viewsets.ModelViewSet):
     """
     queryset = Medicine.objects.all()
     serializer_class = MedicineSerializer
+    throttle_scope = 'medicines'
+    list_versions = (MEDICINES_VERSION,)
+    
+    def get_object_validators(self, pk):
+        """Derive the ETag from the row version without loading the medicine."""
+        row = _first_row(Medicine.objects.filter(pk=pk), pk, 'version', 'updated_at')
+        if row is None:
+            return None, None
+        version, updated_at = row
+        return f'medicine.{pk}.{version}', updated_at
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = self.filter.apply(queryset)
+        return queryset
     
     def list(self, request, *args, **kwargs):
-        """List all medicines with logging."""
+        """List medicines matching the query parameters, with logging."""
+        # Rejected before the ETag check, so a bad query never gets a 304
+        self.filter = MedicineFilter(request.query_params)
+        self.filter.is_valid(raise_exception=True)
         logger.info("Fetching all medicines")
         response = super().list(request, *args, **kwargs)
-        logger.info(f"Retrieved {len(response.data)} medicines")
+        if response.status_code == status.HTTP_304_NOT_MODIFIED:
+            logger.info("Medicines unchanged, returning 304")
+        else:
+            logger.info(f"Retrieved {len(response.data)} medicines")
         return response
     
     def retrieve(self, request, *args, **kwargs):
@@ -87,32 +125,87 @@ class MedicineViewSet(viewsets.ModelViewSet):
             raise
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(AdmissionControlMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """
     API ViewSet for Order CRUD operations.
     
     Provides:
-    - list: Get all orders
+    - list: Get all orders, filtered by OrderFilter
     - retrieve: Get a specific order
     - create: Place a new order
     - update: Update an order
     - partial_update: Partially update an order
     - destroy: Delete an order
     - update_status: Custom action to update order status
+    - bulk_transition: Custom action to move many orders to one status
+    
+    list and retrieve also cover archived orders with ?include_archived=true;
+    that list is keyset paginated.
     """
     queryset = Order.objects.all().select_related('medicine')
     serializer_class = OrderSerializer
+    throttle_scope = 'orders'
+    # Orders per page of the list with archived orders
+    page_size = 50
+    # Orders embed the medicine name and price
+    list_versions = (ORDERS_VERSION, MEDICINES_VERSION)
+    
+    def get_object_validators(self, pk):
+        """Derive the ETag from the order and medicine timestamps."""
+        return _order_validators(pk)
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = self.filter.apply(queryset)
+        return queryset
     
     def list(self, request, *args, **kwargs):
-        """List all orders with logging."""
+        """List orders matching the query parameters, newest first, with logging."""
+        # Rejected before the ETag check, so a bad query never gets a 304
+        self.filter = OrderFilter(request.query_params)
+        self.filter.is_valid(raise_exception=True)
         logger.info("Fetching all orders")
-        response = super().list(request, *args, **kwargs)
-        logger.info(f"Retrieved {len(response.data)} orders")
+        if self.filter.validated_data.get('include_archived'):
+            response = self._conditional(
+                request, version_etag(*self.list_versions), None, lambda: self._list_with_archive(request)
+            )
+        else:
+            response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_304_NOT_MODIFIED:
+            logger.info("Orders unchanged, returning 304")
+        elif isinstance(response.data, dict):
+            logger.info(f"Retrieved {len(response.data['results'])} hot and archived orders")
+        else:
+            logger.info(f"Retrieved {len(response.data)} orders")
         return response
     
+    def _list_with_archive(self, request):
+        """
+        One keyset page of hot and archived orders, newest first. Old pending
+        orders stay hot while newer closed ones are archived, so the two
+        tables interleave; each is read from its (order_date, id) index.
+        """
+        archived = self.filter.apply_archive(OrderArchive.objects.all()).prefetch_related('medicine')
+        paginator = MergedKeysetPaginator(
+            [self.get_queryset(), archived], self.page_size, ['-order_date', '-id'],
+            params=self.filter.initial_data
+        )
+        page = paginator.get_page(request.query_params)
+        return _page_response(request, page, [
+            OrderArchiveSerializer(order).data if isinstance(order, OrderArchive)
+            else self.get_serializer(order).data
+            for order in page.object_list
+        ])
+    
     def retrieve(self, request, *args, **kwargs):
         """Retrieve a specific order with logging."""
-        logger.info(f"Fetching order with ID: {kwargs.get('pk')}")
+        pk = kwargs.get('pk')
+        logger.info(f"Fetching order with ID: {pk}")
+        if _include_archived(request):
+            archived = _archived_order(pk)
+            if archived is not None:
+                return Response(OrderArchiveSerializer(archived).data)
         return super().retrieve(request, *args, **kwargs)
     
     def create(self, request, *args, **kwargs):
@@ -158,8 +251,144 @@ class OrderViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+    @action(detail=False, methods=['post'], serializer_class=BulkTransitionSerializer)
+    def bulk_transition(self, request):
+        """
+        Move many orders to one status, following the transition graph.
+        URL: /api/orders/bulk_transition/
+        
+        Orders that cannot make the transition are reported per id and left
+        unchanged; the others are moved together in one transaction.
+        """
+        serializer = BulkTransitionSerializer(data=request.data)
+        if not serializer.is_valid():
+            logger.warning(f"Invalid bulk transition request: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        new_status = serializer.validated_data['status']
+        try:
+            results = Order.bulk_transition(serializer.validated_data['ids'], new_status)
+        except TransitionConflict as e:
+            logger.warning(f"Bulk transition to {new_status} conflicted: {e}")
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        
+        updated = sum(1 for result, _ in results.values() if result == 'updated')
+        logger.info(f"Bulk transition to {new_status}: {updated} of {len(results)} orders updated")
+        return Response({
+            'status': new_status,
+            'updated': updated,
+            'results': [
+                {'id': pk, 'result': result, 'previous_status': previous}
+                for pk, (result, previous) in results.items()
+            ],
+        })
+
+
+class CustomerViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only API for customers and their order history.
+    
+    Provides:
+    - list: Customers by name, keyset paginated; ?name= finds one customer
+    - retrieve: Get a specific customer
+    - orders: The customer's orders, newest first, keyset paginated
+    
+    Customers are created from the customer name when an order is placed.
+    """
+    queryset = Customer.objects.all()
+    serializer_class = CustomerSerializer
+    page_size = 50
+    
+    def list(self, request, *args, **kwargs):
+        """List customers, optionally the one matching ?name= in any spelling."""
+        customers = self.get_queryset()
+        name = request.query_params.get('name')
+        if name:
+            customers = customers.filter(name_key=Customer.normalize_name(name))
+        return _keyset_response(
+            request, customers, ['name', 'id'], CustomerSerializer, self.page_size,
+            params={'name': name}
+        )
+    
+    @action(detail=True, methods=['get'], serializer_class=OrderSerializer)
+    def orders(self, request, pk=None):
+        """
+        The customer's orders, hot and archived, newest first.
+        URL: /api/customers/{id}/orders/
+        
+        Each page is one seek per table on its (customer, order_date, id)
+        index, merged as in OrderViewSet._list_with_archive.
+        """
+        customer = self.get_object()
+        orders = Order.objects.filter(customer=customer).select_related('medicine')
+        archived = OrderArchive.objects.filter(customer_id=customer.pk).prefetch_related('medicine')
+        logger.info(f"Fetching orders for customer {customer.pk}")
+        paginator = MergedKeysetPaginator([orders, archived], self.page_size, ['-order_date', '-id'])
+        page = paginator.get_page(request.query_params)
+        return _page_response(request, page, [
+            OrderArchiveSerializer(order).data if isinstance(order, OrderArchive)
+            else OrderSerializer(order).data
+            for order in page.object_list
+        ])
+
+
+def _keyset_response(request, queryset, ordering, serializer_class, per_page, params=None):
+    """Serialize one keyset page with links to its neighbours, as the API returns it."""
+    paginator = KeysetPaginator(queryset, per_page, ordering, params=params)
+    page = paginator.get_page(request.query_params)
+    return _page_response(request, page, serializer_class(page.object_list, many=True).data)
+
+
+def _page_response(request, page, results):
+    """The API envelope of a keyset page: links to its neighbours and the serialized rows."""
+    return Response({
+        'next': request.build_absolute_uri(f'?{page.next_query}') if page.has_next() else None,
+        'previous': request.build_absolute_uri(f'?{page.previous_query}') if page.has_previous() else None,
+        'results': results,
+    })
+
+
+def _first_row(queryset, pk, *fields):
+    """Return selected columns of the row with primary key `pk`, or None."""
+    try:
+        int(pk)
+    except (TypeError, ValueError):
+        return None
+    return queryset.values_list(*fields).first()
+
+
+def _include_archived(request):
+    """Whether the request opted into archived orders with ?include_archived=."""
+    return request.GET.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+
+def _archived_order(pk):
+    """Return the archived order with id `pk` if it is no longer in the hot table."""
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    if Order.objects.filter(pk=pk).exists():
+        return None
+    return OrderArchive.objects.filter(pk=pk).first()
+
+
+def _order_validators(pk):
+    """Return (etag, last_modified) for an order and the medicine it shows."""
+    row = _first_row(
+        Order.objects.filter(pk=pk), pk,
+        'updated_at', 'medicine__version', 'medicine__updated_at'
+    )
+    if row is None:
+        return None, None
+    updated_at, medicine_version, medicine_updated_at = row
+    etag = f'order.{pk}.{updated_at.timestamp()}.{medicine_version}'
+    return etag, max(updated_at, medicine_updated_at)
+
+
 # ==================== Template Views ====================
 
+@conditional_page(lambda request: (version_etag(MEDICINES_VERSION, ORDERS_VERSION), None))
 def home(request):
     """Home page view."""
     medicine_count = Medicine.objects.count()
@@ -176,14 +405,14 @@ def home(request):
     return render(request, 'pharmacy/home.html', context)
 
 
+@conditional_page(lambda request: (version_etag(MEDICINES_VERSION), None))
 def medicine_list(request):
     """View to display list of all medicines."""
     medicines = Medicine.objects.all()
     
-    # Pagination
-    paginator = Paginator(medicines, 10)  # Show 10 medicines per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset pagination: every page is an index seek on the unique name
+    paginator = KeysetPaginator(medicines, 10, ['name'])  # Show 10 medicines per page
+    page_obj = paginator.get_page(request.GET)
     
     context = {
         'medicines': page_obj,
@@ -191,6 +420,7 @@ def medicine_list(request):
     return render(request, 'pharmacy/medicine_list.html', context)
 
 
+@admission_control('medicines')
 def medicine_add(request):
     """View to add a new medicine."""
     if request.method == 'POST':
@@ -267,45 +497,46 @@ def medicine_delete(request, pk):
     return render(request, 'pharmacy/medicine_delete.html', context)
 
 
+@conditional_page(lambda request: (version_etag(ORDERS_VERSION, MEDICINES_VERSION), None))
 def order_list(request):
     """View to display list of all orders."""
     orders = Order.objects.all().select_related('medicine')
     
-    # Filter by status if provided
-    status_filter = request.GET.get('status')
-    if status_filter:
-        orders = orders.filter(status=status_filter)
+    # Filter by status, medicine, customer and date (see OrderFilter)
+    order_filter = OrderFilter(request.GET)
+    if order_filter.is_valid():
+        orders = order_filter.apply(orders)
+    else:
+        for name, errors in order_filter.errors.items():
+            messages.error(request, f'{name}: {errors[0]}')
+        orders = orders.none()
     
-    # Pagination
-    paginator = Paginator(orders, 10)  # Show 10 orders per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset pagination on (order_date, id), keeping the filters in links
+    paginator = KeysetPaginator(
+        orders, 10, ['-order_date', '-id'], params=order_filter.initial_data
+    )  # Show 10 orders per page
+    page_obj = paginator.get_page(request.GET)
     
     context = {
         'orders': page_obj,
         'status_choices': Order.STATUS_CHOICES,
-        'current_status': status_filter,
+        'filters': order_filter.initial_data,
     }
     return render(request, 'pharmacy/order_list.html', context)
 
 
+@admission_control('orders')
 def order_place(request):
     """View to place a new order."""
-    medicines = Medicine.objects.filter(stock__gt=0)
+    medicines = Medicine.objects.filter(stock__gt=0, is_expired=False)
     
     if request.method == 'POST':
         try:
-            medicine_id = request.POST.get('medicine')
-            medicine = get_object_or_404(Medicine, pk=medicine_id)
-            quantity = int(request.POST.get('quantity'))
-            
-            # Create order
-            order = Order(
-                customer_name=request.POST.get('customer_name'),
-                medicine=medicine,
-                quantity=quantity
+            order = place_order(
+                request.POST.get('customer_name'),
+                int(request.POST.get('medicine')),
+                int(request.POST.get('quantity'))
             )
-            order.save()
             
             logger.info(f"Order placed via template: Order #{order.id}")
             messages.success(
@@ -314,6 +545,9 @@ def order_place(request):
             )
             return redirect('order_list')
         
+        except ValidationError as e:
+            logger.warning(f"Rejected order via template: {e.messages[0]}")
+            messages.error(request, f'Error placing order: {e.messages[0]}')
         except Exception as e:
             logger.error(f"Error placing order via template: {str(e)}")
             messages.error(request, f'Error placing order: {str(e)}')
@@ -322,34 +556,131 @@ def order_place(request):
     return render(request, 'pharmacy/order_place.html', context)
 
 
+@conditional_page(lambda request, pk: _order_validators(pk))
 def order_detail(request, pk):
     """View to display order details."""
-    order = get_object_or_404(Order, pk=pk)
-    context = {'order': order}
+    order = Order.objects.select_related('medicine').filter(pk=pk).first()
+    archived = False
+    if order is None:
+        # Links to orders that have since been archived keep working
+        order = _archived_order(pk)
+        if order is None:
+            raise Http404('No order matches the given query.')
+        archived = True
+    context = {'order': order, 'archived': archived}
     return render(request, 'pharmacy/order_detail.html', context)
 
 
 def order_update_status(request, pk):
     """View to update order status."""
-    order = get_object_or_404(Order, pk=pk)
+    order = get_object_or_404(Order.objects.select_related('medicine'), pk=pk)
     
     if request.method == 'POST':
+        new_status = request.POST.get('status')
         try:
-            new_status = request.POST.get('status')
-            order.status = new_status
-            order.save()
+            if new_status != order.status:
+                order.transition_to(new_status)
             
             logger.info(f"Order status updated via template: Order #{order.id} -> {new_status}")
             messages.success(request, f'Order status updated to "{new_status}"!')
             return redirect('order_detail', pk=pk)
         
+        except ValidationError as e:
+            logger.warning(f"Rejected order status update via template: {e.messages[0]}")
+            messages.error(request, e.messages[0])
         except Exception as e:
             logger.error(f"Error updating order status via template: {str(e)}")
             messages.error(request, f'Error updating order status: {str(e)}')
     
     context = {
         'order': order,
-        'status_choices': Order.STATUS_CHOICES,
+        # The current status and the statuses it may move to
+        'status_choices': [
+            (key, label) for key, label in Order.STATUS_CHOICES
+            if key == order.status or order.can_transition_to(key)
+        ],
     }
     return render(request, 'pharmacy/order_update_status.html', context)
 
+
+
+# ==================== Monitoring Views ====================
+
+def metrics_view(request):
+    """Expose process metrics in the Prometheus text format."""
+    return HttpResponse(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def profiles_view(request):
+    """
+    Request profiles sampled by ProfilingMiddleware in this process.
+    
+    GET returns the hottest functions per route name (?route=order-list,
+    ?top=20), or with ?collapsed=1 the raw samples in collapsed-stack format
+    for flamegraph tools. DELETE discards the samples.
+    """
+    if request.method == 'DELETE':
+        profiling.profiles.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    route = request.query_params.get('route') or None
+    if request.query_params.get('collapsed'):
+        return HttpResponse(profiling.profiles.collapsed(route), content_type='text/plain; charset=utf-8')
+    try:
+        top = min(max(int(request.query_params.get('top', 20)), 1), 100)
+    except ValueError:
+        return Response({'detail': 'top must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(profiling.profiles.summary(top, route))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def inventory_report_view(request):
+    """
+    Inventory valuation: total value, value per expiry bucket and value at
+    risk from stock expiring within ?near_expiry_days= days.
+    
+    With ?breakdown=1 the per-medicine rows are streamed as CSV instead,
+    read from one snapshot of the catalog however long the download takes.
+    """
+    try:
+        near_expiry_days = int(request.query_params.get('near_expiry_days', settings.REPORTS['NEAR_EXPIRY_DAYS']))
+    except ValueError:
+        return Response({'detail': 'near_expiry_days must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 <= near_expiry_days <= 3650:
+        return Response({'detail': 'near_expiry_days must be between 0 and 3650.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    if request.query_params.get('breakdown'):
+        return FileResponse(
+            _breakdown_csv(), as_attachment=True, filename='inventory.csv',
+            content_type='text/csv; charset=utf-8'
+        )
+    return Response(reports.inventory_valuation(near_expiry_days))
+
+
+def _breakdown_csv():
+    """
+    The breakdown spooled to a temporary file, rewound. Rows are read from
+    one snapshot that is closed before the download starts, so a slow
+    client never holds a read transaction open against writers.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.REPORTS['BREAKDOWN_SPOOL_SIZE'])
+    text = io.TextIOWrapper(spool, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    try:
+        with reports.snapshot():
+            writer.writerow(reports.BREAKDOWN_COLUMNS)
+            writer.writerows(reports.valuation_rows())
+        text.flush()
+    except BaseException:
+        text.close()
+        raise
+    text.detach()
+    spool.seek(0)
+    return spool